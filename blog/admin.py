@@ -3,7 +3,11 @@ from django.utils.html import format_html
 from django.urls import reverse
 from django.db.models import Count
 from django.utils import timezone
-from .models import Post, Category, Comment, Newsletter, PostView, SavedPost
+from .models import SENTIMENT_THRESHOLD, Post, Category, Comment, Newsletter, PostView, PostViewRollup, RebuildJob, SavedPost
+from .analytics import rolled_up_views, update_comment_counts
+from .cache import invalidate_posts
+from .context_processors import invalidate_sidebar
+from .jobs import enqueue_post_rebuild
 from taggit.models import Tag
 from taggit.admin import TagAdmin as BaseTagAdmin
 
@@ -49,30 +53,34 @@ class PostAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
         ('Statistics', {
-            'fields': ('views_count',),
+            'fields': ('views_count', 'approved_comment_count', 'word_count', 'reading_time', 'sentiment'),
             'classes': ('collapse',)
         })
     )
     
-    readonly_fields = ('created_at', 'updated_at', 'views_count')
+    readonly_fields = ('created_at', 'updated_at', 'views_count', 'approved_comment_count', 'word_count', 'reading_time', 'sentiment')
     actions = ['make_published', 'make_draft', 'reset_views_count']
     
     def get_queryset(self, request):
-        return super().get_queryset(request).prefetch_related('tags')
+        return super().get_queryset(request).prefetch_related('tags').defer('content_text').annotate(
+            rolled_up_views=rolled_up_views()
+        )
     
     def tag_list(self, obj):
         return ", ".join(o.name for o in obj.tags.all())
     tag_list.short_description = 'Tags'
     
     def view_count(self, obj):
-        count = obj.post_views.count()
-        url = reverse('admin:blog_postview_changelist') + f'?post__id__exact={obj.id}'
+        count = obj.rolled_up_views or 0
+        url = reverse('admin:blog_postviewrollup_changelist') + f'?post__id__exact={obj.id}'
         return format_html('<a href="{}">{} views</a>', url, count)
     view_count.short_description = 'Views'
+    view_count.admin_order_field = 'rolled_up_views'
     
     def reading_time_display(self, obj):
         return f"{obj.reading_time} min read"
     reading_time_display.short_description = 'Reading Time'
+    reading_time_display.admin_order_field = 'reading_time'
     
     def image_preview(self, obj):
         if obj.image:
@@ -81,16 +89,28 @@ class PostAdmin(admin.ModelAdmin):
     image_preview.short_description = 'Preview'
     
     def make_published(self, request, queryset):
-        queryset.update(status=Post.ACTIVE, published_at=timezone.now())
+        post_ids = list(queryset.values_list('pk', flat=True))
+        # update() skips auto_now, and the sitemap dates posts by updated_at
+        now = timezone.now()
+        queryset.update(status=Post.ACTIVE, published_at=now, updated_at=now)
+        invalidate_posts(post_ids)
+        invalidate_sidebar()
+        enqueue_post_rebuild(post_ids, related=True)
     make_published.short_description = "Mark selected posts as published"
     
     def make_draft(self, request, queryset):
-        queryset.update(status=Post.DRAFT, published_at=None)
+        post_ids = list(queryset.values_list('pk', flat=True))
+        queryset.update(status=Post.DRAFT, published_at=None, updated_at=timezone.now())
+        invalidate_posts(post_ids)
+        invalidate_sidebar()
+        enqueue_post_rebuild(post_ids, related=True)
     make_draft.short_description = "Mark selected posts as draft"
     
     def reset_views_count(self, request, queryset):
         queryset.update(views_count=0)
         PostView.objects.filter(post__in=queryset).delete()
+        PostViewRollup.objects.filter(post__in=queryset).delete()
+        invalidate_posts(queryset.values_list('pk', flat=True))
     reset_views_count.short_description = "Reset view count"
     
     class Media:
@@ -98,10 +118,34 @@ class PostAdmin(admin.ModelAdmin):
             'all': ['https://cdnjs.cloudflare.com/ajax/libs/font-awesome/5.15.4/css/all.min.css']
         }
 
+class SentimentFilter(admin.SimpleListFilter):
+    """Filter comments by scored sentiment, to review negative ones first."""
+    title = 'sentiment'
+    parameter_name = 'sentiment'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('negative', 'Negative'),
+            ('neutral', 'Neutral'),
+            ('positive', 'Positive'),
+            ('unscored', 'Not scored yet'),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() == 'negative':
+            return queryset.filter(sentiment__lt=-SENTIMENT_THRESHOLD)
+        if self.value() == 'neutral':
+            return queryset.filter(sentiment__gte=-SENTIMENT_THRESHOLD, sentiment__lte=SENTIMENT_THRESHOLD)
+        if self.value() == 'positive':
+            return queryset.filter(sentiment__gt=SENTIMENT_THRESHOLD)
+        if self.value() == 'unscored':
+            return queryset.filter(sentiment__isnull=True)
+        return queryset
+
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
-    list_display = ('post', 'name', 'email', 'created_at', 'is_approved', 'content_preview')
-    list_filter = ('is_approved', 'created_at')
+    list_display = ('post', 'name', 'email', 'created_at', 'is_approved', 'sentiment_display', 'content_preview')
+    list_filter = ('is_approved', SentimentFilter, 'created_at')
     search_fields = ('name', 'email', 'contents', 'post__title')
     date_hierarchy = 'created_at'
     list_per_page = 50
@@ -113,12 +157,25 @@ class CommentAdmin(admin.ModelAdmin):
         return obj.contents[:100] + '...' if len(obj.contents) > 100 else obj.contents
     content_preview.short_description = 'Comment Preview'
     
+    def sentiment_display(self, obj):
+        return obj.sentiment_label or '-'
+    sentiment_display.short_description = 'Sentiment'
+    sentiment_display.admin_order_field = 'sentiment'
+    
     def approve_comments(self, request, queryset):
+        post_ids = set(queryset.values_list('post_id', flat=True))
         queryset.update(is_approved=True)
+        update_comment_counts(post_ids)
+        invalidate_posts(post_ids)
+        enqueue_post_rebuild(post_ids, sitemap=False)
     approve_comments.short_description = "Approve selected comments"
     
     def unapprove_comments(self, request, queryset):
+        post_ids = set(queryset.values_list('post_id', flat=True))
         queryset.update(is_approved=False)
+        update_comment_counts(post_ids)
+        invalidate_posts(post_ids)
+        enqueue_post_rebuild(post_ids, sitemap=False)
     unapprove_comments.short_description = "Unapprove selected comments"
 
 @admin.register(Newsletter)
@@ -148,6 +205,37 @@ class PostViewAdmin(admin.ModelAdmin):
     def has_change_permission(self, request, obj=None):
         return False
 
+@admin.register(PostViewRollup)
+class PostViewRollupAdmin(admin.ModelAdmin):
+    list_display = ('post', 'period', 'bucket', 'views')
+    list_filter = ('period', 'bucket', 'post')
+    search_fields = ('post__title',)
+    date_hierarchy = 'bucket'
+    list_per_page = 100
+    list_select_related = ('post',)
+    readonly_fields = ('post', 'period', 'bucket', 'views')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(RebuildJob)
+class RebuildJobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'key', 'enqueued_at', 'locked_until', 'attempts')
+    list_filter = ('kind', 'attempts')
+    search_fields = ('key', 'last_error')
+    readonly_fields = ('kind', 'key', 'enqueued_at', 'locked_until', 'attempts', 'last_error')
+    actions = ['retry_jobs']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def retry_jobs(self, request, queryset):
+        queryset.update(attempts=0, locked_until=None)
+    retry_jobs.short_description = "Retry selected jobs now"
+
 @admin.register(SavedPost)
 class SavedPostAdmin(admin.ModelAdmin):
     list_display = ('post', 'ip_address', 'created_at')
@@ -0,0 +1,155 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncDay, TruncHour
+from django.utils import timezone
+
+from .cache import POPULAR_POSTS, invalidate, shared_cache
+from .models import Comment, Post, PostView, PostViewRollup, RollupWatermark
+
+WATERMARK_NAME = 'post_views'
+
+TRUNC_FUNCTIONS = {
+    PostViewRollup.HOUR: TruncHour,
+    PostViewRollup.DAY: TruncDay,
+}
+
+
+def merge_rollups(period, counts):
+    """Add {(post_id, bucket): views} onto the stored rollups of one period."""
+    if not counts:
+        return
+    existing = {
+        (rollup.post_id, rollup.bucket): rollup
+        for rollup in PostViewRollup.objects.filter(
+            period=period,
+            post_id__in={post_id for post_id, _ in counts},
+            bucket__in={bucket for _, bucket in counts},
+        )
+    }
+    to_update, to_create = [], []
+    for (post_id, bucket), views in counts.items():
+        rollup = existing.get((post_id, bucket))
+        if rollup:
+            rollup.views += views
+            to_update.append(rollup)
+        else:
+            to_create.append(PostViewRollup(post_id=post_id, period=period, bucket=bucket, views=views))
+    PostViewRollup.objects.bulk_update(to_update, ['views'], batch_size=500)
+    PostViewRollup.objects.bulk_create(to_create, batch_size=500)
+
+
+def rollup_post_views(batch_size=10000, lag=None):
+    """
+    Fold raw PostView rows created since the watermark into hourly and daily
+    rollups. Returns the number of raw rows processed.
+
+    Rows are taken by creation time, up to ``lag`` seconds ago
+    (POST_VIEW_ROLLUP_LAG): a flush that was still committing when the
+    watermark moved would otherwise be skipped for good, as its rows can
+    be older than ones already counted.
+    """
+    lag = settings.POST_VIEW_ROLLUP_LAG if lag is None else lag
+    until = timezone.now() - timedelta(seconds=lag)
+    processed = 0
+    while True:
+        with transaction.atomic():
+            watermark, _ = RollupWatermark.objects.get_or_create(name=WATERMARK_NAME)
+            # Lock the watermark so concurrent runs don't count rows twice
+            watermark = RollupWatermark.objects.select_for_update().get(pk=watermark.pk)
+
+            pending = PostView.objects.filter(created_at__lte=until)
+            if watermark.rolled_up_to is not None:
+                pending = pending.filter(created_at__gt=watermark.rolled_up_to)
+            times = pending.order_by('created_at').values_list('created_at', flat=True)
+            # Rows sharing the last timestamp all go in this batch
+            upper = times[batch_size - 1:batch_size].first() or times.last()
+            if upper is None:
+                return processed
+
+            events = pending.filter(created_at__lte=upper)
+            for period, trunc in TRUNC_FUNCTIONS.items():
+                rows = events.order_by().annotate(
+                    bucket=trunc('created_at')
+                ).values('post_id', 'bucket').annotate(views=Count('id'))
+                merge_rollups(period, {(row['post_id'], row['bucket']): row['views'] for row in rows})
+
+            processed += events.count()
+            watermark.rolled_up_to = upper
+            watermark.save(update_fields=['rolled_up_to', 'updated_at'])
+
+
+def compact_post_views(retention_days=30):
+    """
+    Delete raw PostView rows that are rolled up and older than the retention
+    window. Rows in the dedupe window (POST_VIEW_DEDUPE_DAYS) are always
+    kept, write_post_views checks new hits against them.
+    """
+    watermark = RollupWatermark.objects.filter(name=WATERMARK_NAME).first()
+    if watermark is None or watermark.rolled_up_to is None:
+        return 0
+    cutoff = timezone.now() - timedelta(days=max(retention_days, settings.POST_VIEW_DEDUPE_DAYS))
+    deleted, _ = PostView.objects.filter(
+        created_at__lte=min(watermark.rolled_up_to, cutoff)
+    ).delete()
+    return deleted
+
+
+def rolled_up_views():
+    """Subquery with the total rolled-up views of the outer Post."""
+    return Subquery(
+        PostViewRollup.objects.filter(
+            post=OuterRef('pk'),
+            period=PostViewRollup.DAY,
+        ).order_by().values('post').annotate(total=Sum('views')).values('total')
+    )
+
+
+def approved_comments_count():
+    """Subquery counting the approved comments of the outer Post."""
+    return Subquery(
+        Comment.objects.filter(
+            post=OuterRef('pk'),
+            is_approved=True,
+        ).order_by().values('post').annotate(total=Count('pk')).values('total')
+    )
+
+
+def update_comment_counts(post_ids):
+    """Recompute approved_comment_count for the given posts in one UPDATE."""
+    post_ids = set(post_ids)
+    if post_ids:
+        Post.objects.filter(pk__in=post_ids).update(
+            approved_comment_count=Coalesce(approved_comments_count(), 0)
+        )
+
+
+def popular_posts(days=7, limit=5):
+    """Most viewed active posts over the last ``days`` days (today included), read from the daily rollups."""
+    cache_key = f'popular_posts_{days}_{limit}'
+    posts = cache.get(cache_key)
+    if posts is None:
+        # Whole days, the buckets of the daily rollups; today is one of them
+        today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        since = today - timedelta(days=days - 1)
+        posts = list(Post.objects.filter(
+            status=Post.ACTIVE,
+            view_rollups__period=PostViewRollup.DAY,
+            view_rollups__bucket__gte=since,
+        ).select_related(
+            'category'
+        ).annotate(
+            recent_views=Sum('view_rollups__views')
+        ).order_by('-recent_views')[:limit])
+        cache.set(cache_key, posts, 60 * 15)  # Cache for 15 minutes
+
+        # Pages showing the ranking are validated by it, so only a change
+        # to the ranking or its counts marks them modified
+        ranking = [(post.pk, post.recent_views) for post in posts]
+        if shared_cache().get(f'{cache_key}:ranking') != ranking:
+            shared_cache().set(f'{cache_key}:ranking', ranking, None)
+            invalidate(POPULAR_POSTS)
+    return posts
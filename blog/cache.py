@@ -0,0 +1,257 @@
+"""
+Dependency tracking for cached pages and fragments.
+
+Every cached entry can be registered under one or more dependencies, such as
+``post:12`` or ``post-list``. Signal handlers invalidate dependencies when the
+underlying objects change, which deletes exactly the entries built from them.
+"""
+import math
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.utils.cache import patch_cache_control
+
+DEPENDENCY_KEY = 'cachedeps:{}'
+LAST_MODIFIED_KEY = 'lastmod:{}'
+
+POST_LIST = 'post-list'
+CATEGORY_LIST = 'category-list'
+POPULAR_POSTS = 'popular-posts'
+
+
+def shared_cache():
+    """
+    Cache for state that must be consistent across processes. In the tiered
+    profile this skips the per-process L1, which can be briefly stale.
+    """
+    return caches[settings.SHARED_CACHE_ALIAS]
+
+
+def post_dependency(post_id):
+    return f'post:{post_id}'
+
+
+def category_dependency(category_id):
+    return f'category:{category_id}'
+
+
+def object_dependency(obj):
+    """Dependency invalidated when ``obj`` changes, for the models signals track."""
+    from .models import Category, Post  # Import here to avoid circular import
+
+    if isinstance(obj, Post):
+        return post_dependency(obj.pk)
+    if isinstance(obj, Category):
+        return category_dependency(obj.pk)
+    return None
+
+
+def fragment_key(name, obj):
+    """
+    Cache key of a template fragment rendered from ``obj``. It includes the
+    object's updated_at, so an edit moves readers to a new key at once.
+    """
+    updated_at = getattr(obj, 'updated_at', None)
+    version = int(updated_at.timestamp() * 1000) if updated_at else 0
+    return f'fragment:{name}:{obj._meta.label_lower}:{obj.pk}:{version}'
+
+
+def incr_counter(key, delta=1, timeout=None):
+    """Atomically add ``delta`` to a counter in the shared cache, creating it if missing."""
+    try:
+        return shared_cache().incr(key, delta)
+    except ValueError:
+        if shared_cache().add(key, delta, timeout):
+            return delta
+        return shared_cache().incr(key, delta)
+
+
+def _registry_keys(dependency, generation):
+    """Keys of the count and the entries registered under one generation of ``dependency``."""
+    prefix = DEPENDENCY_KEY.format(f'{dependency}:{generation}')
+    return f'{prefix}:count', f'{prefix}:{{}}'
+
+
+def register_dependencies(key, dependencies, timeout=None):
+    """
+    Record that the cache entry ``key``, kept ``timeout`` seconds, must be
+    deleted when any dependency changes.
+
+    Each dependency has a generation, bumped by every invalidation, and a
+    list of the entries registered since. Adding to the list takes an incr()
+    for a slot and a set() of that slot, so concurrent registrations never
+    overwrite each other. If a dependency was invalidated while the entry
+    was being registered, the entry may have been missed and is deleted.
+    """
+    dependencies = set(dependencies)
+    if not dependencies:
+        return
+    timeout = min(timeout or settings.CACHE_DEPENDENCY_TIMEOUT, settings.CACHE_DEPENDENCY_TIMEOUT)
+    generation_keys = {dependency: DEPENDENCY_KEY.format(f'{dependency}:generation') for dependency in dependencies}
+    generations = shared_cache().get_many(generation_keys.values())
+
+    slots = {}
+    for dependency, generation_key in generation_keys.items():
+        count_key, slot_key = _registry_keys(dependency, generations.get(generation_key, 0))
+        slot = incr_counter(count_key, timeout=settings.CACHE_DEPENDENCY_TIMEOUT)
+        if slot > settings.CACHE_DEPENDENCY_MAX_ENTRIES:
+            # Too many entries since the last change, e.g. one per search
+            # query; this one isn't kept rather than growing the list
+            cache.delete(key)
+            return
+        # The count must outlive every slot it hands out
+        shared_cache().touch(count_key, settings.CACHE_DEPENDENCY_TIMEOUT)
+        slots[slot_key.format(slot)] = key
+    shared_cache().set_many(slots, timeout)
+
+    if shared_cache().get_many(generation_keys.values()) != generations:
+        cache.delete(key)
+
+
+def set_with_dependencies(key, value, timeout, dependencies):
+    """cache.set() that also registers the entry under its dependencies."""
+    cache.set(key, value, timeout)
+    register_dependencies(key, dependencies, timeout)
+
+
+def mark_modified(*dependencies):
+    """
+    Record that the dependencies changed now. The timestamps are the
+    last-modified index that blog.conditional builds validators from.
+    """
+    now = time.time()
+    shared_cache().set_many(
+        {LAST_MODIFIED_KEY.format(dependency): now for dependency in set(dependencies)},
+        settings.LAST_MODIFIED_TIMEOUT,
+    )
+
+
+def invalidate(*dependencies):
+    """
+    Delete every cache entry registered under any of the dependencies, and
+    mark them modified.
+    """
+    dependencies = set(dependencies)
+    if not dependencies:
+        return
+    mark_modified(*dependencies)
+    keys = set()
+    for dependency in dependencies:
+        # Registrations from now on go to the next generation's list
+        generation = incr_counter(DEPENDENCY_KEY.format(f'{dependency}:generation')) - 1
+        count_key, slot_key = _registry_keys(dependency, generation)
+        slot_keys = [slot_key.format(slot) for slot in range(1, (shared_cache().get(count_key) or 0) + 1)]
+        for start in range(0, len(slot_keys), 1000):
+            chunk = slot_keys[start:start + 1000]
+            keys.update(shared_cache().get_many(chunk).values())
+            shared_cache().delete_many(chunk)
+        shared_cache().delete(count_key)
+    cache.delete_many(keys)
+
+
+def invalidate_posts(post_ids):
+    """Invalidate posts changed by a bulk update, which doesn't send signals."""
+    from .models import Post  # Import here to avoid circular import
+
+    post_ids = list(post_ids)
+    category_ids = Post.objects.filter(pk__in=post_ids).values_list('category_id', flat=True).distinct()
+    invalidate(
+        POST_LIST,
+        *[post_dependency(post_id) for post_id in post_ids],
+        *[category_dependency(category_id) for category_id in category_ids],
+    )
+
+
+def patch_edge_cache_control(response):
+    """
+    Let CDNs cache an anonymous page for EDGE_CACHE_S_MAXAGE seconds and
+    serve it stale while they revalidate. Browsers keep it for a short
+    EDGE_CACHE_MAX_AGE, which is also how long the page cache keeps it.
+    """
+    patch_cache_control(
+        response,
+        public=True,
+        max_age=settings.EDGE_CACHE_MAX_AGE,
+        s_maxage=settings.EDGE_CACHE_S_MAXAGE,
+        stale_while_revalidate=settings.EDGE_CACHE_STALE_WHILE_REVALIDATE,
+    )
+
+
+def add_cache_dependencies(request, *dependencies):
+    """
+    Declare what the page rendered for ``request`` depends on, so the
+    full-page cache middleware can register it.
+    """
+    if not hasattr(request, 'cache_dependencies'):
+        request.cache_dependencies = set()
+    request.cache_dependencies.update(dependencies)
+
+
+def _lock_key(key):
+    return f'{key}:lock'
+
+
+def _store(key, compute, timeout, grace, dependencies):
+    started = time.monotonic()
+    value = compute()
+    delta = time.monotonic() - started
+    cache.set(key, (value, time.time() + timeout, delta), timeout + grace)
+    if callable(dependencies):
+        dependencies = dependencies(value)
+    register_dependencies(key, dependencies, timeout + grace)
+    return value
+
+
+def cached_value(key):
+    """Value get_or_compute() has cached under ``key``, or None, without computing it."""
+    entry = cache.get(key)
+    return entry[0] if entry is not None else None
+
+
+def get_or_compute(key, compute, timeout, dependencies=(), grace=60, beta=1.0, lock_timeout=30, wait=2.0):
+    """
+    Return the cached value of ``key``, calling ``compute()`` to refresh it
+    without a cache stampede:
+
+    * the entry is kept ``grace`` seconds past ``timeout`` so an expired value
+      can still be served while a single worker, holding a short lock,
+      recomputes it (stale-while-revalidate); ``timeout + grace`` is thus
+      the longest a value is served, and the longest a process that missed
+      its purge serves it, so keep ``grace`` short;
+    * before expiry, workers refresh early with a probability that grows as
+      expiry approaches and with how long ``compute()`` takes (XFetch), so
+      hot keys are usually refreshed before they expire at all;
+    * on a cold miss only the lock holder computes; the others wait up to
+      ``wait`` seconds for its result before computing themselves.
+
+    ``dependencies`` is a list of dependencies, or a callable returning them
+    from the computed value.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        value, expires_at, delta = entry
+        if time.time() - delta * beta * math.log(1 - random.random()) < expires_at:
+            return value
+        # Due for refresh: one worker recomputes, the rest serve the old value
+        if not shared_cache().add(_lock_key(key), 1, lock_timeout):
+            return value
+        try:
+            return _store(key, compute, timeout, grace, dependencies)
+        finally:
+            shared_cache().delete(_lock_key(key))
+
+    if shared_cache().add(_lock_key(key), 1, lock_timeout):
+        try:
+            return _store(key, compute, timeout, grace, dependencies)
+        finally:
+            shared_cache().delete(_lock_key(key))
+
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+    return compute()
@@ -0,0 +1,102 @@
+"""
+Conditional GET for pages built from tracked cache dependencies.
+
+A page's validators come from the last-modified index kept by
+blog.cache.mark_modified: the latest change to any dependency the page is
+built from, the same ones it declares with add_cache_dependencies. Checking
+them reads a few cache keys, so a reader or crawler holding the current copy
+gets a 304 before the view runs any of its queries. Index entries expire
+with the cached pages, after which they are seeded from the database again,
+so a process that missed a change can't answer 304 for it indefinitely.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .cache import LAST_MODIFIED_KEY, POST_LIST, add_cache_dependencies, shared_cache
+
+
+def _release():
+    """
+    Dependency on the deployed release, first seen when a process of the
+    release needs it, so Last-Modified moves past a deploy that changed the
+    markup as the ETag does.
+    """
+    return f'release:{settings.RELEASE_VERSION}'
+
+
+def _seed(dependency):
+    """
+    Last change to ``dependency`` according to the database, used until the
+    index has an entry for it. Deletions only show up in the index.
+    """
+    from .models import Comment, Post  # Import here to avoid circular import
+
+    kind, _, pk = dependency.partition(':')
+    if kind == 'post':
+        updated_at = max(filter(None, [
+            Post.objects.filter(pk=pk).values_list('updated_at', flat=True).first(),
+            Comment.objects.filter(post_id=pk).aggregate(latest=Max('updated_at'))['latest'],
+        ]), default=None)
+    elif kind == 'category':
+        updated_at = Post.objects.filter(category_id=pk).aggregate(latest=Max('updated_at'))['latest']
+    elif dependency == POST_LIST:
+        updated_at = Post.objects.aggregate(latest=Max('updated_at'))['latest']
+    else:
+        updated_at = None
+    return updated_at.timestamp() if updated_at else time.time()
+
+
+def last_modified(dependencies):
+    """Timestamp of the latest change to any of the dependencies."""
+    keys = {LAST_MODIFIED_KEY.format(dependency): dependency for dependency in set(dependencies)}
+    timestamps = shared_cache().get_many(keys)
+    for key, dependency in keys.items():
+        if key not in timestamps:
+            timestamp = _seed(dependency)
+            if not shared_cache().add(key, timestamp, settings.LAST_MODIFIED_TIMEOUT):
+                timestamp = shared_cache().get(key, timestamp)
+            timestamps[key] = timestamp
+    return max(timestamps.values())
+
+
+def conditional_page(get_dependencies):
+    """
+    Answer conditional GET and HEAD requests to a view from the
+    last-modified index, and send ETag and Last-Modified with its pages.
+
+    ``get_dependencies(request, *args, **kwargs)`` returns what the page is
+    built from, or None to skip the check, e.g. when the page would show a
+    one-off flash message. They are also declared to the page cache, so a
+    cached copy is purged whenever the validators change.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            dependencies = None
+            if request.method in ('GET', 'HEAD'):
+                dependencies = get_dependencies(request, *args, **kwargs)
+            if not dependencies:
+                return view(request, *args, **kwargs)
+
+            add_cache_dependencies(request, *dependencies)
+            timestamp = last_modified([*dependencies, _release()])
+            # The release is part of the ETag so a deploy that changes the
+            # templates doesn't keep serving 304s for the old markup
+            version = f"{settings.RELEASE_VERSION}:{','.join(sorted(dependencies))}:{timestamp:.3f}"
+            etag = quote_etag(hashlib.md5(version.encode('utf-8')).hexdigest())
+
+            response = get_conditional_response(request, etag=etag, last_modified=int(timestamp))
+            if response is None:
+                response = view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response.headers.setdefault('ETag', etag)
+                response.headers.setdefault('Last-Modified', http_date(timestamp))
+            return response
+        return wrapper
+    return decorator
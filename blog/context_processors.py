@@ -1,9 +1,67 @@
-from .models import Category
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils.functional import SimpleLazyObject
+
+from .cache import get_or_compute, shared_cache
+from .models import Category, Post
+
+SIDEBAR_VERSION_KEY = 'sidebar_categories:version'
+
+_sidebar = None
+_sidebar_lock = threading.Lock()
+
+
+def _load_sidebar_categories():
+    return list(Category.objects.annotate(
+        post_count=Count('posts', filter=Q(posts__status=Post.ACTIVE))
+    ).order_by('title').values('id', 'title', 'slug', 'post_count'))
+
+
+def sidebar_categories():
+    """
+    Categories with their active post counts, for the sidebar.
+
+    Built with one aggregated query and kept in the shared cache and in
+    process memory under a version number; a request only reads the
+    version from the cache unless invalidate_sidebar() has bumped it.
+    """
+    global _sidebar
+    version = shared_cache().get(SIDEBAR_VERSION_KEY)
+    if version is None:
+        version = time.time()
+        # Expires with the sidebar, as per-process caches don't see invalidate_sidebar()
+        if not shared_cache().add(SIDEBAR_VERSION_KEY, version, settings.CACHE_OBJECT_TIMEOUT):
+            version = shared_cache().get(SIDEBAR_VERSION_KEY, version)
+    sidebar = _sidebar
+    if sidebar is None or sidebar[0] != version:
+        categories = get_or_compute(
+            f'sidebar_categories:{version}',
+            _load_sidebar_categories,
+            settings.CACHE_OBJECT_TIMEOUT,
+            grace=settings.CACHE_OBJECT_GRACE,
+        )
+        with _sidebar_lock:
+            _sidebar = sidebar = (version, categories)
+    return sidebar[1]
+
+
+def invalidate_sidebar():
+    """Make every process rebuild the sidebar on its next request."""
+    shared_cache().set(SIDEBAR_VERSION_KEY, time.time(), settings.CACHE_OBJECT_TIMEOUT)
+
 
 def base_context(request):
     """
-    Add categories to all templates context
+    Add categories to all templates context, looked up only by templates
+    that use them
     """
-    return {
-        'categories': Category.objects.all(),
+    context = {
+        'categories': SimpleLazyObject(sidebar_categories),
     }
+    if getattr(request, 'prerendering', False):
+        # Static pages load per-visitor state like edge-cached ones
+        context['edge_cacheable'] = True
+    return context
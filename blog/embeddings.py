@@ -0,0 +1,150 @@
+"""
+"More like this" index over post bodies.
+
+An offline job (``manage.py build_embeddings``) turns the intro and plain
+text of every active post into a hashed TF-IDF vector: words are hashed into
+EMBEDDINGS_DIMENSIONS buckets, weighted by sublinear term frequency and
+inverse document frequency, and L2-normalised. The vectors are saved as a
+float32 .npy matrix next to the matching post ids. Web processes open the
+matrix memory-mapped, so it's shared through the page cache instead of
+loaded per process, and a query is one matrix-vector product.
+"""
+import os
+import shutil
+import threading
+import time
+import zlib
+
+import numpy as np
+from django.conf import settings
+
+from .models import Post
+from .search import tokenize
+
+VECTORS_FILE = 'vectors.npy'
+IDS_FILE = 'ids.npy'
+# Names the build directory in use; replaced atomically after each build
+CURRENT_FILE = 'CURRENT'
+
+
+def bucket(term, dimensions):
+    # crc32 rather than hash(), which is salted per process
+    return zlib.crc32(term.encode('utf-8')) % dimensions
+
+
+def term_buckets(post, dimensions):
+    """Return {bucket: count} for the words of a post."""
+    counts = {}
+    for term in tokenize(f'{post.intro or ""} {post.content_text or ""}'):
+        index = bucket(term, dimensions)
+        counts[index] = counts.get(index, 0) + 1
+    return counts
+
+
+def build_embeddings(path=None, dimensions=None, chunk_size=500):
+    """Vectorize every active post and save the matrix to ``path``. Returns the number of posts."""
+    path = path or settings.EMBEDDINGS_PATH
+    dimensions = dimensions or settings.EMBEDDINGS_DIMENSIONS
+
+    ids, rows = [], []
+    posts = Post.objects.filter(status=Post.ACTIVE).only('id', 'intro', 'content_text').order_by('id')
+    for post in posts.iterator(chunk_size=chunk_size):
+        ids.append(post.pk)
+        rows.append(term_buckets(post, dimensions))
+
+    vectors = np.zeros((len(rows), dimensions), dtype=np.float32)
+    for i, counts in enumerate(rows):
+        if counts:
+            columns = np.fromiter(counts.keys(), dtype=np.intp, count=len(counts))
+            values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+            vectors[i, columns] = 1 + np.log(values)
+
+    document_frequency = np.count_nonzero(vectors, axis=0)
+    idf = np.log((1 + len(rows)) / (1 + document_frequency)).astype(np.float32) + 1
+    vectors *= idf
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+
+    # Each build gets its own directory; readers switch over when CURRENT
+    # is replaced, so they never mix the vectors and ids of two builds
+    build = f'build-{time.time_ns()}'
+    os.makedirs(os.path.join(path, build))
+    np.save(os.path.join(path, build, VECTORS_FILE), vectors)
+    np.save(os.path.join(path, build, IDS_FILE), np.asarray(ids, dtype=np.int64))
+    previous = current_build(path)
+    tmp = os.path.join(path, f'.{CURRENT_FILE}.tmp')
+    with open(tmp, 'w') as f:
+        f.write(build)
+    os.replace(tmp, os.path.join(path, CURRENT_FILE))
+
+    # Keep the previous build for processes that still have it mapped
+    for name in os.listdir(path):
+        if name.startswith('build-') and name not in (build, previous):
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+    return len(ids)
+
+
+def current_build(path):
+    """Name of the build directory in use under ``path``, or None."""
+    try:
+        with open(os.path.join(path, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+class EmbeddingIndex:
+    """Memory-mapped post vectors answering nearest-neighbour queries."""
+
+    def __init__(self, path, build):
+        self.build = build
+        self.vectors = np.load(os.path.join(path, build, VECTORS_FILE), mmap_mode='r')
+        self.ids = np.load(os.path.join(path, build, IDS_FILE))
+        self.positions = {int(post_id): i for i, post_id in enumerate(self.ids)}
+
+    def similar(self, post_id, limit):
+        """Return up to ``limit`` (post_id, score) pairs most similar to ``post_id``."""
+        position = self.positions.get(post_id)
+        if position is None or len(self.ids) < 2:
+            return []
+        scores = self.vectors @ self.vectors[position]
+        scores[position] = -np.inf
+        limit = min(limit, len(scores) - 1)
+        best = np.argpartition(-scores, limit - 1)[:limit]
+        best = best[np.argsort(-scores[best])]
+        return [(int(self.ids[i]), float(scores[i])) for i in best if scores[i] > 0]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_embedding_index():
+    """Return the process-wide index, reopening it after a rebuild, or None if it wasn't built."""
+    global _index
+    build = current_build(settings.EMBEDDINGS_PATH)
+    if build is None:
+        return None
+    index = _index
+    if index is None or index.build != build:
+        with _index_lock:
+            if _index is index:
+                _index = EmbeddingIndex(settings.EMBEDDINGS_PATH, build)
+            index = _index
+    return index
+
+
+def similar_posts(post, limit):
+    """Active posts most similar in content to ``post``, best first."""
+    index = get_embedding_index()
+    if index is None:
+        return []
+    post_ids = [post_id for post_id, _ in index.similar(post.pk, limit)]
+    posts = Post.objects.filter(
+        status=Post.ACTIVE
+    ).select_related(
+        'category'
+    ).defer(
+        'content', 'content_text'
+    ).in_bulk(post_ids)
+    return [posts[post_id] for post_id in post_ids if post_id in posts]
@@ -0,0 +1,178 @@
+"""
+RSS, Atom and JSON Feed syndication of the latest posts.
+
+RSS and Atom are written by django.utils.feedgenerator. Each entry is
+rendered once per post and format and cached under a key that changes with
+the post's updated_at (blog.cache.fragment_key), so serving a feed takes a
+small query for the latest post ids, one cache read for their entries, and a
+query only for entries that aren't cached yet. Feeds hold at most
+FEED_MAX_ITEMS entries and are built in full before the response starts, so
+a failure is an error response rather than a truncated feed.
+"""
+import json
+from abc import ABC, abstractmethod
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.functions import Coalesce
+from django.utils.feedgenerator import Atom1Feed, Rss201rev2Feed, rfc3339_date
+from django.utils.xmlutils import SimplerXMLGenerator
+
+from .cache import category_dependency, fragment_key, post_dependency, set_with_dependencies
+from .models import Post
+
+
+class Feed(ABC):
+    """A feed format: how to write each entry, and the document around the entries."""
+    name = None
+    content_type = None
+
+    @abstractmethod
+    def entry(self, post, url):
+        """The entry of ``post``, linking to ``url``, cached per post version."""
+
+    @abstractmethod
+    def document(self, meta, entries):
+        """The feed document holding the rendered ``entries``."""
+
+
+class PrerenderedEntries:
+    """A feedgenerator feed writing entries rendered earlier, in place of its items."""
+
+    def __init__(self, *args, entries=(), updated=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.entries = entries
+        self.updated = updated
+
+    def write_items(self, handler):
+        for entry in self.entries:
+            # Writes the markup as is, it was escaped when the entry was rendered
+            handler.ignorableWhitespace(entry)
+
+    def latest_post_date(self):
+        return self.updated
+
+
+class SyndicationFeed(Feed):
+    """A format written by a django.utils.feedgenerator class."""
+    generator = None
+
+    def __init__(self):
+        self.document_generator = type(
+            f'Prerendered{self.generator.__name__}', (PrerenderedEntries, self.generator), {}
+        )
+
+    def entry(self, post, url):
+        feed = self.generator(title='', link=url, description='')
+        feed.add_item(
+            title=post.title,
+            link=url,
+            description=post.meta_description,
+            unique_id=url,
+            unique_id_is_permalink=True,
+            pubdate=post.published_at or post.created_at,
+            updateddate=post.updated_at,
+            categories=[post.category.title],
+        )
+        out = StringIO()
+        feed.write_items(SimplerXMLGenerator(out, 'utf-8', short_empty_elements=True))
+        return out.getvalue()
+
+    def document(self, meta, entries):
+        feed = self.document_generator(
+            title=meta['title'],
+            link=meta['link'],
+            description=meta['description'],
+            feed_url=meta['feed_url'],
+            language=settings.LANGUAGE_CODE,
+            entries=entries,
+            updated=meta['updated'],
+        )
+        return feed.writeString('utf-8')
+
+
+class RssFeed(SyndicationFeed):
+    name = 'rss'
+    content_type = 'application/rss+xml; charset=utf-8'
+    generator = Rss201rev2Feed
+
+
+class AtomFeed(SyndicationFeed):
+    name = 'atom'
+    content_type = 'application/atom+xml; charset=utf-8'
+    generator = Atom1Feed
+
+
+class JsonFeed(Feed):
+    name = 'json'
+    content_type = 'application/feed+json; charset=utf-8'
+
+    def entry(self, post, url):
+        return json.dumps({
+            'id': url,
+            'url': url,
+            'title': post.title,
+            'summary': post.meta_description,
+            'date_published': rfc3339_date(post.published_at or post.created_at),
+            'date_modified': rfc3339_date(post.updated_at),
+            'tags': [post.category.title],
+        })
+
+    def document(self, meta, entries):
+        # Everything but the items, whose list is filled with the cached entries
+        header = json.dumps({
+            'version': 'https://jsonfeed.org/version/1.1',
+            'title': meta['title'],
+            'home_page_url': meta['link'],
+            'feed_url': meta['feed_url'],
+            'description': meta['description'],
+        })
+        return f'{header[:-1]}, "items": [{",".join(entries)}]}}\n'
+
+
+FEEDS = {feed.name: feed() for feed in (RssFeed, AtomFeed, JsonFeed)}
+
+
+def latest_posts(category=None, tag=None):
+    """Ids and updated_at of the newest active posts, enough to look up their entries."""
+    posts = Post.objects.filter(status=Post.ACTIVE)
+    if category is not None:
+        posts = posts.filter(category=category)
+    if tag is not None:
+        posts = posts.filter(tags=tag)
+    return list(posts.annotate(
+        published=Coalesce('published_at', 'created_at')
+    ).order_by('-published').only('id', 'updated_at')[:settings.FEED_MAX_ITEMS])
+
+
+def entries(feed, posts):
+    """Cached entries of ``posts`` in ``feed``'s format, rendering the missing ones."""
+    keys = {post.pk: fragment_key(f'feed-{feed.name}', post) for post in posts}
+    cached = cache.get_many(keys.values())
+    missing = [pk for pk, key in keys.items() if key not in cached]
+    if missing:
+        loaded = Post.objects.filter(pk__in=missing).select_related('category').only(
+            'id', 'title', 'slug', 'meta_description', 'created_at', 'updated_at', 'published_at',
+            'category', 'category__slug', 'category__title',
+        )
+        for post in loaded:
+            key = keys[post.pk]
+            cached[key] = feed.entry(post, settings.SITE_URL + post.get_absolute_url())
+            set_with_dependencies(
+                key, cached[key], settings.FRAGMENT_CACHE_TIMEOUT,
+                [post_dependency(post.pk), category_dependency(post.category_id)],
+            )
+    return [cached[key] for key in keys.values() if key in cached]
+
+
+def build_feed(feed, meta, posts):
+    """The feed document of ``posts``."""
+    return feed.document(meta, entries(feed, posts))
+
+
+def warm_entries(post_ids):
+    """Render the entries of the given posts in every format ahead of the next poll."""
+    posts = list(Post.objects.filter(pk__in=post_ids, status=Post.ACTIVE).only('id', 'updated_at'))
+    for feed in FEEDS.values():
+        entries(feed, posts)
@@ -0,0 +1,180 @@
+"""
+Durable queue of rebuild jobs for everything derived from posts.
+
+Signal handlers and admin actions enqueue jobs in the same transaction as the
+change: the related posts and feed entries of a post, its sitemap shard and
+the pre-rendered pages showing it. A job is one row per (kind, key), so
+repeated changes to the same thing coalesce into one job, and a worker
+handles each kind a batch at a time, so the work done after a publish grows
+with the change rather than with the site.
+
+Workers lease the jobs they claim, with SKIP LOCKED on PostgreSQL so
+concurrent workers never take the same job. A job changed again while it
+was being processed keeps its row and is processed again; one that fails is
+retried with backoff up to REBUILD_JOB_MAX_ATTEMPTS times.
+"""
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import transaction
+from django.db.models import Q
+from django.dispatch import receiver
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Post, RebuildJob
+
+logger = logging.getLogger(__name__)
+
+ALL = '*'
+
+_inline = threading.local()
+
+
+def enqueue(kind, keys):
+    """Queue a rebuild of each key, or bump the job already queued for it."""
+    now = timezone.now()
+    jobs = [RebuildJob(kind=kind, key=str(key), enqueued_at=now) for key in set(keys)]
+    if not jobs:
+        return
+    RebuildJob.objects.bulk_create(
+        jobs,
+        update_conflicts=True,
+        unique_fields=['kind', 'key'],
+        update_fields=['enqueued_at', 'attempts'],
+    )
+    if settings.REBUILD_JOBS_INLINE:
+        _inline.pending = True
+
+
+@receiver(request_finished, dispatch_uid='blog.jobs.process_pending_jobs')
+def process_pending_jobs(sender=None, **kwargs):
+    """
+    Without a worker (REBUILD_JOBS_INLINE), process the queue once a request
+    or command that queued jobs is over, however many it queued. Jobs
+    queued by handlers are picked up by the same loop.
+    """
+    if not getattr(_inline, 'pending', False) or getattr(_inline, 'running', False):
+        return
+    _inline.running = True
+    try:
+        while process_jobs():
+            pass
+    except Exception:
+        logger.exception("Processing rebuild jobs failed")
+    finally:
+        _inline.running = False
+        _inline.pending = False
+
+
+def post_pages(post_ids):
+    """Paths of the pages showing the given posts: their own, their category's and the frontpage."""
+    paths = {reverse('blog:frontpage')}
+    for slug, category_slug in Post.objects.filter(pk__in=post_ids).values_list('slug', 'category__slug'):
+        paths.add(Post.url_for(category_slug, slug))
+        paths.add(reverse('blog:category_detail', args=[category_slug]))
+    return paths
+
+
+def enqueue_post_rebuild(post_ids, related=False, sitemap=True, extra_pages=()):
+    """
+    Queue the rebuilds following a change to the given posts. ``related``
+    also recomputes their neighbours, for changes to tags, category or
+    status; ``extra_pages`` are paths the posts no longer appear at.
+    """
+    from .sitemaps import shard_for  # Import here to avoid circular import
+
+    post_ids = set(post_ids)
+    if related:
+        enqueue(RebuildJob.RELATED, post_ids)
+    enqueue(RebuildJob.FEED, post_ids)
+    if sitemap:
+        enqueue(RebuildJob.SITEMAP, {shard_for(post_id) for post_id in post_ids})
+    enqueue(RebuildJob.PAGE, post_pages(post_ids) | set(extra_pages))
+
+
+def rebuild_related(keys):
+    from .recommendations import refresh_related_posts
+
+    affected = refresh_related_posts(int(key) for key in keys)
+    # Their pages list the new neighbours
+    enqueue(RebuildJob.PAGE, post_pages(affected))
+
+
+def rebuild_feeds(keys):
+    from .feeds import warm_entries
+
+    warm_entries([int(key) for key in keys])
+
+
+def rebuild_sitemap(keys):
+    from .sitemaps import build_sitemaps
+
+    build_sitemaps(None if ALL in keys else [int(key) for key in keys])
+
+
+def rebuild_pages(keys):
+    from .prerender import MANIFEST, prerender
+
+    # Only where pages were pre-rendered, and the output can be written
+    if os.path.exists(os.path.join(settings.PRERENDER_ROOT, MANIFEST)):
+        prerender(settings.PRERENDER_ROOT, paths=None if ALL in keys else keys)
+
+
+# In the order they run, pages last as they show the rest
+HANDLERS = {
+    RebuildJob.RELATED: rebuild_related,
+    RebuildJob.FEED: rebuild_feeds,
+    RebuildJob.SITEMAP: rebuild_sitemap,
+    RebuildJob.PAGE: rebuild_pages,
+}
+
+
+def claim_jobs(batch_size, lease):
+    """Lease up to ``batch_size`` due jobs that no other worker holds."""
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(RebuildJob.objects.select_for_update(skip_locked=True).filter(
+            Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+            attempts__lt=settings.REBUILD_JOB_MAX_ATTEMPTS,
+        ).order_by('pk')[:batch_size])
+        RebuildJob.objects.filter(pk__in=[job.pk for job in jobs]).update(locked_until=now + lease)
+    return jobs
+
+
+def process_jobs(batch_size=None):
+    """Process one batch of jobs, each kind at once. Returns how many were claimed."""
+    lease = timedelta(seconds=settings.REBUILD_JOB_LEASE)
+    jobs = claim_jobs(batch_size or settings.REBUILD_JOB_BATCH_SIZE, lease)
+    by_kind = defaultdict(list)
+    for job in jobs:
+        by_kind[job.kind].append(job)
+
+    for kind, handler in HANDLERS.items():
+        kind_jobs = by_kind.get(kind)
+        if not kind_jobs:
+            continue
+        try:
+            handler({job.key for job in kind_jobs})
+        except Exception as e:
+            logger.exception("Rebuild of %d %s jobs failed", len(kind_jobs), kind)
+            now = timezone.now()
+            for job in kind_jobs:
+                RebuildJob.objects.filter(pk=job.pk).update(
+                    attempts=job.attempts + 1,
+                    last_error=str(e),
+                    locked_until=now + timedelta(seconds=settings.REBUILD_JOB_RETRY_DELAY * 2 ** job.attempts),
+                )
+            continue
+        # Jobs queued again while they ran stay for the next batch
+        done = Q(pk__in=[])
+        for job in kind_jobs:
+            done |= Q(pk=job.pk, enqueued_at=job.enqueued_at)
+        RebuildJob.objects.filter(done).delete()
+        RebuildJob.objects.filter(pk__in=[job.pk for job in kind_jobs]).update(locked_until=None)
+    return len(jobs)
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from blog.models import Post
+
+class Command(BaseCommand):
+    help = 'Compute content_text, word_count and reading_time for existing posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200,
+                            help='Posts to load and update at a time')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        fields = ['content_text', 'word_count', 'reading_time']
+        posts = Post.objects.only('id', 'content', *fields).order_by('id')
+
+        updated = 0
+        batch = []
+        for post in posts.iterator(chunk_size=chunk_size):
+            post.update_text_stats()
+            batch.append(post)
+            if len(batch) >= chunk_size:
+                Post.objects.bulk_update(batch, fields)
+                updated += len(batch)
+                batch = []
+        if batch:
+            Post.objects.bulk_update(batch, fields)
+            updated += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Updated text stats for {updated} posts'))
@@ -0,0 +1,55 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+from blog.embeddings import build_embeddings, get_embedding_index
+from blog.models import Post
+
+class Command(BaseCommand):
+    help = 'Build the content-similarity index used for "more like this" recommendations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dimensions', type=int, default=None,
+                            help='Hashed features per post (default: EMBEDDINGS_DIMENSIONS)')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Posts to load from the database at a time')
+        parser.add_argument('--benchmark', type=int, default=0, metavar='N',
+                            help='Time N random lookups against the tag-join query')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = build_embeddings(dimensions=options['dimensions'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Built embeddings for {count} posts in {time.perf_counter() - started:.2f}s'
+        ))
+        if options['benchmark'] and count:
+            self.benchmark(options['benchmark'])
+
+    def benchmark(self, samples):
+        index = get_embedding_index()
+        post_ids = random.choices(list(index.positions), k=samples)
+        posts = Post.objects.in_bulk(post_ids)
+
+        def tag_join(post):
+            tag_ids = list(post.tags.values_list('id', flat=True))
+            return list(Post.objects.filter(
+                status=Post.ACTIVE, tags__in=tag_ids
+            ).exclude(id=post.id).annotate(
+                same_tags=Count('tags', filter=Q(tags__in=tag_ids))
+            ).order_by('-same_tags', '-created_at').values_list('id', flat=True)[:3])
+
+        for name, lookup in (
+            ('tag join query', lambda post_id: tag_join(posts[post_id])),
+            ('embedding index', lambda post_id: index.similar(post_id, 3)),
+        ):
+            timings = []
+            for post_id in post_ids:
+                started = time.perf_counter()
+                lookup(post_id)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            self.stdout.write(
+                f'{name:>16}: mean {sum(timings) / len(timings):.3f}ms, '
+                f'p95 {timings[int(len(timings) * 0.95) - 1 if len(timings) > 1 else 0]:.3f}ms'
+            )
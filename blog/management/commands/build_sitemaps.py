@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from blog.sitemaps import build_sitemaps
+
+class Command(BaseCommand):
+    help = 'Rebuild every sitemap file in storage'
+
+    def handle(self, *args, **options):
+        shards = build_sitemaps()
+        self.stdout.write(self.style.SUCCESS(f'Built the sitemap index, categories and {len(shards)} post shards'))
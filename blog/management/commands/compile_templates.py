@@ -0,0 +1,69 @@
+import hashlib
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.template import Origin, Template, TemplateSyntaxError, engines
+from django.template.loaders import app_directories, filesystem
+
+class Command(BaseCommand):
+    help = 'Compile every template and write the template bundle used in production'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.TEMPLATE_BUNDLE,
+                            help='Bundle file to write (default: TEMPLATE_BUNDLE)')
+        parser.add_argument('--strict', action='store_true',
+                            help='Also fail on errors in templates shipped by installed apps')
+
+    def handle(self, *args, **options):
+        engine = engines['django'].engine
+        project_dirs = [str(directory) for directory in engine.dirs]
+
+        # Same precedence as the filesystem and app loaders: first match wins
+        sources = {}
+        for loader in (filesystem.Loader(engine, engine.dirs), app_directories.Loader(engine)):
+            for directory in loader.get_dirs():
+                for root, _, files in os.walk(directory):
+                    for filename in files:
+                        path = os.path.join(root, filename)
+                        name = os.path.relpath(path, directory).replace(os.sep, '/')
+                        if name not in sources:
+                            sources[name] = (path, str(directory) in project_dirs)
+
+        templates, errors, skipped = {}, [], []
+        for name, (path, is_project) in sorted(sources.items()):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    source = f.read()
+            except UnicodeDecodeError:
+                continue
+            try:
+                Template(source, origin=Origin(path, name), name=name, engine=engine)
+            except TemplateSyntaxError as e:
+                # Apps like jazzmin ship templates for optional integrations
+                # that can't load here; they are never rendered, so skip them
+                if is_project or options['strict']:
+                    errors.append(f'{name}: {e}')
+                else:
+                    skipped.append(name)
+                continue
+            templates[name] = source
+
+        if errors:
+            raise CommandError('Template errors:\n' + '\n'.join(errors))
+
+        bundle = json.dumps({
+            'version': hashlib.sha256(json.dumps(templates, sort_keys=True).encode('utf-8')).hexdigest(),
+            'templates': templates,
+        })
+        tmp = f"{options['output']}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(bundle)
+        os.replace(tmp, options['output'])
+
+        if skipped:
+            self.stdout.write(f'Skipped {len(skipped)} app templates that need uninstalled apps')
+        self.stdout.write(self.style.SUCCESS(
+            f"Compiled {len(templates)} templates into {options['output']} ({len(bundle) // 1024} KB)"
+        ))
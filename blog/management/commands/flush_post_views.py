@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from blog.tracking import get_view_buffer
+
+class Command(BaseCommand):
+    help = 'Write buffered post views to the database'
+
+    def handle(self, *args, **kwargs):
+        written = get_view_buffer().flush()
+        self.stdout.write(self.style.SUCCESS(f'Recorded {written} new post views'))
@@ -0,0 +1,59 @@
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Imports done by a cold process before it can serve its first request:
+# the WSGI application (settings, apps, models) and the URLconf (views)
+COLD_START = (
+    'import time; started = time.perf_counter()\n'
+    'import {module}\n'
+    'from django.urls import get_resolver; get_resolver().url_patterns\n'
+    'print(f"cold-import-ms={{(time.perf_counter() - started) * 1000:.1f}}")\n'
+)
+
+LINE_RE = re.compile(r'^import time:\s+(\d+) \|\s+\d+ \|\s+(\S+)$')
+
+class Command(BaseCommand):
+    help = 'Report what a cold process spends importing, and fail if it goes over budget'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--module', default='pandastories.wsgi',
+                            help='Entry point to import')
+        parser.add_argument('--budget', type=float, default=settings.IMPORT_TIME_BUDGET_MS,
+                            help='Maximum cold import time in milliseconds')
+        parser.add_argument('--top', type=int, default=15,
+                            help='Number of slowest packages to list')
+
+    def handle(self, *args, **options):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', COLD_START.format(module=options['module'])],
+            capture_output=True,
+            text=True,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'pandastories.settings')},
+        )
+        match = re.search(r'cold-import-ms=([\d.]+)', result.stdout)
+        if result.returncode or not match:
+            raise CommandError(f"Importing {options['module']} failed:\n{result.stderr[-2000:]}")
+        elapsed = float(match.group(1))
+
+        # Own import time of each top-level package, summed over its modules
+        packages = {}
+        for line in result.stderr.splitlines():
+            line_match = LINE_RE.match(line)
+            if line_match:
+                own, name = int(line_match.group(1)), line_match.group(2)
+                package = name.split('.')[0]
+                packages[package] = packages.get(package, 0) + own
+
+        self.stdout.write(f'Slowest imports under {options["module"]}:')
+        for package, own in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:options['top']]:
+            self.stdout.write(f'  {own / 1000:8.1f}ms  {package}')
+
+        summary = f'Cold import took {elapsed:.0f}ms (budget {options["budget"]:.0f}ms)'
+        if elapsed > options['budget']:
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary))
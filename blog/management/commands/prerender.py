@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from blog.prerender import prerender
+
+class Command(BaseCommand):
+    help = 'Pre-render the public pages to static HTML, re-rendering only pages whose content changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.PRERENDER_ROOT,
+                            help='Directory to write the pages to (default: PRERENDER_ROOT)')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Worker processes (default: number of CPUs)')
+        parser.add_argument('--batch-size', type=int, default=25,
+                            help='Pages sent to a worker at a time')
+        parser.add_argument('--force', action='store_true',
+                            help='Re-render every page, e.g. after a code change')
+
+    def handle(self, *args, **options):
+        root = str(options['output'])
+        rendered, unchanged, removed, failed = prerender(
+            root, force=options['force'], workers=options['workers'], batch_size=options['batch_size'],
+        )
+        for path in failed:
+            self.stderr.write(f'Not rendered, left to Django: {path}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {rendered} pages ({unchanged} unchanged, {removed} removed) into {root}'
+        ))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from blog.jobs import process_jobs
+
+class Command(BaseCommand):
+    help = 'Process queued rebuilds of sitemaps, feeds, related posts and pre-rendered pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Jobs to claim per batch (default: REBUILD_JOB_BATCH_SIZE)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling for new jobs instead of exiting once the queue is empty')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds to wait between polls of an empty queue with --loop')
+
+    def handle(self, *args, **options):
+        processed = 0
+        while True:
+            claimed = process_jobs(batch_size=options['batch_size'])
+            processed += claimed
+            if claimed:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} rebuild jobs'))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from blog.jobs import process_pending_jobs
+from blog.publishing import next_due, publish_due_posts
+
+class Command(BaseCommand):
+    help = 'Publish scheduled posts whose publish date has passed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Posts to publish per UPDATE')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, sleeping until the next scheduled post is due')
+        parser.add_argument('--max-sleep', type=float, default=60,
+                            help='Longest sleep with --loop, so newly scheduled posts are noticed')
+
+    def handle(self, *args, **options):
+        while True:
+            published = publish_due_posts(batch_size=options['batch_size'])
+            # No request ends to run inline jobs
+            process_pending_jobs()
+            if published:
+                self.stdout.write(self.style.SUCCESS(f'Published {len(published)} scheduled posts'))
+            if len(published) == options['batch_size']:
+                continue
+            if not options['loop']:
+                break
+            due = next_due()
+            delay = options['max_sleep']
+            if due is not None:
+                delay = min(delay, max((due - timezone.now()).total_seconds(), 1))
+            time.sleep(delay)
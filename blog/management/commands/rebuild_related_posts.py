@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from blog.recommendations import rebuild_related_posts
+
+class Command(BaseCommand):
+    help = 'Recompute the related-posts index for every active post'
+
+    def handle(self, *args, **options):
+        indexed = rebuild_related_posts()
+        self.stdout.write(self.style.SUCCESS(f'Indexed related posts for {indexed} posts'))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from blog.cache import invalidate_posts
+from blog.models import Comment, Post
+
+class Command(BaseCommand):
+    help = 'Recompute approved_comment_count for posts whose counter has drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Posts to check per query')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fixed = 0
+        last_id = 0
+        while True:
+            posts = list(Post.objects.filter(pk__gt=last_id).order_by('pk').only(
+                'id', 'approved_comment_count'
+            )[:batch_size])
+            if not posts:
+                break
+            last_id = posts[-1].pk
+
+            counts = dict(Comment.objects.filter(
+                post__in=posts,
+                is_approved=True,
+            ).order_by().values('post').annotate(total=Count('pk')).values_list('post', 'total'))
+
+            drifted = []
+            for post in posts:
+                count = counts.get(post.pk, 0)
+                if post.approved_comment_count != count:
+                    post.approved_comment_count = count
+                    drifted.append(post)
+            if drifted:
+                Post.objects.bulk_update(drifted, ['approved_comment_count'])
+                invalidate_posts(post.pk for post in drifted)
+            fixed += len(drifted)
+
+        self.stdout.write(self.style.SUCCESS(f'Fixed comment counts on {fixed} posts'))
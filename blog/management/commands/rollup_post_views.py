@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from blog.analytics import rollup_post_views, compact_post_views
+
+class Command(BaseCommand):
+    help = 'Aggregate new post views into hourly and daily rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Raw view rows to aggregate per transaction')
+        parser.add_argument('--compact', action='store_true',
+                            help='Delete raw views that are rolled up and past the retention window')
+        parser.add_argument('--retention-days', type=int, default=30,
+                            help='Days of raw views to keep when compacting')
+
+    def handle(self, *args, **options):
+        processed = rollup_post_views(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {processed} post views'))
+
+        if options['compact']:
+            deleted = compact_post_views(retention_days=options['retention_days'])
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} raw post views'))
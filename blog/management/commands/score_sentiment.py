@@ -0,0 +1,76 @@
+import hashlib
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from blog.cache import invalidate, post_dependency
+from blog.models import Comment, Post
+from blog.utils import get_sentiments
+
+# Model, text fields scored and the field of the post showing the score, for each source
+SOURCES = {
+    'posts': (Post, ('title', 'intro', 'content_text'), 'id'),
+    'comments': (Comment, ('contents',), 'post_id'),
+}
+
+class Command(BaseCommand):
+    help = 'Score the sentiment of posts and comments whose text changed since they were last scored'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', choices=[*SOURCES, 'all'], default='all',
+                            help='What to score')
+        parser.add_argument('--chunk-size', type=int, default=200,
+                            help='Rows sent to a worker at a time')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Worker processes (default: number of CPUs)')
+        parser.add_argument('--force', action='store_true',
+                            help='Rescore rows even if their text is unchanged')
+
+    def handle(self, *args, **options):
+        sources = SOURCES if options['source'] == 'all' else [options['source']]
+        workers = options['workers'] or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for source in sources:
+                model, fields, post_field = SOURCES[source]
+                scored = self.score(pool, workers, model, fields, post_field, options['chunk_size'], options['force'])
+                self.stdout.write(self.style.SUCCESS(f'Scored sentiment of {scored} {source}'))
+
+    def changed_chunks(self, model, fields, post_field, chunk_size, force):
+        """Yield chunks of (obj, text hash, text) for rows that need scoring."""
+        chunk = []
+        rows = model.objects.only('id', post_field, 'sentiment_hash', *fields).order_by('pk')
+        for obj in rows.iterator(chunk_size=chunk_size):
+            text = '\n'.join(getattr(obj, field) or '' for field in fields)
+            digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+            if force or digest != obj.sentiment_hash:
+                chunk.append((obj, digest, text))
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+    def score(self, pool, workers, model, fields, post_field, chunk_size, force):
+        # Keep a bounded number of chunks in flight so memory stays flat
+        # however many rows there are
+        scored = 0
+        in_flight = deque()
+        for chunk in self.changed_chunks(model, fields, post_field, chunk_size, force):
+            in_flight.append((chunk, pool.submit(get_sentiments, [text for _, _, text in chunk])))
+            if len(in_flight) > workers * 2:
+                scored += self.save(model, post_field, *in_flight.popleft())
+        while in_flight:
+            scored += self.save(model, post_field, *in_flight.popleft())
+        return scored
+
+    def save(self, model, post_field, chunk, future):
+        objs = []
+        for (obj, digest, _), sentiment in zip(chunk, future.result()):
+            obj.sentiment = sentiment
+            obj.sentiment_hash = digest
+            objs.append(obj)
+        model.objects.bulk_update(objs, ['sentiment', 'sentiment_hash'])
+        # bulk_update() sends no signals, and cached post pages show the scores
+        invalidate(*{post_dependency(getattr(obj, post_field)) for obj in objs})
+        return len(objs)
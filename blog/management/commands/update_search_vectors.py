@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from blog.models import Post
+from blog.search import use_postgres_search, update_search_vector, bump_search_index_version
+
+class Command(BaseCommand):
+    help = 'Recompute the full-text search vector of every post'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200,
+                            help='Posts to load from the database at a time')
+
+    def handle(self, *args, **options):
+        bump_search_index_version()
+        if not use_postgres_search():
+            self.stdout.write('Not using PostgreSQL, the in-process search index will rebuild itself')
+            return
+
+        updated = 0
+        posts = Post.objects.only('id', 'title', 'intro', 'content_text').order_by('id')
+        for post in posts.iterator(chunk_size=options['chunk_size']):
+            update_search_vector(post)
+            updated += 1
+        self.stdout.write(self.style.SUCCESS(f'Updated search vectors for {updated} posts'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from pandastories.warmup import STEPS, warmup
+
+class Command(BaseCommand):
+    help = 'Run the cold-start warmup and print how long each step takes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('steps', nargs='*',
+                            help=f'Steps to run, out of {", ".join(STEPS)} (default: WARMUP_STEPS)')
+
+    def handle(self, *args, **options):
+        unknown = set(options['steps']) - set(STEPS)
+        if unknown:
+            raise CommandError(f'Unknown warmup steps: {", ".join(sorted(unknown))}')
+        timings = warmup(options['steps'])
+        for name, ms in timings.items():
+            self.stdout.write(f'  {ms:8.1f}ms  {name}')
+        self.stdout.write(self.style.SUCCESS(f'Warmup took {sum(timings.values()):.0f}ms'))
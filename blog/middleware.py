@@ -0,0 +1,49 @@
+import copy
+import time
+
+from django.conf import settings
+from django.middleware.cache import UpdateCacheMiddleware
+from django.utils.cache import get_cache_key, get_max_age, has_vary_header, patch_cache_control
+from django.utils.http import http_date
+
+from .cache import register_dependencies
+
+
+class DependencyUpdateCacheMiddleware(UpdateCacheMiddleware):
+    """
+    UpdateCacheMiddleware that also registers each cached page under the
+    dependencies its view declared with blog.cache.add_cache_dependencies,
+    so model changes purge exactly the pages built from them.
+
+    Pages cached for the default timeout are sent to browsers with
+    CACHE_MIDDLEWARE_BROWSER_MAX_AGE instead, since no purge reaches them.
+    """
+
+    def _cached_for_default_timeout(self, request, response):
+        """Whether the response is about to be cached for CACHE_MIDDLEWARE_SECONDS."""
+        return (
+            self._should_update_cache(request, response)
+            and response.status_code == 200
+            and not response.streaming
+            and not (not request.COOKIES and response.cookies and has_vary_header(response, 'Cookie'))
+            and 'private' not in response.get('Cache-Control', ())
+            and get_max_age(response) is None
+            and not response.has_header('Expires')
+        )
+
+    def process_response(self, request, response):
+        if self._cached_for_default_timeout(request, response):
+            patch_cache_control(response, max_age=settings.CACHE_MIDDLEWARE_BROWSER_MAX_AGE)
+            response.headers['Expires'] = http_date(time.time() + settings.CACHE_MIDDLEWARE_BROWSER_MAX_AGE)
+            # Still kept for the full timeout here, where purges reach it
+            updater = copy.copy(self)
+            updater.page_timeout = self.cache_timeout
+        else:
+            updater = self
+        response = UpdateCacheMiddleware.process_response(updater, request, response)
+        dependencies = getattr(request, 'cache_dependencies', None)
+        if dependencies and response.status_code == 200 and self._should_update_cache(request, response):
+            cache_key = get_cache_key(request, self.key_prefix, request.method, cache=self.cache)
+            if cache_key is not None:
+                register_dependencies(cache_key, dependencies, self.cache_timeout)
+        return response
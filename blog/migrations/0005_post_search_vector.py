@@ -0,0 +1,26 @@
+# Generated by Django 4.2.17 on 2026-10-16 20:32
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+import blog.operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0004_postviewrollup_rollupwatermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        blog.operations.PostgresOnlyAddIndex(
+            model_name='post',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='blog_post_search_gin'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.17 on 2026-10-16 20:33
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+import blog.operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_post_search_vector'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        blog.operations.PostgresOnlyAddIndex(
+            model_name='category',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='blog_category_title_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        blog.operations.PostgresOnlyAddIndex(
+            model_name='post',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='blog_post_title_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        # taggit's Tag model isn't ours, so its index is managed here in SQL
+        blog.operations.PostgresOnlyRunSQL(
+            sql='CREATE INDEX IF NOT EXISTS blog_taggit_tag_name_trgm ON taggit_tag USING gin (name gin_trgm_ops);',
+            reverse_sql='DROP INDEX IF EXISTS blog_taggit_tag_name_trgm;',
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.17 on 2026-10-16 20:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_relatedpost'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='sentiment',
+            field=models.FloatField(blank=True, editable=False, help_text='Polarity from -1 to 1', null=True),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='sentiment_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='sentiment',
+            field=models.FloatField(blank=True, editable=False, help_text='Polarity from -1 to 1', null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='sentiment_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['is_approved', 'sentiment'], name='blog_commen_is_appr_4d031e_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.17 on 2026-10-16 20:59
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_sentiment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RebuildJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('related', 'Related posts of a post'), ('feed', 'Feed entries of a post'), ('sitemap', 'Sitemap shard'), ('page', 'Pre-rendered page')], max_length=10)),
+                ('key', models.CharField(help_text="Post id, shard number or page path; '*' for all", max_length=255)),
+                ('enqueued_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='rebuildjob',
+            constraint=models.UniqueConstraint(fields=('kind', 'key'), name='unique_rebuild_job'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.17 on 2026-10-16 21:10
+
+from django.db import migrations, models
+
+
+def watermark_to_time(apps, schema_editor):
+    """Carry the id watermark over as the creation time of that view."""
+    RollupWatermark = apps.get_model('blog', 'RollupWatermark')
+    PostView = apps.get_model('blog', 'PostView')
+    for watermark in RollupWatermark.objects.all():
+        watermark.rolled_up_to = PostView.objects.filter(
+            id__lte=watermark.last_id
+        ).order_by('-id').values_list('created_at', flat=True).first()
+        watermark.save(update_fields=['rolled_up_to'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0011_rebuildjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rollupwatermark',
+            name='rolled_up_to',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(watermark_to_time, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='rollupwatermark',
+            name='last_id',
+        ),
+        migrations.AddIndex(
+            model_name='postview',
+            index=models.Index(fields=['created_at'], name='blog_postvi_created_fbb95a_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+from django.utils.html import strip_tags
+
+
+def backfill_text_stats(apps, schema_editor):
+    """Same as Post.update_text_stats(), which historical models don't have."""
+    Post = apps.get_model('blog', 'Post')
+    fields = ['content_text', 'word_count', 'reading_time']
+    batch = []
+    for post in Post.objects.only('id', 'content', *fields).order_by('id').iterator(chunk_size=200):
+        post.content_text = strip_tags(post.content) if post.content else ''
+        post.word_count = len(post.content_text.split())
+        post.reading_time = max(1, round(post.word_count / 200))
+        batch.append(post)
+        if len(batch) >= 200:
+            Post.objects.bulk_update(batch, fields)
+            batch = []
+    if batch:
+        Post.objects.bulk_update(batch, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0012_rollup_by_time'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_text_stats, migrations.RunPython.noop),
+    ]
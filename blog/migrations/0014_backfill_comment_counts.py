@@ -0,0 +1,25 @@
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_comment_counts(apps, schema_editor):
+    """Count the approved comments of existing posts, in one UPDATE."""
+    Post = apps.get_model('blog', 'Post')
+    Comment = apps.get_model('blog', 'Comment')
+    approved = Comment.objects.filter(
+        post=OuterRef('pk'),
+        is_approved=True,
+    ).order_by().values('post').annotate(total=Count('pk')).values('total')
+    Post.objects.update(approved_comment_count=Coalesce(Subquery(approved), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0013_backfill_post_text_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_comment_counts, migrations.RunPython.noop),
+    ]
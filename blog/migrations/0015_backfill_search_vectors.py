@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchVector
+from django.db import connection, migrations
+from django.db.models import TextField, Value
+from django.utils.html import strip_tags
+
+
+def backfill_search_vectors(apps, schema_editor):
+    """Same as blog.search.update_search_vector(), for the posts saved before it ran."""
+    if connection.vendor != 'postgresql':
+        return
+    Post = apps.get_model('blog', 'Post')
+    fields = (('title', 'A'), ('intro', 'B'), ('content_text', 'C'))
+    posts = Post.objects.only('id', *[field for field, _ in fields]).order_by('id')
+    for post in posts.iterator(chunk_size=200):
+        vector = None
+        for field, weight in fields:
+            part = SearchVector(
+                Value(strip_tags(getattr(post, field) or ''), output_field=TextField()),
+                weight=weight,
+                config=settings.SEARCH_CONFIG,
+            )
+            vector = part if vector is None else vector + part
+        Post.objects.filter(pk=post.pk).update(search_vector=vector)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0014_backfill_comment_counts'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_search_vectors, migrations.RunPython.noop),
+    ]
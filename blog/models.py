@@ -1,9 +1,26 @@
 from django.db import models
+from django.utils import timezone
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.utils.text import slugify
 from django.utils.html import strip_tags
 from django_ckeditor_5.fields import CKEditor5Field
 from taggit.managers import TaggableManager
 
+# Polarity beyond which text counts as positive or negative
+SENTIMENT_THRESHOLD = 0.1
+
+
+def sentiment_label(score):
+    """'positive', 'negative' or 'neutral' for a polarity score, None if not scored yet."""
+    if score is None:
+        return None
+    if score > SENTIMENT_THRESHOLD:
+        return 'positive'
+    if score < -SENTIMENT_THRESHOLD:
+        return 'negative'
+    return 'neutral'
+
 class Category(models.Model):
     """Category model for organizing blog posts."""
     title = models.CharField(max_length=255, db_index=True)
@@ -17,6 +34,7 @@ class Category(models.Model):
         indexes = [
             models.Index(fields=['title']),
             models.Index(fields=['slug']),
+            GinIndex(fields=['title'], name='blog_category_title_trgm', opclasses=['gin_trgm_ops']),
         ]
     
     def __str__(self):
@@ -64,24 +82,55 @@ class Post(models.Model):
     
     # Analytics and engagement
     views_count = models.PositiveIntegerField(default=0)
+    approved_comment_count = models.PositiveIntegerField(default=0, editable=False)
     featured = models.BooleanField(default=False)
     
     # Tags using django-taggit
     tags = TaggableManager(blank=True)
     
+    # Plain text and reading stats, computed from content in save()
+    content_text = models.TextField(blank=True, editable=False)
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    reading_time = models.PositiveSmallIntegerField(default=1, editable=False, help_text="Reading time in minutes")
+    
+    # Sentiment polarity, scored in batches by `manage.py score_sentiment`
+    sentiment = models.FloatField(null=True, blank=True, editable=False, help_text="Polarity from -1 to 1")
+    sentiment_hash = models.CharField(max_length=64, blank=True, editable=False)
+    
+    # Full-text search, maintained by blog.search (PostgreSQL only)
+    search_vector = SearchVectorField(null=True, editable=False)
+    
     class Meta:
         ordering = ["-created_at"]
         indexes = [
             models.Index(fields=['created_at', 'status']),
             models.Index(fields=['category', 'status']),
             models.Index(fields=['status', 'published_at']),
+            GinIndex(fields=['search_vector'], name='blog_post_search_gin'),
+            GinIndex(fields=['title'], name='blog_post_title_trgm', opclasses=['gin_trgm_ops']),
         ]
     
     def __str__(self):
         return self.title
     
     def get_absolute_url(self):
-        return f"/{self.category.slug}/{self.slug}/"
+        return self.url_for(self.category.slug, self.slug)
+    
+    @staticmethod
+    def url_for(category_slug, slug):
+        """URL of a post from its slugs, for code that only loads values."""
+        return f"/{category_slug}/{slug}/"
+    
+    @property
+    def sentiment_label(self):
+        return sentiment_label(self.sentiment)
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded values so signal handlers can tell what changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
     
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -90,15 +139,15 @@ class Post(models.Model):
             self.meta_title = self.title[:60]
         if not self.meta_description:
             self.meta_description = strip_tags(self.intro)[:160] if self.intro else ""
+        self.update_text_stats()
         super().save(*args, **kwargs)
     
-    @property
-    def reading_time(self):
-        """Calculate reading time in minutes based on content length."""
-        text = strip_tags(self.content)
-        words = len(text.split())
-        minutes = round(words / 200)  # Average reading speed of 200 words per minute
-        return max(1, minutes)  # Minimum 1 minute reading time
+    def update_text_stats(self):
+        """Derive content_text, word_count and reading_time from the content HTML."""
+        self.content_text = strip_tags(self.content) if self.content else ""
+        self.word_count = len(self.content_text.split())
+        minutes = round(self.word_count / 200)  # Average reading speed of 200 words per minute
+        self.reading_time = max(1, minutes)  # Minimum 1 minute reading time
 
 class Comment(models.Model):
     """Comment model for blog posts."""
@@ -110,14 +159,30 @@ class Comment(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_approved = models.BooleanField(default=True)
     
+    # Sentiment polarity, scored in batches by `manage.py score_sentiment`
+    sentiment = models.FloatField(null=True, blank=True, editable=False, help_text="Polarity from -1 to 1")
+    sentiment_hash = models.CharField(max_length=64, blank=True, editable=False)
+    
     class Meta:
         ordering = ["-created_at"]
         indexes = [
             models.Index(fields=['post', 'created_at']),
+            models.Index(fields=['is_approved', 'sentiment']),
         ]
     
     def __str__(self):
         return f"Comment by {self.name} on {self.post.title}"
+    
+    @property
+    def sentiment_label(self):
+        return sentiment_label(self.sentiment)
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded values so signal handlers can tell what changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
 
 class Newsletter(models.Model):
     """Newsletter subscription model."""
@@ -156,7 +221,96 @@ class PostView(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['post', 'created_at']),
+            models.Index(fields=['created_at']),
         ]
     
     def __str__(self):
-        return f"View of {self.post.title} at {self.created_at}"
\ No newline at end of file
+        return f"View of {self.post.title} at {self.created_at}"
+
+class PostViewRollup(models.Model):
+    """Aggregated post view counts per hour or day."""
+    HOUR = 'hour'
+    DAY = 'day'
+
+    CHOICES_PERIOD = (
+        (HOUR, 'Hour'),
+        (DAY, 'Day'),
+    )
+
+    post = models.ForeignKey(Post, related_name='view_rollups', on_delete=models.CASCADE)
+    period = models.CharField(max_length=4, choices=CHOICES_PERIOD)
+    bucket = models.DateTimeField(help_text="Start of the hour or day")
+    views = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-bucket']
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'period', 'bucket'], name='unique_post_view_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['period', 'bucket']),
+        ]
+
+    def __str__(self):
+        return f"{self.views} views of {self.post.title} ({self.period} of {self.bucket})"
+
+
+class RollupWatermark(models.Model):
+    """Creation time up to which raw events are folded into the rollups."""
+    name = models.CharField(max_length=50, unique=True)
+    rolled_up_to = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} up to {self.rolled_up_to}"
+
+
+class RelatedPost(models.Model):
+    """Precomputed nearest neighbours of a post, maintained by blog.recommendations."""
+    post = models.ForeignKey(Post, related_name='related_entries', on_delete=models.CASCADE)
+    related = models.ForeignKey(Post, related_name='related_from', on_delete=models.CASCADE)
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['post', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'related'], name='unique_related_post'),
+        ]
+        indexes = [
+            models.Index(fields=['post', 'rank']),
+        ]
+
+    def __str__(self):
+        return f"{self.related.title} is #{self.rank} related to {self.post.title}"
+
+
+class RebuildJob(models.Model):
+    """Pending rebuild of something derived from posts, processed by blog.jobs."""
+    RELATED = 'related'
+    FEED = 'feed'
+    SITEMAP = 'sitemap'
+    PAGE = 'page'
+
+    CHOICES_KIND = (
+        (RELATED, 'Related posts of a post'),
+        (FEED, 'Feed entries of a post'),
+        (SITEMAP, 'Sitemap shard'),
+        (PAGE, 'Pre-rendered page'),
+    )
+
+    kind = models.CharField(max_length=10, choices=CHOICES_KIND)
+    key = models.CharField(max_length=255, help_text="Post id, shard number or page path; '*' for all")
+    enqueued_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'key'], name='unique_rebuild_job'),
+        ]
+
+    def __str__(self):
+        return f"Rebuild {self.kind} {self.key}"
@@ -0,0 +1,124 @@
+"""
+Keyset (cursor) pagination for post listings.
+
+Pages are addressed by an opaque signed token holding the (created_at, id) of
+the row at the page boundary instead of a page number, so the database seeks
+straight to it through the created_at index. Deep pages cost the same as the
+first one and no COUNT(*) is needed to render a page.
+"""
+from datetime import datetime
+
+from django.core import signing
+from django.db.models import Q
+
+from .cache import get_or_compute
+
+CURSOR_SALT = 'blog.pagination.cursor'
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(direction, post):
+    return signing.dumps([direction, post.created_at.isoformat(), post.pk], salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token):
+    """Return (direction, created_at, id) for a page token, or None if it's missing or invalid."""
+    if not token:
+        return None
+    try:
+        direction, created_at, pk = signing.loads(token, salt=CURSOR_SALT)
+        return direction, datetime.fromisoformat(created_at), int(pk)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+
+
+class CursorPage:
+    """A page of posts with tokens for its neighbours, usable like a Paginator page."""
+
+    def __init__(self, object_list, next_cursor, previous_cursor, count=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Paginate ``queryset`` newest first on (created_at, id).
+
+    ``count_key`` enables an approximate total, cached for ``count_timeout``
+    seconds and registered under ``count_dependencies`` so it's dropped when
+    posts change.
+    """
+
+    def __init__(self, queryset, per_page, count_key=None, count_timeout=60 * 10, count_dependencies=()):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.count_key = count_key
+        self.count_timeout = count_timeout
+        self.count_dependencies = count_dependencies
+
+    def count(self):
+        if self.count_key is None:
+            return None
+        return get_or_compute(
+            self.count_key,
+            lambda: self.queryset.order_by().values('pk').count(),
+            self.count_timeout,
+            self.count_dependencies,
+        )
+
+    def get_page(self, token):
+        """Return the page for ``token``; invalid or missing tokens give the first page."""
+        cursor = decode_cursor(token)
+        queryset = self.queryset
+        if cursor is None:
+            direction = NEXT
+        else:
+            direction, created_at, pk = cursor
+            if direction == PREVIOUS:
+                queryset = queryset.filter(
+                    Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk)
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+                )
+
+        # Fetch one extra row to know whether there is a page beyond this one
+        if direction == PREVIOUS:
+            rows = list(queryset.order_by('created_at', 'pk')[:self.per_page + 1])
+            has_more = len(rows) > self.per_page
+            posts = rows[:self.per_page][::-1]
+            has_previous, has_next = has_more, True
+        else:
+            rows = list(queryset.order_by('-created_at', '-pk')[:self.per_page + 1])
+            has_more = len(rows) > self.per_page
+            posts = rows[:self.per_page]
+            has_previous, has_next = cursor is not None, has_more
+
+        if not posts:
+            return CursorPage([], None, None, self.count())
+        return CursorPage(
+            posts,
+            encode_cursor(NEXT, posts[-1]) if has_next else None,
+            encode_cursor(PREVIOUS, posts[0]) if has_previous else None,
+            self.count(),
+        )
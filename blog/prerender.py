@@ -0,0 +1,227 @@
+"""
+Static pre-rendering of the public pages.
+
+`manage.py prerender` renders the frontpage, every category and post page
+and the about, privacy and terms pages into PRERENDER_ROOT with the regular
+views and templates, as ``<path>/index.html`` so the host can serve them
+before falling back to Django (see vercel.json). Pages are rendered like
+edge-cached ones, without per-visitor state, which they load from
+blog:page_state.
+
+Each page gets a fingerprint of the rows it is rendered from, taken with a
+few bulk queries for the whole site. The manifest records the fingerprint
+and content hash of every page written, so a build renders only pages whose
+fingerprint changed and rewrites only files whose content did. Rebuild jobs
+(blog.jobs) re-render just the pages a change affects.
+"""
+import hashlib
+import json
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import connections
+from django.db.models import Count, Max
+from django.http import Http404
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from .analytics import popular_posts
+from .models import Category, Comment, Post, RelatedPost
+
+STATIC_PAGES = ('blog:about', 'blog:privacy_policy', 'blog:terms_conditions')
+
+MANIFEST = 'manifest.json'
+
+
+def _digest(*parts):
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+
+def template_version():
+    """Hash of the project templates, part of every page's fingerprint."""
+    digest = hashlib.sha256()
+    for directory in settings.TEMPLATES[0]['DIRS']:
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for filename in sorted(files):
+                path = os.path.join(root, filename)
+                digest.update(os.path.relpath(path, directory).encode('utf-8'))
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+    return digest.hexdigest()
+
+
+def page_fingerprints():
+    """{path: fingerprint} of every page to pre-render."""
+    version = template_version()
+    categories = {
+        row[0]: row for row in Category.objects.order_by('pk').values_list(
+            'pk', 'slug', 'title', 'description', 'meta_description'
+        )
+    }
+    posts = {
+        row[0]: row for row in Post.objects.filter(status=Post.ACTIVE).order_by('pk').values_list(
+            'pk', 'slug', 'category_id', 'updated_at', 'approved_comment_count'
+        )
+    }
+    comments = {
+        post_id: (count, latest) for post_id, count, latest in Comment.objects.filter(
+            is_approved=True
+        ).values('post').annotate(count=Count('pk'), latest=Max('updated_at')).values_list(
+            'post', 'count', 'latest'
+        )
+    }
+    related = defaultdict(list)
+    for post_id, related_id in RelatedPost.objects.order_by('post', 'rank').values_list('post', 'related'):
+        related[post_id].append(related_id)
+
+    by_category = defaultdict(list)
+    for post in posts.values():
+        by_category[post[2]].append(post)
+
+    pages = {reverse(name): _digest(version) for name in STATIC_PAGES}
+    pages[reverse('blog:frontpage')] = _digest(
+        version, list(posts.values()), list(categories.values()), [post.pk for post in popular_posts()],
+    )
+    for category in categories.values():
+        pages[reverse('blog:category_detail', args=[category[1]])] = _digest(
+            version, category, by_category[category[0]],
+        )
+    for post in posts.values():
+        category = categories[post[2]]
+        pages[Post.url_for(category[1], post[1])] = _digest(
+            version, post, category, comments.get(post[0]),
+            [posts.get(related_id) for related_id in related[post[0]]],
+        )
+    return pages
+
+
+def render_page(path):
+    """Render ``path`` through its view as an anonymous visitor; None unless it's a 200."""
+    site = urlsplit(settings.SITE_URL)
+    request = RequestFactory().get(path, HTTP_HOST=site.netloc, secure=site.scheme == 'https')
+    request.user = AnonymousUser()
+    request.prerendering = True
+    match = resolve(path)
+    try:
+        response = match.func(request, *match.args, **match.kwargs)
+    except Http404:
+        # Unpublished since the fingerprints were taken
+        return None
+    if hasattr(response, 'render'):
+        response.render()
+    return response.content if response.status_code == 200 else None
+
+
+def render_pages(paths):
+    """Render a batch of pages in a worker, returning [(path, html or None)]."""
+    return [(path, render_page(path)) for path in paths]
+
+
+def output_path(root, path):
+    return os.path.join(root, path.strip('/'), 'index.html')
+
+
+def read_manifest(root):
+    try:
+        with open(os.path.join(root, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def write_manifest(root, manifest):
+    path = os.path.join(root, MANIFEST)
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(f'{path}.tmp', path)
+
+
+def write_page(root, path, html):
+    """Write a rendered page unless it's unchanged; returns its content hash."""
+    content_hash = hashlib.sha256(html).hexdigest()
+    target = output_path(root, path)
+    try:
+        with open(target, 'rb') as f:
+            if hashlib.sha256(f.read()).hexdigest() == content_hash:
+                return content_hash
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(f'{target}.tmp', 'wb') as f:
+        f.write(html)
+    os.replace(f'{target}.tmp', target)
+    return content_hash
+
+
+def remove_page(root, path):
+    """Remove the file of a page that no longer exists, and its empty directories."""
+    target = output_path(root, path)
+    try:
+        os.remove(target)
+    except FileNotFoundError:
+        pass
+    directory = os.path.dirname(target)
+    while directory != os.path.normpath(root):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            break
+        directory = os.path.dirname(directory)
+
+
+def prerender(root, paths=None, force=False, workers=None, batch_size=25):
+    """
+    Bring the pages under ``root`` up to date: render pages whose fingerprint
+    changed and remove pages that no longer exist. With ``paths``, only those
+    pages are rendered or removed. Returns (rendered, unchanged, removed, failed).
+    """
+    os.makedirs(root, exist_ok=True)
+    pages = read_manifest(root).get('pages', {})
+    fingerprints = page_fingerprints()
+
+    candidates = set(pages) | set(fingerprints) if paths is None else set(paths)
+    removed = [path for path in candidates if path not in fingerprints]
+    for path in removed:
+        remove_page(root, path)
+        pages.pop(path, None)
+
+    stale = [
+        path for path, fingerprint in fingerprints.items()
+        if path in candidates and (
+            force or paths is not None
+            or pages.get(path, {}).get('inputs') != fingerprint
+            or not os.path.exists(output_path(root, path))
+        )
+    ]
+    batches = [stale[i:i + batch_size] for i in range(0, len(stale), batch_size)]
+
+    failed = []
+
+    def save(results):
+        for path, html in results:
+            if html is None:
+                failed.append(path)
+                remove_page(root, path)
+                pages.pop(path, None)
+            else:
+                pages[path] = {'inputs': fingerprints[path], 'content': write_page(root, path, html)}
+
+    try:
+        if len(batches) <= 1:
+            # Not worth starting a pool for
+            for batch in batches:
+                save(render_pages(batch))
+        else:
+            # Forked workers must open their own database connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, initializer=django.setup) as pool:
+                for results in pool.map(render_pages, batches):
+                    save(results)
+    finally:
+        write_manifest(root, {'pages': pages})
+    return len(stale) - len(failed), len(fingerprints) - len(stale), len(removed), failed
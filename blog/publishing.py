@@ -0,0 +1,50 @@
+"""
+Scheduled publishing.
+
+A post saved as SCHEDULED with a published_at goes live once that time has
+passed: `manage.py publish_scheduled` flips every due post to ACTIVE in one
+bulk UPDATE, found through the (status, published_at) index, and then does
+what the admin's publish action does. Run it from cron, or with ``--loop``
+to sleep until the next post is due.
+
+Due posts are claimed with SKIP LOCKED on PostgreSQL, and the UPDATE only
+touches posts still scheduled, so concurrent runs never publish a post twice.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import invalidate_posts
+from .context_processors import invalidate_sidebar
+from .jobs import enqueue_post_rebuild
+from .models import Post
+from .search import bump_search_index_version
+
+
+def scheduled_posts():
+    return Post.objects.filter(status=Post.SCHEDULED, published_at__isnull=False)
+
+
+def next_due():
+    """When the next scheduled post is due, or None if none is."""
+    return scheduled_posts().order_by('published_at').values_list('published_at', flat=True).first()
+
+
+def publish_due_posts(now=None, batch_size=500):
+    """Publish up to ``batch_size`` posts due by ``now``. Returns their ids."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        post_ids = list(
+            scheduled_posts().select_for_update(skip_locked=True).filter(
+                published_at__lte=now
+            ).order_by('published_at').values_list('pk', flat=True)[:batch_size]
+        )
+        if not post_ids:
+            return []
+        # update() skips auto_now, and the sitemap dates posts by updated_at
+        Post.objects.filter(pk__in=post_ids, status=Post.SCHEDULED).update(status=Post.ACTIVE, updated_at=now)
+        # Queued with the change, so a crash after the commit still rebuilds
+        enqueue_post_rebuild(post_ids, related=True)
+    invalidate_posts(post_ids)
+    invalidate_sidebar()
+    bump_search_index_version()
+    return post_ids
@@ -0,0 +1,228 @@
+"""
+Related-posts index.
+
+Every active post is a TF-IDF weighted, L2-normalised vector over its tags,
+so the tag similarity of two posts is the dot product of their rows. The
+matrix is kept in compressed form both ways: a post's row lists its tags and
+each tag's column is its posting list, an inverted index from tag to posts.
+The neighbours of a post are the sparse product of its row and the matrix
+transpose, which only walks the posting lists of the post's own tags, never
+the posts it shares nothing with. Sharing the category and being recent add
+to the score, and the best RELATED_POSTS_LIMIT neighbours are stored in
+RelatedPost, so rendering a post needs one indexed lookup.
+
+After a change only the neighbourhood of the changed posts is loaded, and
+only the posts whose stored neighbours it can change are recomputed.
+"""
+import math
+
+import numpy as np
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from .cache import invalidate, post_dependency
+from .models import Post, RelatedPost
+
+
+def tagged_posts():
+    return Post.tags.through.objects.filter(content_type=ContentType.objects.get_for_model(Post))
+
+
+class TagMatrix:
+    """
+    Sparse tag matrix of the active posts, or of just the neighbourhood of
+    ``post_ids``: themselves, the posts sharing a tag with them and the
+    newest posts of their categories. Posts are indexed newest first.
+    """
+
+    def __init__(self, post_ids=None):
+        limit = settings.RELATED_POSTS_LIMIT
+        active = Post.objects.filter(status=Post.ACTIVE)
+        tagged = tagged_posts()
+        posts = active
+        if post_ids is not None:
+            post_ids = set(post_ids)
+            sharing = tagged.filter(tag_id__in=tagged.filter(object_id__in=post_ids).values('tag_id'))
+            newest = set()
+            for category_id in set(active.filter(pk__in=post_ids).values_list('category_id', flat=True)):
+                newest.update(active.filter(category_id=category_id).order_by(
+                    '-created_at'
+                ).values_list('pk', flat=True)[:limit + 1])
+            posts = active.filter(Q(pk__in=post_ids) | Q(pk__in=sharing.values('object_id')) | Q(pk__in=newest))
+
+        ids, categories, created = [], [], []
+        self.by_category = {}
+        rows = posts.order_by('-created_at').values_list('id', 'category_id', 'created_at')
+        for i, (post_id, category_id, created_at) in enumerate(rows.iterator(chunk_size=2000)):
+            ids.append(post_id)
+            categories.append(category_id)
+            created.append(created_at.timestamp())
+            self.by_category.setdefault(category_id, []).append(i)
+        self.ids = np.array(ids, dtype=np.int64)
+        self.category = np.array(categories, dtype=np.int64)
+        self.created = np.array(created, dtype=np.float64)
+        self.index = {post_id: i for i, post_id in enumerate(ids)}
+
+        pairs = tagged.filter(object_id__in=posts.values('pk')).values_list('object_id', 'tag_id')
+        post_index, tag_ids = [], []
+        for post_id, tag_id in pairs.iterator(chunk_size=5000):
+            if post_id in self.index:
+                post_index.append(self.index[post_id])
+                tag_ids.append(tag_id)
+        post_index = np.array(post_index, dtype=np.intp)
+        tags, columns = np.unique(np.array(tag_ids, dtype=np.int64), return_inverse=True)
+        columns = columns.reshape(-1)
+
+        # Smoothed inverse document frequency over every active post, so rare tags count for more
+        if post_ids is None:
+            total = len(ids)
+            frequency = np.bincount(columns, minlength=len(tags))
+        else:
+            total = active.count()
+            counts = dict(tagged.filter(
+                tag_id__in=tags.tolist(), object_id__in=active.values('pk')
+            ).values('tag_id').annotate(frequency=Count('pk')).values_list('tag_id', 'frequency'))
+            frequency = np.array([counts.get(tag_id, 0) for tag_id in tags.tolist()], dtype=np.float64)
+        idf = np.log((1 + total) / (1 + frequency)) + 1
+        weights = idf[columns]
+        norms = np.sqrt(np.bincount(post_index, weights ** 2, minlength=len(ids)))
+        weights /= norms[post_index]
+
+        by_post = np.argsort(post_index, kind='stable')
+        self.row_ptr = np.concatenate(([0], np.cumsum(np.bincount(post_index, minlength=len(ids)))))
+        self.row_columns = columns[by_post]
+        self.row_weights = weights[by_post]
+        by_tag = np.argsort(columns, kind='stable')
+        self.column_ptr = np.concatenate(([0], np.cumsum(np.bincount(columns, minlength=len(tags)))))
+        self.column_posts = post_index[by_tag]
+        self.column_weights = weights[by_tag]
+
+    def recency(self, indices, now):
+        age_days = (now.timestamp() - self.created[indices]) / 86400
+        return 0.5 ** (np.maximum(age_days, 0) / settings.RELATED_POSTS_HALF_LIFE_DAYS)
+
+    def similarities(self, i, limit):
+        """
+        Tag similarity of post ``i`` to the posts sharing a tag with it, and
+        to the ``limit + 1`` newest of its category, which are candidates
+        even without shared tags. Returns (indices, similarities).
+        """
+        candidates = [np.array(self.by_category[self.category[i]][:limit + 1], dtype=np.intp)]
+        products = [np.zeros(len(candidates[0]))]
+        start, end = self.row_ptr[i], self.row_ptr[i + 1]
+        for column, weight in zip(self.row_columns[start:end], self.row_weights[start:end]):
+            postings = slice(self.column_ptr[column], self.column_ptr[column + 1])
+            candidates.append(self.column_posts[postings])
+            products.append(self.column_weights[postings] * weight)
+        candidates, inverse = np.unique(np.concatenate(candidates), return_inverse=True)
+        similarity = np.bincount(inverse.reshape(-1), np.concatenate(products), minlength=len(candidates))
+        others = candidates != i
+        return candidates[others], similarity[others]
+
+    def neighbours(self, post_id, limit, now=None):
+        """Return the ``limit`` best (post_id, score) pairs for ``post_id``."""
+        now = now or timezone.now()
+        i = self.index[post_id]
+        candidates, scores = self.similarities(i, limit)
+        scores += settings.RELATED_POSTS_CATEGORY_WEIGHT * (self.category[candidates] == self.category[i])
+        scores += settings.RELATED_POSTS_RECENCY_WEIGHT * self.recency(candidates, now)
+        best = np.lexsort((self.created[candidates], scores))[::-1][:limit]
+        return [(int(self.ids[candidates[j]]), float(scores[j])) for j in best]
+
+
+def rebuild_related_posts(post_ids=None):
+    """
+    Recompute the stored neighbours of ``post_ids``, or of every post.
+    Returns the number of posts indexed.
+    """
+    matrix = TagMatrix(post_ids)
+    limit = settings.RELATED_POSTS_LIMIT
+    now = timezone.now()
+    targets = matrix.index.keys() if post_ids is None else [
+        post_id for post_id in set(post_ids) if post_id in matrix.index
+    ]
+
+    entries = []
+    for post_id in targets:
+        for rank, (related_id, score) in enumerate(matrix.neighbours(post_id, limit, now), 1):
+            entries.append(RelatedPost(post_id=post_id, related_id=related_id, score=score, rank=rank))
+
+    with transaction.atomic():
+        stale = RelatedPost.objects.all()
+        if post_ids is not None:
+            stale = stale.filter(post_id__in=set(post_ids))
+        stale.delete()
+        RelatedPost.objects.bulk_create(entries, batch_size=1000)
+    return len(targets)
+
+
+def weakest_neighbours(post_ids, limit):
+    """The lowest stored score of each post, or -inf for posts with room for another neighbour."""
+    stored = RelatedPost.objects.filter(post_id__in=post_ids).values('post_id').annotate(
+        entries=Count('pk'), weakest=Min('score'),
+    )
+    return {row['post_id']: row['weakest'] if row['entries'] >= limit else -math.inf for row in stored}
+
+
+def affected_posts(post_ids):
+    """
+    Posts whose neighbours can change when ``post_ids``' tags, category or
+    status change: the changed posts, the posts listing them, and the posts
+    for which a changed post now outscores the weakest stored neighbour.
+    """
+    limit = settings.RELATED_POSTS_LIMIT
+    category_weight = settings.RELATED_POSTS_CATEGORY_WEIGHT
+    now = timezone.now()
+    post_ids = set(post_ids)
+    affected = set(post_ids)
+    affected.update(RelatedPost.objects.filter(related_id__in=post_ids).values_list('post_id', flat=True))
+
+    matrix = TagMatrix(post_ids)
+    for post_id in post_ids & matrix.index.keys():
+        i = matrix.index[post_id]
+        recency = settings.RELATED_POSTS_RECENCY_WEIGHT * float(matrix.recency(i, now))
+        candidates, scores = matrix.similarities(i, limit)
+        scores += category_weight * (matrix.category[candidates] == matrix.category[i]) + recency
+        candidate_ids = matrix.ids[candidates].tolist()
+        weakest = weakest_neighbours(candidate_ids, limit)
+        affected.update(
+            candidate_id for candidate_id, score in zip(candidate_ids, scores.tolist())
+            if score > weakest.get(candidate_id, -math.inf)
+        )
+        # The rest of the category scores it by the category and its recency alone
+        affected.update(Post.objects.filter(
+            status=Post.ACTIVE, category_id=int(matrix.category[i]),
+        ).exclude(pk=post_id).annotate(
+            entries=Count('related_entries'), weakest=Min('related_entries__score'),
+        ).filter(
+            Q(entries__lt=limit) | Q(weakest__lt=category_weight + recency)
+        ).values_list('pk', flat=True))
+    return affected
+
+
+def refresh_related_posts(post_ids):
+    """
+    Incrementally update the index after the given posts changed. Returns
+    the posts whose neighbours were recomputed.
+    """
+    affected = affected_posts(post_ids)
+    if affected:
+        rebuild_related_posts(affected)
+        invalidate(*[post_dependency(post_id) for post_id in affected])
+    return affected
+
+
+def related_posts(post, limit):
+    """Stored neighbours of ``post``, best first."""
+    entries = RelatedPost.objects.filter(
+        post=post,
+        related__status=Post.ACTIVE,
+    ).select_related(
+        'related__category'
+    ).defer(
+        'related__content', 'related__content_text'
+    ).order_by('rank')[:limit]
+    return [entry.related for entry in entries]
@@ -0,0 +1,299 @@
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, TrigramSimilarity, TrigramWordSimilarity,
+)
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import F, Q, TextField, Value
+from django.db.models.functions import Greatest
+from django.urls import reverse
+from django.utils.http import urlencode
+from django.utils.html import escape, strip_tags
+from django.utils.safestring import mark_safe
+
+from taggit.models import Tag
+
+from .models import Category, Post
+
+SEARCH_INDEX_VERSION_KEY = 'search_index_version'
+
+# Field weights, title > intro > content
+WEIGHTS = (('title', 'A', 3.0), ('intro', 'B', 2.0), ('content_text', 'C', 1.0))
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def use_postgres_search():
+    return connection.vendor == 'postgresql'
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def post_text(post, field):
+    """Plain text of a post field, with the CKEditor HTML stripped."""
+    return strip_tags(getattr(post, field) or '')
+
+
+def search_vector_for(post):
+    """Weighted SearchVector expression built from the post's stripped text."""
+    vector = None
+    for field, weight, _ in WEIGHTS:
+        part = SearchVector(
+            Value(post_text(post, field), output_field=TextField()),
+            weight=weight,
+            config=settings.SEARCH_CONFIG,
+        )
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def update_search_vector(post):
+    """Store the precomputed search vector of a single post."""
+    if use_postgres_search():
+        Post.objects.filter(pk=post.pk).update(search_vector=search_vector_for(post))
+
+
+def bump_search_index_version():
+    """Tell in-process indexes that posts changed and they need rebuilding."""
+    cache.set(SEARCH_INDEX_VERSION_KEY, time.time(), None)
+
+
+class InvertedIndex:
+    """
+    In-process inverted index over active posts, used instead of PostgreSQL
+    full-text search on other databases (SQLite in tests and local dev).
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.postings = defaultdict(dict)
+        self.created_at = {}
+
+        posts = Post.objects.filter(status=Post.ACTIVE).only('id', 'title', 'intro', 'content_text', 'created_at')
+        for post in posts.iterator(chunk_size=200):
+            self.created_at[post.pk] = post.created_at
+            for field, _, weight in WEIGHTS:
+                for term in tokenize(post_text(post, field)):
+                    postings = self.postings[term]
+                    postings[post.pk] = postings.get(post.pk, 0.0) + weight
+
+    def search(self, query):
+        """Return ids of posts containing every query term, best match first."""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        matches = None
+        for term in terms:
+            ids = self.postings.get(term, {}).keys()
+            matches = set(ids) if matches is None else matches & ids
+            if not matches:
+                return []
+
+        total = len(self.created_at)
+        scores = dict.fromkeys(matches, 0.0)
+        for term in terms:
+            postings = self.postings[term]
+            idf = math.log(1 + total / len(postings))
+            for post_id in matches:
+                scores[post_id] += (1 + math.log(postings[post_id])) * idf
+        return sorted(matches, key=lambda post_id: (scores[post_id], self.created_at[post_id]), reverse=True)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_inverted_index():
+    """Return the process-wide inverted index, rebuilding it when posts changed."""
+    global _index
+    version = cache.get(SEARCH_INDEX_VERSION_KEY)
+    index = _index
+    if (
+        index is None
+        or index.version != version
+        or time.monotonic() - index.built_at > settings.SEARCH_INDEX_TTL
+    ):
+        with _index_lock:
+            if _index is index:
+                _index = InvertedIndex(version)
+            index = _index
+    return index
+
+
+def highlight(text, query, words=30):
+    """Return a window of ``text`` around the first query match with terms wrapped in <mark>."""
+    terms = set(tokenize(query))
+    tokens = text.split()
+    start = 0
+    for i, token in enumerate(tokens):
+        if any(term in tokenize(token) for term in terms):
+            start = max(0, i - words // 3)
+            break
+    window = tokens[start:start + words]
+
+    parts = []
+    for token in window:
+        if any(term in tokenize(token) for term in terms):
+            parts.append(f'<mark>{escape(token)}</mark>')
+        else:
+            parts.append(escape(token))
+    snippet = ' '.join(parts)
+    if start > 0:
+        snippet = '&hellip; ' + snippet
+    if start + words < len(tokens):
+        snippet += ' &hellip;'
+    return mark_safe(snippet)
+
+
+def search_posts(query, page_number=1, per_page=10):
+    """
+    Return a page of active posts matching ``query``, ranked by relevance,
+    with a highlighted ``snippet`` set on each post.
+    """
+    if use_postgres_search():
+        search_query = SearchQuery(query, search_type='websearch', config=settings.SEARCH_CONFIG)
+        results = Post.objects.filter(
+            status=Post.ACTIVE,
+            search_vector=search_query,
+        ).select_related(
+            'category'
+        ).defer(
+            'content'
+        ).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-rank', '-created_at')
+    else:
+        results = get_inverted_index().search(query)
+
+    page = Paginator(results[:settings.SEARCH_MAX_RESULTS], per_page).get_page(page_number)
+
+    posts = list(page.object_list)
+    if not use_postgres_search():
+        posts_by_id = Post.objects.select_related('category').defer('content').in_bulk(posts)
+        posts = [posts_by_id[post_id] for post_id in posts if post_id in posts_by_id]
+
+    for post in posts:
+        post.snippet = highlight(post.content_text or post_text(post, 'intro'), query)
+    page.object_list = posts
+    return page
+
+
+def _suggestion(kind, title, url):
+    return {'type': kind, 'title': title, 'url': url}
+
+
+def _tag_url(name):
+    return reverse('blog:search') + '?' + urlencode({'query': name})
+
+
+class PrefixTrie:
+    """
+    Prefix trie over post titles, category titles and tag names. Every node
+    keeps its best ``limit`` suggestions so a lookup is one walk down the trie.
+    """
+
+    def __init__(self, limit, version=None):
+        self.limit = limit
+        self.version = version
+        self.built_at = time.monotonic()
+        self.root = {}
+
+        # Categories first, then tags, then posts newest first
+        for category in Category.objects.only('title', 'slug'):
+            self.insert(category.title, _suggestion('category', category.title, category.get_absolute_url()))
+        for name in Tag.objects.values_list('name', flat=True):
+            self.insert(name, _suggestion('tag', name, _tag_url(name)))
+        posts = Post.objects.filter(
+            status=Post.ACTIVE
+        ).order_by('-created_at').values_list('title', 'slug', 'category__slug')
+        for title, slug, category_slug in posts.iterator(chunk_size=500):
+            self.insert(title, _suggestion('post', title, reverse('blog:post_detail', args=[category_slug, slug])))
+
+    def insert(self, text, suggestion):
+        # Index the text from every word onwards, so "comp" and "quantum c"
+        # both find "The Future of Quantum Computing"
+        words = tokenize(text)
+        keys = {' '.join(words[i:]) for i in range(len(words))}
+        for key in keys:
+            node = self.root
+            for char in key:
+                node = node.setdefault(char, {})
+                items = node.setdefault('', [])
+                if len(items) < self.limit and suggestion not in items:
+                    items.append(suggestion)
+
+    def lookup(self, prefix):
+        node = self.root
+        for char in ' '.join(tokenize(prefix)):
+            node = node.get(char)
+            if node is None:
+                return []
+        return node.get('', [])
+
+
+_trie = None
+_trie_lock = threading.Lock()
+
+
+def get_prefix_trie():
+    """Return the process-wide autocomplete trie, rebuilding it when content changed."""
+    global _trie
+    version = cache.get(SEARCH_INDEX_VERSION_KEY)
+    trie = _trie
+    if (
+        trie is None
+        or trie.version != version
+        or time.monotonic() - trie.built_at > settings.SEARCH_INDEX_TTL
+    ):
+        with _trie_lock:
+            if _trie is trie:
+                _trie = PrefixTrie(settings.AUTOCOMPLETE_LIMIT, version)
+            trie = _trie
+    return trie
+
+
+def suggest(query, limit=None):
+    """Return up to ``limit`` post, category and tag suggestions for a partial query."""
+    limit = limit or settings.AUTOCOMPLETE_LIMIT
+    query = query.strip()
+    if len(query) < 2:
+        return []
+
+    if not use_postgres_search():
+        return get_prefix_trie().lookup(query)[:limit]
+
+    # Trigram similarity (%) tolerates typos in the whole text; word
+    # similarity (%>) matches a partial word, so a prefix typed so far finds
+    # the longer title it starts. Both operators are served by the
+    # gin_trgm_ops indexes on the plain columns, unlike icontains, whose
+    # UPPER(...) LIKE can't use them.
+    def matching(queryset, field):
+        return queryset.filter(
+            Q(**{f'{field}__trigram_similar': query}) | Q(**{f'{field}__trigram_word_similar': query})
+        ).annotate(
+            similarity=Greatest(TrigramSimilarity(field, query), TrigramWordSimilarity(query, field))
+        ).order_by('-similarity')[:limit]
+
+    scored = []
+    for category in matching(Category.objects.only('title', 'slug'), 'title'):
+        scored.append((category.similarity, _suggestion('category', category.title, category.get_absolute_url())))
+    for tag in matching(Tag.objects.only('name'), 'name'):
+        scored.append((tag.similarity, _suggestion('tag', tag.name, _tag_url(tag.name))))
+    posts = matching(Post.objects.filter(status=Post.ACTIVE).select_related('category').only(
+        'title', 'slug', 'category__slug'
+    ), 'title')
+    for post in posts:
+        scored.append((post.similarity, _suggestion('post', post.title, post.get_absolute_url())))
+
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [suggestion for _, suggestion in scored[:limit]]
@@ -0,0 +1,174 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.urls import reverse
+
+from taggit.models import Tag
+
+from .analytics import update_comment_counts
+from .cache import (
+    CATEGORY_LIST, POST_LIST, category_dependency, invalidate, invalidate_posts,
+    post_dependency,
+)
+from .context_processors import invalidate_sidebar
+from .jobs import ALL, enqueue, enqueue_post_rebuild
+from .models import Category, Comment, Post, RebuildJob, RelatedPost
+from .search import bump_search_index_version, update_search_vector
+
+
+def invalidate_post(post):
+    dependencies = [POST_LIST, post_dependency(post.pk), category_dependency(post.category_id)]
+    loaded_category_id = getattr(post, '_loaded_values', {}).get('category_id')
+    if loaded_category_id and loaded_category_id != post.category_id:
+        dependencies.append(category_dependency(loaded_category_id))
+    invalidate(*dependencies)
+
+
+def sidebar_changed(post, created=False):
+    """Whether saving ``post`` changes the active post counts in the sidebar."""
+    loaded = getattr(post, '_loaded_values', None)
+    if created:
+        return post.status == Post.ACTIVE
+    if loaded is None:
+        # Not loaded from the database, so what it was is unknown
+        return True
+    return loaded.get('status') != post.status or loaded.get('category_id') != post.category_id
+
+
+def was_published(post):
+    """Whether ``post`` is published, or was when it was loaded."""
+    loaded = getattr(post, '_loaded_values', {})
+    return Post.ACTIVE in (post.status, loaded.get('status'))
+
+
+def tagged_post_ids(tag):
+    """Ids of the posts tagged with ``tag``."""
+    return set(Post.tags.through.objects.filter(
+        content_type=ContentType.objects.get_for_model(Post), tag_id=tag.pk,
+    ).values_list('object_id', flat=True))
+
+
+def category_pages(category_id, post_slug):
+    """Paths of a post and its category listing, from the category id."""
+    category_slug = Category.objects.filter(pk=category_id).values_list('slug', flat=True).first()
+    if category_slug is None:
+        return []
+    return [Post.url_for(category_slug, post_slug), reverse('blog:category_detail', args=[category_slug])]
+
+
+def previous_pages(post):
+    """Paths ``post`` was published at when it was loaded, if it has moved since."""
+    loaded = getattr(post, '_loaded_values', {})
+    if loaded.get('status') != Post.ACTIVE:
+        return []
+    if (loaded.get('slug'), loaded.get('category_id')) == (post.slug, post.category_id):
+        return []
+    return category_pages(loaded['category_id'], loaded['slug'])
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    update_search_vector(instance)
+    bump_search_index_version()
+    invalidate_post(instance)
+    if sidebar_changed(instance, created):
+        invalidate_sidebar()
+    if was_published(instance):
+        enqueue_post_rebuild(
+            [instance.pk],
+            related=sidebar_changed(instance, created),
+            extra_pages=previous_pages(instance),
+        )
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    # The cascade removes the entries listing it before post_delete
+    instance._listed_by = set(
+        RelatedPost.objects.filter(related_id=instance.pk).values_list('post_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    bump_search_index_version()
+    invalidate_post(instance)
+    listed_by = getattr(instance, '_listed_by', set())
+    if listed_by:
+        # Their pages link to it until their neighbours are recomputed
+        invalidate(*[post_dependency(post_id) for post_id in listed_by])
+        enqueue(RebuildJob.RELATED, listed_by)
+    if instance.status == Post.ACTIVE:
+        invalidate_sidebar()
+        enqueue_post_rebuild(
+            [instance.pk],
+            related=True,
+            extra_pages=category_pages(instance.category_id, instance.slug),
+        )
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def post_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    # Listings show tags and the tag feeds select by them
+    if not reverse:
+        invalidate(POST_LIST, post_dependency(instance.pk))
+        enqueue_post_rebuild([instance.pk], related=True, sitemap=False)
+    elif pk_set:
+        invalidate(POST_LIST, *[post_dependency(post_id) for post_id in pk_set])
+        enqueue_post_rebuild(pk_set, related=True, sitemap=False)
+    else:
+        invalidate(POST_LIST)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    post_ids = {instance.post_id}
+    loaded = getattr(instance, '_loaded_values', None)
+    if loaded and loaded.get('post_id') is not None:
+        post_ids.add(loaded['post_id'])
+    update_comment_counts(post_ids)
+    # Listings show comment counts too
+    invalidate_posts(post_ids)
+    enqueue_post_rebuild(post_ids, sitemap=False)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidate(CATEGORY_LIST, POST_LIST, category_dependency(instance.pk))
+    invalidate_sidebar()
+    # A new slug changes the URL of every post in the category
+    enqueue(RebuildJob.SITEMAP, [ALL])
+    enqueue(RebuildJob.PAGE, [ALL])
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleting(sender, instance, **kwargs):
+    # The cascade removes its tagged items before post_delete
+    instance._tagged_posts = tagged_post_ids(instance)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def suggestion_source_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    bump_search_index_version()
+    if sender is Tag:
+        # Tag names are shown on post pages and listings
+        post_ids = getattr(instance, '_tagged_posts', None)
+        if post_ids is None:
+            post_ids = tagged_post_ids(instance)
+        invalidate(POST_LIST, *[post_dependency(post_id) for post_id in post_ids])
+        enqueue(RebuildJob.PAGE, [ALL])
@@ -1,16 +1,195 @@
-from django.contrib.sitemaps import Sitemap
-from .models import Post, Category
-from django.shortcuts import reverse
-
-
-class CategorySitemap(Sitemap):
-    def items(self):
-        return Category.objects.all()
-    
-    
-class PostSitemap(Sitemap):
-    def items(self):
-        return Post.objects.filter(status=Post.ACTIVE)
-
-    def lastmod(self, obj):
-        return obj.created_at
\ No newline at end of file
+"""
+Sitemap files, prebuilt into storage.
+
+The sitemap is an index (``sitemap.xml``) pointing at one file for the
+categories and one per shard of posts. A post's shard is fixed by its id,
+``SITEMAP_SHARD_SIZE`` ids per shard, so a change to a post rewrites only
+its shard and the index, and no shard ever goes over the 50,000 URLs allowed
+in one file. Shards are streamed from a values_list query with the category
+slug joined in, so building one runs a single query however many posts it
+holds.
+
+Files are rebuilt by rebuild jobs queued when posts change (blog.jobs), and
+by `manage.py build_sitemaps`; serving one is a storage read. They live in
+the 'sitemaps' storage, which replaces a file in place when it's rebuilt.
+"""
+import logging
+import tempfile
+from datetime import timezone
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import storages
+from django.db.models import F, Max, Q
+
+from .cache import invalidate, set_with_dependencies
+from .models import Category, Post
+
+logger = logging.getLogger(__name__)
+
+# Dependency of the served sitemap files, invalidated whenever they're rebuilt
+SITEMAP = 'sitemap'
+
+INDEX = 'sitemap'
+CATEGORIES = 'categories'
+
+# Sections built for a request while their file can't be read
+FALLBACK_KEY = 'sitemap-fallback:{}'
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+URLSET_OPEN = XML_HEADER + '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+URLSET_CLOSE = '</urlset>\n'
+INDEX_OPEN = XML_HEADER + '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+INDEX_CLOSE = '</sitemapindex>\n'
+
+
+def shard_for(post_id):
+    return (post_id - 1) // settings.SITEMAP_SHARD_SIZE
+
+
+def posts_section(shard):
+    return f'posts-{shard}'
+
+
+def _filename(section):
+    return 'sitemap.xml' if section == INDEX else f'sitemap-{section}.xml'
+
+
+def section_path(section):
+    """Storage path of a sitemap file; the index is section 'sitemap'."""
+    return f'{settings.SITEMAP_STORAGE_PATH}/{_filename(section)}'
+
+
+def section_url(section):
+    return f'{settings.SITE_URL}/{_filename(section)}'
+
+
+def _lastmod(value):
+    return value.astimezone(timezone.utc).isoformat(timespec='seconds')
+
+
+def _entry(tag, loc, lastmod):
+    lastmod = f'<lastmod>{_lastmod(lastmod)}</lastmod>' if lastmod else ''
+    return f'<{tag}><loc>{escape(loc)}</loc>{lastmod}</{tag}>\n'
+
+
+def post_shard_lines(shard):
+    """Yield the XML of a shard of posts."""
+    size = settings.SITEMAP_SHARD_SIZE
+    rows = Post.objects.filter(
+        status=Post.ACTIVE, pk__gt=shard * size, pk__lte=(shard + 1) * size
+    ).order_by('pk').values_list('category__slug', 'slug', 'updated_at')
+    yield URLSET_OPEN
+    for category_slug, slug, updated_at in rows.iterator(chunk_size=2000):
+        yield _entry('url', settings.SITE_URL + Post.url_for(category_slug, slug), updated_at)
+    yield URLSET_CLOSE
+
+
+def category_lines():
+    """Yield the XML of the categories, dated by their latest post change."""
+    categories = Category.objects.annotate(
+        lastmod=Max('posts__updated_at', filter=Q(posts__status=Post.ACTIVE))
+    ).only('slug').order_by('title')
+    yield URLSET_OPEN
+    for category in categories:
+        yield _entry('url', settings.SITE_URL + category.get_absolute_url(), category.lastmod)
+    yield URLSET_CLOSE
+
+
+def post_shards():
+    """{shard: latest change} of every shard holding an active post."""
+    return dict(
+        Post.objects.filter(status=Post.ACTIVE).annotate(
+            shard=(F('pk') - 1) / settings.SITEMAP_SHARD_SIZE
+        ).values_list('shard').annotate(lastmod=Max('updated_at')).order_by('shard')
+    )
+
+
+def index_lines(shards):
+    yield INDEX_OPEN
+    yield _entry('sitemap', section_url(CATEGORIES), max(shards.values(), default=None))
+    for shard, lastmod in sorted(shards.items()):
+        yield _entry('sitemap', section_url(posts_section(shard)), lastmod)
+    yield INDEX_CLOSE
+
+
+def write_section(section, lines):
+    """Write a sitemap file to storage, spooling it to disk if it gets large."""
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as f:
+        for line in lines:
+            f.write(line.encode('utf-8'))
+        f.seek(0)
+        storages['sitemaps'].save(section_path(section), File(f, name=_filename(section)))
+
+
+def section_lines(section):
+    """Lines of a sitemap section, or None if there is no such section."""
+    if section == INDEX:
+        return index_lines(post_shards())
+    if section == CATEGORIES:
+        return category_lines()
+    prefix, _, shard = section.partition('-')
+    if prefix == 'posts' and shard.isdigit():
+        return post_shard_lines(int(shard))
+    return None
+
+
+def read_section(section):
+    """
+    Content of a sitemap file, or None if there is no such section. A file
+    missing from storage is built for the request, only build_sitemaps()
+    writes files. What is built is cached for SITEMAP_FALLBACK_TIMEOUT, so
+    while storage is down crawlers don't each cost a query.
+    """
+    path = section_path(section)
+    try:
+        with storages['sitemaps'].open(path) as f:
+            return f.read()
+    except FileNotFoundError:
+        logger.info("Sitemap file %s isn't built yet, building it for the request", path)
+    except OSError:
+        logger.warning("Could not read sitemap file %s, building it for the request", path, exc_info=True)
+    key = FALLBACK_KEY.format(section)
+    content = cache.get(key)
+    if content is None:
+        content = build_section(section)
+        # Cached as b'' when there's no such section
+        set_with_dependencies(key, content or b'', settings.SITEMAP_FALLBACK_TIMEOUT, [SITEMAP])
+    return content or None
+
+
+def build_section(section):
+    """Content of a sitemap file built from the database, or None if there is no such section."""
+    lines = section_lines(section)
+    if lines is None:
+        return None
+    content = ''.join(lines)
+    if section not in (INDEX, CATEGORIES) and '<url>' not in content:
+        return None
+    return content.encode('utf-8')
+
+
+def build_sitemaps(shards=None):
+    """
+    Rebuild the given post shards (all of them by default), the categories
+    and the index. Returns the rebuilt post shards.
+    """
+    current = post_shards()
+    rebuild = set(current) if shards is None else set(shards)
+    for shard in sorted(rebuild):
+        if shard in current:
+            write_section(posts_section(shard), post_shard_lines(shard))
+        else:
+            # Its last active post is gone
+            storages['sitemaps'].delete(section_path(posts_section(shard)))
+    write_section(CATEGORIES, category_lines())
+    write_section(INDEX, index_lines(current))
+    invalidate(SITEMAP)
+    return rebuild
+
+
+def sitemap_dependencies(request, **kwargs):
+    """What the sitemap is built from, for its conditional GET validators."""
+    return [SITEMAP]
@@ -1,8 +1,12 @@
 from django import template
+from django.conf import settings
+from django.core.cache import cache
 from django.utils.safestring import mark_safe
 import json
 from datetime import datetime
 
+from ..cache import category_dependency, fragment_key, object_dependency, set_with_dependencies
+
 register = template.Library()
 
 @register.filter(is_safe=True)
@@ -63,3 +67,42 @@ def meta_tags(post=None, category=None):
         ])
     
     return mark_safe('\n'.join(tags))
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist, name, obj):
+        self.nodelist = nodelist
+        self.name = name
+        self.obj = obj
+
+    def render(self, context):
+        obj = self.obj.resolve(context)
+        key = fragment_key(self.name.resolve(context), obj)
+        content = cache.get(key)
+        if content is None:
+            content = self.nodelist.render(context)
+            dependency = object_dependency(obj)
+            dependencies = [dependency] if dependency else []
+            if getattr(obj, 'category_id', None):
+                # Posts show their category's title, which their key doesn't follow
+                dependencies.append(category_dependency(obj.category_id))
+            set_with_dependencies(key, content, settings.FRAGMENT_CACHE_TIMEOUT, dependencies)
+        return content
+
+@register.tag
+def cache_fragment(parser, token):
+    """
+    Cache the enclosed block per object version:
+
+        {% cache_fragment "body" post %}...{% endcache_fragment %}
+
+    The key includes the object's updated_at, and the entry is also dropped
+    when the object's cache dependency, or a post's category dependency, is
+    invalidated (e.g. its tags change or its category is renamed).
+    Keep per-visitor output such as forms and messages outside the block.
+    """
+    bits = token.split_contents()
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' takes a fragment name and an object")
+    nodelist = parser.parse(('endcache_fragment',))
+    parser.delete_first_token()
+    return FragmentCacheNode(nodelist, parser.compile_filter(bits[1]), parser.compile_filter(bits[2]))
@@ -1,3 +1,1230 @@
-from django.test import TestCase
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ElementTree
+from datetime import timedelta
+from importlib import import_module
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.files.storage import storages
+from django.core.management import call_command
+from django.core.signals import request_finished
+from django.db import DatabaseError, connection
+from django.template import Context, Engine, engines
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from taggit.models import Tag
+
+from pandastories import warmup
+from pandastories.cache_backends import ZLIB_MARKER, CompressedRedisSerializer
+
+from .analytics import compact_post_views, merge_rollups, popular_posts, rollup_post_views
+from . import cache as blog_cache
+from .cache import (
+    POST_LIST, cached_value, category_dependency, get_or_compute, invalidate, post_dependency,
+    register_dependencies, set_with_dependencies, shared_cache,
+)
+from .context_processors import sidebar_categories
+from .jobs import enqueue, process_jobs
+from .embeddings import CURRENT_FILE, build_embeddings, current_build, get_embedding_index, similar_posts
+from .models import (
+    Category, Comment, Post, PostView, PostViewRollup, RebuildJob, RelatedPost, SavedPost, sentiment_label,
+)
+from .pagination import CursorPaginator
+from .publishing import next_due, publish_due_posts
+from .prerender import output_path, prerender, read_manifest
+from .recommendations import TagMatrix, rebuild_related_posts, refresh_related_posts
+from .sitemaps import build_sitemaps, read_section
+from .search import InvertedIndex, highlight, search_posts, suggest
+from .tracking import CacheViewBuffer, ViewBuffer, VIEW_COUNTER_KEY, current_hour, flush_due_views
+from .utils import recommend_posts
+
+
+def create_post(category=None, **kwargs):
+    """Create an active post, with its category unless one is given."""
+    if category is None:
+        category = Category.objects.create(title=kwargs.pop('category_title', 'Testing'))
+    title = kwargs.pop('title', f'Post {Post.objects.count() + 1}')
+    kwargs.setdefault('status', Post.ACTIVE)
+    return Post.objects.create(category=category, title=title, **kwargs)
+
+
+class CacheTestCase(TestCase):
+    """Test case starting from an empty cache, which outlives test transactions."""
+
+    def setUp(self):
+        cache.clear()
+        shared_cache().clear()
+        # Views recorded by requests stay in a buffer of the test's own
+        buffer = mock.patch('blog.tracking._buffer', ViewBuffer(max_size=10000, flush_interval=3600))
+        buffer.start()
+        self.addCleanup(buffer.stop)
+
+
+class ViewBufferTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.post = create_post()
+        self.buffer = ViewBuffer(max_size=100, flush_interval=3600)
+
+    def test_flush_writes_each_distinct_hit_once(self):
+        self.buffer.record(self.post.pk, 'session', '10.0.0.1')
+        self.buffer.record(self.post.pk, 'session', '10.0.0.1')
+        self.buffer.record(self.post.pk, None, '10.0.0.2')
+
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(PostView.objects.filter(post=self.post).count(), 2)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views_count, 2)
+
+    def test_hits_already_in_the_database_are_skipped(self):
+        self.buffer.record(self.post.pk, 'session', '10.0.0.1')
+        self.buffer.flush()
+
+        # A fresh process doesn't know the hit, the database does
+        other = ViewBuffer(max_size=100, flush_interval=3600)
+        other.record(self.post.pk, 'session', '10.0.0.1')
+        self.assertEqual(other.flush(), 0)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views_count, 1)
+
+    def test_full_buffer_waits_for_the_request_to_finish(self):
+        buffer = ViewBuffer(max_size=1, flush_interval=3600)
+        buffer.record(self.post.pk, 'session', '10.0.0.1')
+        self.assertEqual(PostView.objects.count(), 0)
+
+        with mock.patch('blog.tracking._buffer', buffer):
+            flush_due_views(sender=None)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(PostView.objects.filter(post=self.post).count(), 1)
+
+    def test_buffer_is_kept_until_it_is_due(self):
+        buffer = ViewBuffer(max_size=100, flush_interval=3600)
+        buffer.record(self.post.pk, 'session', '10.0.0.1')
+        with mock.patch('blog.tracking._buffer', buffer):
+            flush_due_views(sender=None)
+        self.assertEqual(len(buffer), 1)
+
+
+@override_settings(POST_VIEW_DEDUPE_DAYS=30)
+class CacheViewBufferTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.post = create_post()
+
+    def test_record_counts_distinct_visitors_across_processes(self):
+        first, second = CacheViewBuffer(), CacheViewBuffer()
+        first.record(self.post.pk, 'session', '10.0.0.1')
+        second.record(self.post.pk, 'session', '10.0.0.1')
+        second.record(self.post.pk, None, '10.0.0.2')
+
+        self.assertEqual(shared_cache().get(VIEW_COUNTER_KEY.format(self.post.pk, current_hour())), 2)
+
+    def test_flush_moves_counters_into_views_count_and_rollups(self):
+        buffer = CacheViewBuffer()
+        buffer.record(self.post.pk, 'a', '10.0.0.1')
+        buffer.record(self.post.pk, 'b', '10.0.0.1')
+
+        self.assertEqual(buffer.flush(), 2)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views_count, 2)
+        self.assertFalse(PostView.objects.exists())
+        rollups = dict(PostViewRollup.objects.filter(post=self.post).values_list('period', 'views'))
+        self.assertEqual(rollups, {PostViewRollup.HOUR: 2, PostViewRollup.DAY: 2})
+        self.assertEqual(shared_cache().get(VIEW_COUNTER_KEY.format(self.post.pk, current_hour())), 0)
+
+        # Nothing is counted twice
+        self.assertEqual(buffer.flush(), 0)
+        buffer.record(self.post.pk, 'c', '10.0.0.1')
+        self.assertEqual(buffer.flush(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views_count, 3)
+
+    def test_recording_never_flushes(self):
+        buffer = CacheViewBuffer(max_size=1, flush_interval=0)
+        with mock.patch.object(buffer, 'flush') as flush:
+            buffer.record(self.post.pk, 'a', '10.0.0.1')
+        flush.assert_not_called()
+
+    def test_failed_write_keeps_the_counts(self):
+        buffer = CacheViewBuffer()
+        buffer.record(self.post.pk, 'a', '10.0.0.1')
+        with self.assertLogs('blog.tracking', 'ERROR'), \
+                mock.patch('blog.tracking.write_view_counts', side_effect=RuntimeError):
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(buffer.flush(), 1)
+
+
+class RollupTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.post = create_post()
+
+    def view(self, age, session_key='session'):
+        view = PostView.objects.create(post=self.post, session_key=session_key, ip_address='10.0.0.1')
+        PostView.objects.filter(pk=view.pk).update(created_at=timezone.now() - age)
+        return view
+
+    def rollup_views(self, period):
+        return sum(PostViewRollup.objects.filter(post=self.post, period=period).values_list('views', flat=True))
+
+    def test_rollup_counts_each_view_once(self):
+        self.view(timedelta(hours=3), 'a')
+        self.view(timedelta(hours=2), 'b')
+
+        self.assertEqual(rollup_post_views(lag=60), 2)
+        self.assertEqual(rollup_post_views(lag=60), 0)
+        self.assertEqual(self.rollup_views(PostViewRollup.HOUR), 2)
+        self.assertEqual(self.rollup_views(PostViewRollup.DAY), 2)
+
+    def test_views_committed_late_are_not_skipped(self):
+        self.view(timedelta(hours=1), 'a')
+        recent = self.view(timedelta(seconds=10), 'b')
+        self.assertEqual(rollup_post_views(lag=60), 1)
+
+        # A flush that committed after the run, with a higher id but an earlier time
+        late = self.view(timedelta(seconds=30), 'c')
+        self.assertGreater(late.pk, recent.pk)
+        self.assertEqual(rollup_post_views(lag=0), 2)
+        self.assertEqual(self.rollup_views(PostViewRollup.DAY), 3)
+
+    @override_settings(POST_VIEW_DEDUPE_DAYS=30)
+    def test_compaction_keeps_the_dedupe_window(self):
+        self.view(timedelta(days=40), 'old')
+        self.view(timedelta(days=10), 'recent')
+        rollup_post_views(lag=0)
+
+        self.assertEqual(compact_post_views(retention_days=1), 1)
+        self.assertTrue(PostView.objects.filter(session_key='recent').exists())
+
+        # The surviving row still dedupes its visitor
+        buffer = ViewBuffer()
+        buffer.record(self.post.pk, 'recent', '10.0.0.1')
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_compaction_keeps_views_not_rolled_up(self):
+        self.view(timedelta(days=40))
+        self.assertEqual(compact_post_views(retention_days=1), 0)
+
+    def test_popular_posts_cover_whole_days(self):
+        other = create_post(self.post.category)
+        start_of_window = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=6)
+        PostViewRollup.objects.create(post=self.post, period=PostViewRollup.DAY, bucket=start_of_window, views=5)
+        PostViewRollup.objects.create(
+            post=other, period=PostViewRollup.DAY, bucket=start_of_window - timedelta(days=1), views=50,
+        )
+
+        self.assertEqual([post.recent_views for post in popular_posts(days=7)], [5])
+
+
+class SearchTests(CacheTestCase):
+    """The in-process ranking used without PostgreSQL."""
+
+    def setUp(self):
+        super().setUp()
+        self.in_body = create_post(title='Notes on gardening', content='<p>Python shows up once here.</p>')
+        self.category = self.in_body.category
+        self.in_title = create_post(self.category, title='Python packaging', content='<p>All about wheels.</p>')
+        self.draft = create_post(self.category, title='Python drafts', status=Post.DRAFT)
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(InvertedIndex().search('python'), [self.in_title.pk, self.in_body.pk])
+
+    def test_every_term_must_match(self):
+        self.assertEqual(InvertedIndex().search('python wheels'), [self.in_title.pk])
+        self.assertEqual(InvertedIndex().search('python cobol'), [])
+
+    def test_results_are_paginated_with_snippets(self):
+        page = search_posts('python', per_page=1)
+        self.assertEqual(page.paginator.count, 2)
+        self.assertEqual(list(page.object_list), [self.in_title])
+        self.assertNotIn(self.draft, search_posts('python').object_list)
+        snippet = search_posts('python', page_number=2, per_page=1).object_list[0].snippet
+        self.assertEqual(snippet, '<mark>Python</mark> shows up once here.')
+
+    def test_highlight_escapes_the_text(self):
+        self.assertEqual(highlight('<b>python</b> rocks', 'rocks'), '&lt;b&gt;python&lt;/b&gt; <mark>rocks</mark>')
+
+    def test_index_is_rebuilt_when_posts_change(self):
+        self.assertEqual(search_posts('kubernetes').paginator.count, 0)
+        create_post(self.category, title='Kubernetes in anger')
+        self.assertEqual(search_posts('kubernetes').paginator.count, 1)
+
+    def test_search_view(self):
+        response = self.client.get(reverse('blog:search'), {'query': 'packaging'}, secure=True)
+        self.assertContains(response, 'Python packaging')
+        self.assertNotContains(response, 'Notes on gardening')
+
+
+class SuggestTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(title='Quantum Physics')
+        self.post = create_post(self.category, title='The Future of Quantum Computing')
+        self.post.tags.add('computers')
+
+    def titles(self, query):
+        return [(item['type'], item['title']) for item in suggest(query)]
+
+    def test_prefixes_of_any_word_match(self):
+        self.assertIn(('post', 'The Future of Quantum Computing'), self.titles('comp'))
+        self.assertIn(('post', 'The Future of Quantum Computing'), self.titles('quantum c'))
+
+    def test_categories_and_tags_are_suggested(self):
+        self.assertIn(('category', 'Quantum Physics'), self.titles('quan'))
+        self.assertIn(('tag', 'computers'), self.titles('compu'))
+
+    def test_short_queries_suggest_nothing(self):
+        self.assertEqual(suggest('q'), [])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Trigram matching needs PostgreSQL')
+    def test_typos_are_tolerated(self):
+        self.assertIn(('post', 'The Future of Quantum Computing'), self.titles('quantim computng'))
+
+    def test_suggest_view(self):
+        response = self.client.get(reverse('blog:search_suggest'), {'q': 'future'}, secure=True)
+        self.assertEqual(response.json()['results'][0]['url'], self.post.get_absolute_url())
+
+    @skipUnless(connection.vendor == 'postgresql', 'Search vectors need PostgreSQL')
+    def test_migration_backfills_search_vectors(self):
+        post = create_post(title='Migrated pandas')
+        Post.objects.filter(pk=post.pk).update(search_vector=None)
+
+        migration = import_module('blog.migrations.0015_backfill_search_vectors')
+        migration.backfill_search_vectors(apps, None)
+
+        self.assertEqual(search_posts('pandas').object_list[0], post)
+
+
+class TextStatsTests(TestCase):
+    def test_save_stores_plain_text_and_reading_time(self):
+        post = create_post(content='<p>' + 'word ' * 500 + '</p>')
+        self.assertEqual(post.content_text.split()[0], 'word')
+        self.assertNotIn('<p>', post.content_text)
+        self.assertEqual(post.word_count, 500)
+        self.assertEqual(post.reading_time, 2)
+
+    def test_short_posts_take_a_minute(self):
+        self.assertEqual(create_post(content='<p>Short</p>').reading_time, 1)
+
+    def test_migration_backfills_existing_posts(self):
+        post = create_post(content='<p>' + 'word ' * 1000 + '</p>')
+        Post.objects.filter(pk=post.pk).update(content_text='', word_count=0, reading_time=1)
+
+        migration = import_module('blog.migrations.0013_backfill_post_text_stats')
+        migration.backfill_text_stats(apps, None)
+
+        post.refresh_from_db()
+        self.assertEqual((post.word_count, post.reading_time), (1000, 5))
+
+
+class DependencyTests(CacheTestCase):
+    def cached(self, key, *dependencies):
+        set_with_dependencies(key, 'value', 60, dependencies)
+
+    def test_invalidate_deletes_only_dependent_entries(self):
+        self.cached('a', 'post:1')
+        self.cached('b', 'post:1', 'post-list')
+        self.cached('c', 'post:2')
+
+        invalidate('post:1')
+        self.assertEqual(cache.get_many(['a', 'b', 'c']), {'c': 'value'})
+
+        # Later registrations start a new list
+        self.cached('d', 'post:1')
+        invalidate('post:1')
+        self.assertIsNone(cache.get('d'))
+
+    def test_registration_racing_an_invalidation_drops_the_entry(self):
+        incr_counter = blog_cache.incr_counter
+
+        def invalidate_meanwhile(key, *args, **kwargs):
+            result = incr_counter(key, *args, **kwargs)
+            if key.endswith(':count'):
+                invalidate('post:1')
+            return result
+
+        cache.set('page', 'stale', 60)
+        with mock.patch('blog.cache.incr_counter', side_effect=invalidate_meanwhile):
+            register_dependencies('page', ['post:1'], 60)
+        self.assertIsNone(cache.get('page'))
+
+    @override_settings(CACHE_DEPENDENCY_MAX_ENTRIES=2)
+    def test_entries_past_the_cap_are_not_kept(self):
+        for key in ('a', 'b', 'c'):
+            self.cached(key, 'post-list')
+        self.assertEqual(sorted(cache.get_many(['a', 'b', 'c'])), ['a', 'b'])
+
+        invalidate('post-list')
+        self.assertEqual(cache.get_many(['a', 'b']), {})
+
+    def test_comments_purge_listings_showing_their_count(self):
+        post = create_post()
+        self.cached('frontpage', POST_LIST)
+        self.cached('category', category_dependency(post.category_id))
+        self.cached('post', post_dependency(post.pk))
+
+        Comment.objects.create(post=post, name='Reader', email='reader@example.com', contents='Nice')
+        self.assertEqual(cache.get_many(['frontpage', 'category', 'post']), {})
+        post.refresh_from_db()
+        self.assertEqual(post.approved_comment_count, 1)
+
+    def test_post_changes_purge_both_categories(self):
+        post = create_post()
+        other = Category.objects.create(title='Other')
+        self.cached('old', category_dependency(post.category_id))
+        self.cached('new', category_dependency(other.pk))
+
+        post = Post.objects.get(pk=post.pk)
+        post.category = other
+        post.save()
+        self.assertEqual(cache.get_many(['old', 'new']), {})
+
+    def test_cached_pages_are_short_lived_in_browsers(self):
+        category = create_post().category
+        url = reverse('blog:category_detail', args=[category.slug])
+        self.client.cookies['csrftoken'] = 'a' * 32
+        response = self.client.get(url, secure=True)
+        self.assertIn(f'max-age={settings.CACHE_MIDDLEWARE_BROWSER_MAX_AGE}', response['Cache-Control'])
+
+        # The page cache keeps it until a purge
+        Category.objects.filter(pk=category.pk).update(title='Renamed without signals')
+        self.assertNotIn('Renamed without signals', self.client.get(url, secure=True).content.decode())
+        invalidate(category_dependency(category.pk))
+        self.assertIn('Renamed without signals', self.client.get(url, secure=True).content.decode())
+
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+def fake_redis_caches():
+    """The tiered profile from settings, with the shared tier on fakeredis."""
+    return {
+        'default': {
+            'BACKEND': 'pandastories.cache_backends.TieredCache',
+            'OPTIONS': {'L1': 'local', 'L2': 'shared', 'L1_TIMEOUT': 30},
+        },
+        'local': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'tiered-tests',
+        },
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': 'redis://fakeredis:6379/0',
+            'OPTIONS': {
+                'serializer': 'pandastories.cache_backends.CompressedRedisSerializer',
+                'connection_class': fakeredis.FakeConnection if fakeredis else None,
+            },
+        },
+    }
+
+
+@skipUnless(fakeredis, 'fakeredis is not installed')
+@override_settings(CACHES=fake_redis_caches(), CACHE_COMPRESS_THRESHOLD=1024)
+class TieredCacheTests(TestCase):
+    def setUp(self):
+        self.tiered, self.l1, self.l2 = caches['default'], caches['local'], caches['shared']
+        self.l1.clear()
+        self.l2.clear()
+
+    def test_writes_go_to_both_tiers(self):
+        self.tiered.set('key', 'value', 300)
+        self.assertEqual(self.l1.get('key'), 'value')
+        self.assertEqual(self.l2.get('key'), 'value')
+
+    def test_l1_misses_read_through_to_l2(self):
+        self.l2.set('key', 'from another process')
+        self.assertIsNone(self.l1.get('key'))
+        self.assertEqual(self.tiered.get('key'), 'from another process')
+        self.assertEqual(self.l1.get('key'), 'from another process')
+        self.assertEqual(self.tiered.get_many(['key', 'missing']), {'key': 'from another process'})
+
+    def test_l1_fills_expire_with_the_l2_entry(self):
+        self.l2.set('lock', 1, 5)
+        self.l2.set('forever', 1, None)
+        self.tiered.get('lock')
+        self.tiered.get_many(['forever'])
+
+        def expires_in(key):
+            return self.l1._expire_info[self.l1.make_key(key)] - time.time()
+
+        self.assertLessEqual(expires_in('lock'), 5)
+        self.assertGreater(expires_in('forever'), 5)
+        self.assertLessEqual(expires_in('forever'), 30)
+
+    def test_deletes_reach_l2(self):
+        self.tiered.set_many({'a': 1, 'b': 2})
+        self.tiered.delete('a')
+        self.tiered.delete_many(['b'])
+        self.assertEqual(self.l2.get_many(['a', 'b']), {})
+        self.assertEqual(self.tiered.get_many(['a', 'b']), {})
+
+    def test_add_and_incr_are_decided_by_l2(self):
+        self.l2.set('counter', 1)
+        self.assertFalse(self.tiered.add('counter', 5))
+        self.l1.set('counter', 1)
+        self.assertEqual(self.tiered.incr('counter', 2), 3)
+        self.assertEqual(self.tiered.get('counter'), 3)
+
+    def test_large_values_are_compressed_in_redis(self):
+        value = {'html': 'lorem ipsum ' * 1000}
+        self.tiered.set('page', value)
+        raw = self.l2._cache.get_client('page').get(self.l2.make_key('page'))
+        self.assertEqual(raw[:1], ZLIB_MARKER)
+        self.assertLess(len(raw), 1024)
+        self.l1.clear()
+        self.assertEqual(self.tiered.get('page'), value)
+
+
+@override_settings(CACHE_COMPRESS_THRESHOLD=100)
+class CompressedRedisSerializerTests(TestCase):
+    def test_round_trip(self):
+        serializer = CompressedRedisSerializer()
+        for value in ('short', 'long ' * 100, {'nested': ['x' * 200]}):
+            self.assertEqual(serializer.loads(serializer.dumps(value)), value)
+
+    def test_only_large_values_are_compressed(self):
+        serializer = CompressedRedisSerializer()
+        self.assertNotEqual(serializer.dumps('short')[:1], ZLIB_MARKER)
+        self.assertEqual(serializer.dumps('long ' * 100)[:1], ZLIB_MARKER)
+        # Integers are stored as such so INCR works on them
+        self.assertEqual(serializer.dumps(42), 42)
+        self.assertEqual(serializer.loads(b'42'), 42)
+
+
+class GetOrComputeTests(CacheTestCase):
+    def test_value_is_computed_once(self):
+        compute = mock.Mock(return_value='fresh')
+        self.assertEqual(get_or_compute('key', compute, 60), 'fresh')
+        self.assertEqual(get_or_compute('key', compute, 60), 'fresh')
+        compute.assert_called_once_with()
+        self.assertEqual(cached_value('key'), 'fresh')
+
+    def test_expired_value_is_served_while_another_worker_refreshes(self):
+        get_or_compute('key', lambda: 'old', 60)
+        # time.time() is patched below for the cache too
+        shared_cache().add('key:lock', 1, 3600)
+        compute = mock.Mock(return_value='new')
+        with mock.patch('blog.cache.time.time', return_value=time.time() + 61):
+            self.assertEqual(get_or_compute('key', compute, 60), 'old')
+        compute.assert_not_called()
+
+    def test_expired_value_is_refreshed_by_one_worker(self):
+        get_or_compute('key', lambda: 'old', 60)
+        with mock.patch('blog.cache.time.time', return_value=time.time() + 61):
+            self.assertEqual(get_or_compute('key', lambda: 'new', 60), 'new')
+        self.assertIsNone(shared_cache().get('key:lock'))
+
+    def test_cold_miss_waits_for_the_lock_holder_then_computes(self):
+        shared_cache().add('key:lock', 1, 30)
+        compute = mock.Mock(return_value='computed')
+        self.assertEqual(get_or_compute('key', compute, 60, wait=0.1), 'computed')
+        compute.assert_called_once_with()
+
+    def test_expired_value_is_not_served_past_the_grace(self):
+        get_or_compute('key', lambda: 'old', 60, grace=10)
+        shared_cache().add('key:lock', 1, 3600)
+        with mock.patch('blog.cache.time.time', return_value=time.time() + 71):
+            self.assertEqual(get_or_compute('key', lambda: 'new', 60, grace=10, wait=0), 'new')
+
+    def test_dependencies_from_the_value_purge_it(self):
+        get_or_compute('key', lambda: {'id': 7}, 60, lambda value: [post_dependency(value['id'])])
+        invalidate(post_dependency(7))
+        self.assertIsNone(cached_value('key'))
+
+
+class SidebarTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.post = create_post(category_title='Python')
+        create_post(self.post.category, status=Post.DRAFT)
+
+    def counts(self):
+        return {category['title']: category['post_count'] for category in sidebar_categories()}
+
+    def test_counts_active_posts_only(self):
+        self.assertEqual(self.counts(), {'Python': 1})
+
+    def test_memoized_between_changes(self):
+        self.counts()
+        with self.assertNumQueries(0):
+            self.counts()
+
+    def test_rebuilt_when_a_post_is_unpublished(self):
+        self.counts()
+        self.post.status = Post.DRAFT
+        self.post.save()
+        self.assertEqual(self.counts(), {'Python': 0})
+
+    def test_looked_up_only_by_templates_that_use_it(self):
+        with mock.patch('blog.context_processors.sidebar_categories', return_value=[]) as lookup:
+            self.client.get(self.post.get_absolute_url(), secure=True)
+            lookup.assert_not_called()
+            self.client.get(reverse('blog:frontpage'), secure=True)
+        lookup.assert_called_once_with()
+
+
+class CursorPaginationTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(title='Testing')
+        self.posts = [create_post(category) for _ in range(7)]
+        # Ties on created_at are broken by id
+        Post.objects.filter(pk__in=[post.pk for post in self.posts[2:5]]).update(created_at=self.posts[2].created_at)
+        self.newest_first = list(Post.objects.order_by('-created_at', '-pk'))
+
+    def paginator(self, **kwargs):
+        return CursorPaginator(Post.objects.all(), 3, **kwargs)
+
+    def test_walks_forward_and_back(self):
+        first = self.paginator().get_page(None)
+        second = self.paginator().get_page(first.next_cursor)
+        third = self.paginator().get_page(second.next_cursor)
+        self.assertEqual(list(first) + list(second) + list(third), self.newest_first)
+        self.assertFalse(first.has_previous())
+        self.assertFalse(third.has_next())
+
+        back = self.paginator().get_page(third.previous_cursor)
+        self.assertEqual(list(back), list(second))
+        self.assertEqual(list(self.paginator().get_page(back.previous_cursor)), list(first))
+
+    def test_invalid_cursors_give_the_first_page(self):
+        for token in ('', 'garbage', 'n:2026-01-01:1'):
+            self.assertEqual(list(self.paginator().get_page(token)), self.newest_first[:3])
+
+    def test_cached_count(self):
+        paginator = self.paginator(count_key='test-count', count_dependencies=[POST_LIST])
+        self.assertEqual(paginator.get_page(None).count, 7)
+        create_post(self.posts[0].category)
+        # Adding a post invalidates the post list
+        self.assertEqual(self.paginator(count_key='test-count').get_page(None).count, 8)
+
+
+class CommentCountTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.post = create_post()
+
+    def comment(self, post=None, **kwargs):
+        return Comment.objects.create(
+            post=post or self.post, name='Reader', email='reader@example.com', contents='Hi', **kwargs
+        )
+
+    def count(self, post=None):
+        return Post.objects.values_list('approved_comment_count', flat=True).get(pk=(post or self.post).pk)
+
+    def test_only_approved_comments_count(self):
+        self.comment()
+        pending = self.comment(is_approved=False)
+        self.assertEqual(self.count(), 1)
+
+        pending.is_approved = True
+        pending.save()
+        self.assertEqual(self.count(), 2)
+
+        pending.delete()
+        self.assertEqual(self.count(), 1)
+
+    def test_moving_a_comment_updates_both_posts(self):
+        other = create_post(self.post.category)
+        comment = Comment.objects.get(pk=self.comment().pk)
+        comment.post = other
+        comment.save()
+        self.assertEqual((self.count(), self.count(other)), (0, 1))
+
+    def test_migration_backfills_existing_posts(self):
+        self.comment()
+        self.comment(is_approved=False)
+        Post.objects.update(approved_comment_count=0)
+
+        migration = import_module('blog.migrations.0014_backfill_comment_counts')
+        migration.backfill_comment_counts(apps, None)
+        self.assertEqual(self.count(), 1)
+
+
+class RelatedPostsTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.post = create_post(category_title='Python')
+        self.twin = create_post(self.post.category)
+        self.cousin = create_post(self.post.category)
+        self.post.tags.add('django', 'orm')
+        self.twin.tags.add('django', 'orm')
+        self.cousin.tags.add('django')
+        cooking = create_post(category_title='Cooking').category
+        self.elsewhere = [cooking.posts.get()] + [create_post(cooking) for _ in range(2)]
+        for post in self.elsewhere:
+            post.tags.add('baking')
+
+    def stored(self):
+        return {
+            post_id: list(RelatedPost.objects.filter(post_id=post_id).values_list('related_id', flat=True))
+            for post_id in Post.objects.values_list('pk', flat=True)
+        }
+
+    def test_shared_tags_rank_first(self):
+        rebuild_related_posts()
+        related = RelatedPost.objects.filter(post=self.post).values_list('related_id', flat=True)
+        self.assertEqual(list(related[:2]), [self.twin.pk, self.cousin.pk])
+
+    def test_neighbourhood_matrix_only_loads_posts_sharing_tags_or_category(self):
+        matrix = TagMatrix([self.post.pk])
+        self.assertEqual(set(matrix.index), {self.post.pk, self.twin.pk, self.cousin.pk})
+        self.assertEqual(
+            [post_id for post_id, _ in matrix.neighbours(self.post.pk, 2)],
+            [post_id for post_id, _ in TagMatrix().neighbours(self.post.pk, 2)],
+        )
+
+    def test_refresh_leaves_unrelated_posts_alone(self):
+        rebuild_related_posts()
+        self.cousin.tags.add('orm')
+        affected = refresh_related_posts([self.cousin.pk])
+        self.assertFalse(affected & {post.pk for post in self.elsewhere})
+
+    def test_refresh_matches_a_full_rebuild(self):
+        rebuild_related_posts()
+        self.cousin.tags.add('baking')
+        self.elsewhere[0].tags.set(['django'])
+        refresh_related_posts([self.cousin.pk, self.elsewhere[0].pk])
+        incremental = self.stored()
+
+        rebuild_related_posts()
+        self.assertEqual(incremental, self.stored())
+
+    def test_posts_listing_a_deleted_post_are_refreshed(self):
+        rebuild_related_posts()
+        self.assertIn(self.twin.pk, self.stored()[self.post.pk])
+        RebuildJob.objects.all().delete()
+        self.twin.delete()
+
+        queued = RebuildJob.objects.filter(kind=RebuildJob.RELATED).values_list('key', flat=True)
+        self.assertIn(str(self.post.pk), queued)
+        refresh_related_posts(int(key) for key in queued)
+        incremental = self.stored()
+
+        rebuild_related_posts()
+        self.assertEqual(incremental, self.stored())
+
+
+class EmbeddingsTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+        settings_override = override_settings(EMBEDDINGS_PATH=self.path)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.post = create_post(content='Pandas eat bamboo in the misty mountain forests')
+        self.twin = create_post(self.post.category, content='Bamboo forests in the mountains feed the pandas')
+        self.other = create_post(self.post.category, content='Compiling templates speeds up Django deploys')
+
+    def test_unbuilt_index_falls_back_to_latest_posts(self):
+        self.assertIsNone(get_embedding_index())
+        self.assertEqual(
+            recommend_posts(self.post, limit=2, source='embeddings'),
+            [self.other, self.twin],
+        )
+
+    def test_similar_content_ranks_first(self):
+        self.assertEqual(build_embeddings(), 3)
+        self.assertEqual(similar_posts(self.post, 2)[0], self.twin)
+
+    def test_rebuild_switches_build_and_keeps_the_previous_one(self):
+        build_embeddings()
+        first = current_build(self.path)
+        build_embeddings()
+        second = current_build(self.path)
+        build_embeddings()
+
+        self.assertNotEqual(get_embedding_index().build, first)
+        self.assertEqual(
+            sorted(name for name in os.listdir(self.path) if name != CURRENT_FILE),
+            sorted([second, current_build(self.path)]),
+        )
+
+
+class SentimentTests(CacheTestCase):
+    def score(self, *args):
+        out = StringIO()
+        call_command('score_sentiment', '--workers', '1', *args, stdout=out)
+        return out.getvalue()
+
+    def test_labels(self):
+        self.assertIsNone(sentiment_label(None))
+        self.assertEqual(
+            [sentiment_label(score) for score in (-0.5, -0.1, 0, 0.1, 0.5)],
+            ['negative', 'neutral', 'neutral', 'neutral', 'positive'],
+        )
+
+    def test_scores_only_changed_text(self):
+        post = create_post(title='A wonderful day', content='I love this wonderful place')
+        comment = Comment.objects.create(post=post, name='Reader', email='reader@example.com', contents='Terrible and awful')
+
+        self.assertIn('Scored sentiment of 1 comments', self.score())
+        post.refresh_from_db()
+        comment.refresh_from_db()
+        self.assertEqual((post.sentiment_label, comment.sentiment_label), ('positive', 'negative'))
+
+        self.assertIn('Scored sentiment of 0 posts', self.score('--source', 'posts'))
+        Comment.objects.filter(pk=comment.pk).update(contents='I love it')
+        self.assertIn('Scored sentiment of 1 comments', self.score('--source', 'comments'))
+        self.assertIn('Scored sentiment of 1 posts', self.score('--source', 'posts', '--force'))
+
+    def test_cached_post_page_shows_new_scores(self):
+        post = create_post()
+        Comment.objects.create(
+            post=post, name='Reader', email='reader@example.com', contents='Terrible and awful', is_approved=True,
+        )
+        self.assertIn('Neutral', self.client.get(post.get_absolute_url(), secure=True).content.decode())
+
+        self.score('--source', 'comments')
+        self.assertIn('Negative', self.client.get(post.get_absolute_url(), secure=True).content.decode())
+
+
+class ColdStartTests(TestCase):
+    def test_serving_does_not_import_heavy_packages(self):
+        result = subprocess.run(
+            [sys.executable, '-c', (
+                'import sys, pandastories.wsgi\n'
+                'from django.urls import get_resolver; get_resolver().url_patterns\n'
+                'print(sorted(m for m in ("textblob", "nltk", "supabase", "numpy") if m in sys.modules))\n'
+            )],
+            capture_output=True, text=True, env={**os.environ, 'WARMUP_ON_START': 'False'},
+        )
+        self.assertEqual(result.stdout.strip(), '[]', result.stderr[-2000:])
+
+    def test_importtime_reports_against_the_budget(self):
+        out = StringIO()
+        call_command('importtime', '--budget', '100000', stdout=out)
+        self.assertIn('Cold import took', out.getvalue())
+
+
+class WarmupTests(CacheTestCase):
+    def test_times_each_step(self):
+        timings = warmup.warmup(['urls', 'database', 'caches'])
+        self.assertEqual(list(timings), ['urls', 'database', 'caches'])
+
+    def test_failing_step_does_not_stop_the_rest(self):
+        broken = mock.Mock(side_effect=RuntimeError('storage is down'))
+        with mock.patch.dict(warmup.STEPS, {'storage': broken}), self.assertLogs('pandastories.warmup', 'ERROR'):
+            timings = warmup.warmup(['storage', 'urls'])
+        self.assertEqual(list(timings), ['storage', 'urls'])
+
+
+class TemplateBundleTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+        self.bundle = os.path.join(self.path, 'templates.bundle.json')
+
+    def test_compiles_project_and_app_templates(self):
+        call_command('compile_templates', '--output', self.bundle, stdout=StringIO())
+        with open(self.bundle, encoding='utf-8') as f:
+            templates = json.load(f)['templates']
+        self.assertIn('base.html', templates)
+        self.assertIn('admin/base.html', templates)
+
+    def test_templates_missing_from_the_bundle_fall_through(self):
+        with open(self.bundle, 'w', encoding='utf-8') as f:
+            json.dump({'version': '1', 'templates': {'page.html': 'bundled {{ name }}'}}, f)
+        for name in ('page.html', 'other.html'):
+            with open(os.path.join(self.path, name), 'w', encoding='utf-8') as f:
+                f.write('on disk {{ name }}')
+
+        engine = Engine(dirs=[self.path], loaders=[
+            ('pandastories.template_loaders.BundleLoader', self.bundle),
+            'django.template.loaders.filesystem.Loader',
+        ])
+        context = Context({'name': 'page'})
+        self.assertEqual(engine.get_template('page.html').render(context), 'bundled page')
+        self.assertEqual(engine.get_template('other.html').render(context), 'on disk page')
+
+
+class FragmentCacheTests(CacheTestCase):
+    template = engines['django'].from_string(
+        '{% load blog_tags %}{% cache_fragment "body" post %}{{ post.title }}{% endcache_fragment %}'
+    )
+
+    def setUp(self):
+        super().setUp()
+        self.post = create_post(title='Original')
+
+    def render(self):
+        return self.template.render({'post': self.post})
+
+    def test_cached_until_the_post_changes(self):
+        self.assertEqual(self.render(), 'Original')
+        self.post.title = 'Edited'
+        self.assertEqual(self.render(), 'Original')
+
+        self.post.updated_at += timedelta(seconds=1)
+        self.assertEqual(self.render(), 'Edited')
+
+    def test_dropped_with_the_post_dependency(self):
+        self.render()
+        self.post.title = 'Retagged'
+        invalidate(post_dependency(self.post.pk))
+        self.assertEqual(self.render(), 'Retagged')
+
+
+    def test_dropped_when_the_category_or_tags_are_renamed(self):
+        template = engines['django'].from_string(
+            '{% load blog_tags %}{% cache_fragment "meta" post %}'
+            '{{ post.category.title }}{% for tag in post.tags.all %} {{ tag.name }}{% endfor %}'
+            '{% endcache_fragment %}'
+        )
+        self.post.category.title = 'Science'
+        self.post.category.save()
+        self.post.tags.add('pandas')
+        self.assertEqual(template.render({'post': self.post}), 'Science pandas')
+
+        self.post.category.title = 'Nature'
+        self.post.category.save()
+        self.assertEqual(template.render({'post': self.post}), 'Nature pandas')
+
+        tag = Tag.objects.get(name='pandas')
+        tag.name = 'bears'
+        tag.save()
+        self.assertEqual(template.render({'post': self.post}), 'Nature bears')
+
+        tag.delete()
+        self.assertEqual(template.render({'post': self.post}), 'Nature')
+
+
+class PageStateTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.post = create_post()
+
+    def test_saved_state_follows_the_forwarded_client_ip(self):
+        url = reverse('blog:page_state')
+        self.client.post(
+            self.post.get_absolute_url(), {'save_post': '1'},
+            secure=True, HTTP_X_FORWARDED_FOR='203.0.113.7, 10.0.0.1',
+        )
+        self.assertTrue(SavedPost.objects.filter(post=self.post, ip_address='203.0.113.7').exists())
+
+        state = self.client.get(url, {'post': self.post.pk}, secure=True, HTTP_X_FORWARDED_FOR='203.0.113.7').json()
+        self.assertTrue(state['is_saved'])
+        state = self.client.get(url, {'post': self.post.pk}, secure=True, HTTP_X_FORWARDED_FOR='198.51.100.1').json()
+        self.assertFalse(state['is_saved'])
+        self.assertIn('csrf_token', state)
+
+
+class ConditionalGetTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.post = create_post()
+
+    def get(self, url, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(url, secure=True, **headers)
+
+    def test_unchanged_page_is_not_modified(self):
+        etag = self.get(self.post.get_absolute_url())['ETag']
+        self.assertEqual(self.get(self.post.get_absolute_url(), etag).status_code, 304)
+
+    def test_comment_approval_changes_the_validators(self):
+        comment = Comment.objects.create(
+            post=self.post, name='Reader', email='reader@example.com', contents='Hi', is_approved=False
+        )
+        etags = {url: self.get(url)['ETag'] for url in (self.post.get_absolute_url(), reverse('blog:frontpage'))}
+
+        comment.is_approved = True
+        comment.save()
+        for url, etag in etags.items():
+            self.assertEqual(self.get(url, etag).status_code, 200, url)
+
+    def test_popular_posts_change_the_frontpage_validators(self):
+        url = reverse('blog:frontpage')
+        etag = self.get(url)['ETag']
+
+        today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        merge_rollups(PostViewRollup.DAY, {(self.post.pk, today): 5})
+        cache.delete('popular_posts_7_5')
+        self.assertEqual(popular_posts()[0].recent_views, 5)
+        self.assertEqual(self.get(url, etag).status_code, 200)
+
+    def test_new_release_is_modified_for_if_modified_since(self):
+        url = self.post.get_absolute_url()
+        last_modified = self.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, secure=True, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        with override_settings(RELEASE_VERSION='next', CACHE_MIDDLEWARE_KEY_PREFIX='next'), \
+                mock.patch('blog.conditional.time.time', return_value=time.time() + 5):
+            # A process of the new release
+            response = self.client_class().get(url, secure=True, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+    def test_index_entries_expire_with_the_pages(self):
+        url = self.post.get_absolute_url()
+        self.get(url)
+        key = blog_cache.LAST_MODIFIED_KEY.format(post_dependency(self.post.pk))
+        expires_in = shared_cache()._expire_info[shared_cache().make_key(key)] - time.time()
+        self.assertLessEqual(expires_in, settings.CACHE_MIDDLEWARE_SECONDS)
+
+    def test_not_modified_without_loading_a_session(self):
+        url = reverse('blog:frontpage')
+        etag = self.get(url)['ETag']
+        session_store = import_module(settings.SESSION_ENGINE).SessionStore
+        with mock.patch.object(session_store, 'load') as load:
+            self.assertEqual(self.get(url, etag).status_code, 304)
+        load.assert_not_called()
+
+
+@override_settings(SITE_URL='https://testserver')
+class PrerenderTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        self.post = create_post()
+
+    def read(self, path):
+        with open(output_path(self.root, path), encoding='utf-8') as f:
+            return f.read()
+
+    def test_renders_the_public_pages(self):
+        rendered, unchanged, removed, failed = prerender(self.root)
+        pages = read_manifest(self.root)['pages']
+        self.assertEqual(set(pages), {
+            reverse('blog:frontpage'), reverse('blog:about'), reverse('blog:privacy_policy'),
+            reverse('blog:terms_conditions'), reverse('blog:category_detail', args=[self.post.category.slug]),
+            self.post.get_absolute_url(),
+        })
+        self.assertEqual((rendered, unchanged, removed, failed), (6, 0, 0, []))
+        html = self.read(self.post.get_absolute_url())
+        self.assertIn(self.post.title, html)
+        self.assertIn(reverse('blog:page_state'), html)
+        self.assertNotIn('csrftoken', html)
+
+    def test_rebuild_renders_only_changed_pages(self):
+        prerender(self.root)
+        self.assertEqual(prerender(self.root)[:3], (0, 6, 0))
+
+        self.post.title = 'Renamed'
+        self.post.save()
+        rendered, unchanged, removed, failed = prerender(self.root)
+        # The post, its category page and the frontpage
+        self.assertEqual((rendered, unchanged), (3, 3))
+        self.assertIn('Renamed', self.read(self.post.get_absolute_url()))
+
+    def test_unpublished_post_is_removed(self):
+        prerender(self.root)
+        path = self.post.get_absolute_url()
+        Post.objects.filter(pk=self.post.pk).update(status=Post.DRAFT)
+        self.assertEqual(prerender(self.root)[2], 1)
+        self.assertFalse(os.path.exists(output_path(self.root, path)))
+        self.assertNotIn(path, read_manifest(self.root)['pages'])
+
+    def test_page_unpublished_while_rendering_is_left_to_django(self):
+        path = self.post.get_absolute_url()
+        Post.objects.filter(pk=self.post.pk).update(status=Post.DRAFT)
+        self.assertEqual(prerender(self.root, paths=[path])[3], [])
+        with mock.patch('blog.prerender.page_fingerprints', return_value={path: 'stale'}):
+            self.assertEqual(prerender(self.root, paths=[path])[3], [path])
+        self.assertFalse(os.path.exists(output_path(self.root, path)))
+
+
+class RebuildJobTests(TestCase):
+    def test_repeated_changes_coalesce(self):
+        enqueue(RebuildJob.FEED, [1, 2])
+        enqueue(RebuildJob.FEED, [2, 3])
+        enqueue(RebuildJob.SITEMAP, [2])
+        self.assertEqual(
+            sorted(RebuildJob.objects.values_list('kind', 'key')),
+            [('feed', '1'), ('feed', '2'), ('feed', '3'), ('sitemap', '2')],
+        )
+
+    def test_each_kind_runs_once_per_batch(self):
+        enqueue(RebuildJob.FEED, [1, 2])
+        enqueue(RebuildJob.SITEMAP, [0])
+        feeds, sitemaps = mock.Mock(), mock.Mock()
+        with mock.patch.dict('blog.jobs.HANDLERS', {RebuildJob.FEED: feeds, RebuildJob.SITEMAP: sitemaps}):
+            self.assertEqual(process_jobs(), 3)
+        feeds.assert_called_once_with({'1', '2'})
+        sitemaps.assert_called_once_with({'0'})
+        self.assertFalse(RebuildJob.objects.exists())
+
+    def test_job_queued_again_while_running_is_kept(self):
+        enqueue(RebuildJob.FEED, [1])
+
+        def handler(keys):
+            RebuildJob.objects.filter(key='1').update(enqueued_at=timezone.now() + timedelta(seconds=1))
+
+        with mock.patch.dict('blog.jobs.HANDLERS', {RebuildJob.FEED: handler}):
+            process_jobs()
+        job = RebuildJob.objects.get()
+        self.assertIsNone(job.locked_until)
+
+    def test_failed_job_is_retried_later(self):
+        enqueue(RebuildJob.FEED, [1])
+        with mock.patch.dict('blog.jobs.HANDLERS', {RebuildJob.FEED: mock.Mock(side_effect=ValueError('boom'))}), \
+                self.assertLogs('blog.jobs', 'ERROR'):
+            process_jobs()
+        job = RebuildJob.objects.get()
+        self.assertEqual((job.attempts, job.last_error), (1, 'boom'))
+        self.assertGreater(job.locked_until, timezone.now())
+        self.assertEqual(process_jobs(), 0)
+
+    @override_settings(REBUILD_JOBS_INLINE=True)
+    def test_inline_jobs_run_once_the_request_is_over(self):
+        with mock.patch('blog.jobs.process_jobs', side_effect=[2, 0]) as process:
+            enqueue(RebuildJob.FEED, [1])
+            enqueue(RebuildJob.SITEMAP, [0])
+            process.assert_not_called()
+            request_finished.send(sender=None)
+            request_finished.send(sender=None)
+        self.assertEqual(process.call_count, 2)
+
+    def test_jobs_wait_for_a_worker_by_default(self):
+        enqueue(RebuildJob.FEED, [1])
+        with mock.patch('blog.jobs.process_jobs') as process:
+            request_finished.send(sender=None)
+        process.assert_not_called()
+
+
+class ScheduledPublishingTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        self.due = create_post(status=Post.SCHEDULED, published_at=now - timedelta(minutes=1))
+        self.later = create_post(self.due.category, status=Post.SCHEDULED, published_at=now + timedelta(hours=1))
+
+    def test_publishes_due_posts_once(self):
+        self.assertEqual(publish_due_posts(), [self.due.pk])
+        self.assertEqual(publish_due_posts(), [])
+        self.assertEqual(
+            dict(Post.objects.values_list('pk', 'status')),
+            {self.due.pk: Post.ACTIVE, self.later.pk: Post.SCHEDULED},
+        )
+        self.assertEqual(next_due(), self.later.published_at)
+
+    def test_publishing_refreshes_the_sidebar_and_queues_rebuilds(self):
+        self.assertEqual(sidebar_categories()[0]['post_count'], 0)
+        publish_due_posts()
+        self.assertEqual(sidebar_categories()[0]['post_count'], 1)
+        self.assertTrue(RebuildJob.objects.filter(kind=RebuildJob.FEED, key=str(self.due.pk)).exists())
+
+    def test_command_publishes_in_batches(self):
+        self.later.published_at = self.due.published_at
+        self.later.save()
+        out = StringIO()
+        call_command('publish_scheduled', batch_size=1, stdout=out)
+        self.assertFalse(Post.objects.filter(status=Post.SCHEDULED).exists())
+        self.assertEqual(out.getvalue().count('Published 1 scheduled posts'), 2)
+
+
+class SitemapTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+        settings_override = override_settings(STORAGES={**settings.STORAGES, 'sitemaps': {
+            'BACKEND': 'pandastories.storage_backends.OverwritingFileSystemStorage',
+            'OPTIONS': {'location': self.path},
+        }})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.post = create_post()
+
+    def test_rebuild_replaces_files_in_place(self):
+        build_sitemaps()
+        second = create_post(self.post.category)
+        build_sitemaps([0])
+
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(self.path, settings.SITEMAP_STORAGE_PATH))),
+            ['sitemap-categories.xml', 'sitemap-posts-0.xml', 'sitemap.xml'],
+        )
+        content = read_section('posts-0').decode()
+        self.assertIn(self.post.slug, content)
+        self.assertIn(second.slug, content)
+
+    def test_missing_file_is_built_for_the_request(self):
+        self.assertIn(self.post.slug, read_section('posts-0').decode())
+        self.assertIsNone(read_section('posts-1'))
+        self.assertIsNone(read_section('unknown'))
+
+    def test_unreadable_file_is_logged_and_built_for_the_request(self):
+        build_sitemaps()
+        with mock.patch.object(storages['sitemaps'], 'open', side_effect=PermissionError), \
+                self.assertLogs('blog.sitemaps', 'WARNING'):
+            self.assertIn(self.post.slug, read_section('posts-0').decode())
+
+    def test_section_built_for_requests_is_cached_until_the_next_build(self):
+        build_sitemaps()
+        with mock.patch.object(storages['sitemaps'], 'open', side_effect=PermissionError), \
+                self.assertLogs('blog.sitemaps', 'WARNING'):
+            read_section('posts-0')
+            with self.assertNumQueries(0):
+                self.assertIn(self.post.slug, read_section('posts-0').decode())
+            second = create_post(self.post.category)
+            build_sitemaps([0])
+            self.assertIn(second.slug, read_section('posts-0').decode())
+
+    def test_unconfigured_supabase_storage_is_built_for_the_request(self):
+        with override_settings(STORAGES={**settings.STORAGES, 'sitemaps': {
+            'BACKEND': 'pandastories.storage_backends.SupabaseStorage',
+        }}), mock.patch.dict(os.environ, {'SUPABASE_URL': '', 'SUPABASE_KEY': ''}), \
+                self.assertLogs('blog.sitemaps', 'WARNING'):
+            self.assertIn(self.post.slug, read_section('posts-0').decode())
+
+    def test_other_errors_are_not_swallowed(self):
+        with mock.patch.object(storages['sitemaps'], 'open', side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                read_section('posts-0')
+
+
+class FeedTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.post = create_post(title='Pandas & <bamboo>', meta_description='All about bamboo')
+
+    def get(self, format):
+        response = self.client.get(reverse('blog:feed', args=[format]), secure=True)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_formats(self):
+        rss = ElementTree.fromstring(self.get('rss'))
+        self.assertEqual(rss.findtext('channel/item/title'), 'Pandas & <bamboo>')
+        self.assertEqual(rss.findtext('channel/item/guid'), settings.SITE_URL + self.post.get_absolute_url())
+
+        atom = ElementTree.fromstring(self.get('atom'))
+        ns = {'atom': 'http://www.w3.org/2005/Atom'}
+        self.assertEqual(atom.findtext('atom:entry/atom:title', namespaces=ns), 'Pandas & <bamboo>')
+
+        items = json.loads(self.get('json'))['items']
+        self.assertEqual([item['title'] for item in items], ['Pandas & <bamboo>'])
+
+    def test_entries_are_cached_per_post_version(self):
+        self.get('rss')
+        Post.objects.filter(pk=self.post.pk).update(title='Renamed without signals')
+        self.assertIn('Pandas &amp; &lt;bamboo&gt;', self.get('rss'))
+
+        self.post.title = 'Renamed'
+        self.post.save()
+        self.assertIn('<title>Renamed</title>', self.get('rss'))
+
+    def test_database_error_is_not_a_truncated_feed(self):
+        with mock.patch('blog.feeds.Post.objects.filter', side_effect=DatabaseError), \
+                self.assertLogs('django.request', 'ERROR'):
+            with self.assertRaises(DatabaseError):
+                self.client.get(reverse('blog:feed', args=['rss']), secure=True)
@@ -0,0 +1,249 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import incr_counter, shared_cache
+
+logger = logging.getLogger(__name__)
+
+SEEN_VIEW_KEY = 'post_views:seen:{}:{}'
+VIEW_COUNTER_KEY = 'post_views:count:{}:{}'
+OPEN_HOURS_KEY = 'post_views:open_hours'
+FLUSH_LOCK_KEY = 'post_views:flush:lock'
+
+
+def current_hour():
+    """Hours since the epoch, the bucket of a hit in the cache counters."""
+    return int(time.time() // 3600)
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def write_post_views(hits):
+    """Persist buffered hits with one bulk insert and one counter update per post."""
+    from .models import Post, PostView  # Import here to avoid circular import
+
+    hits = set(hits)
+    if not hits:
+        return 0
+
+    # Skip hits already recorded in the dedupe window, the raw rows
+    # compact_post_views() keeps
+    recent = PostView.objects.filter(
+        created_at__gte=timezone.now() - timedelta(days=settings.POST_VIEW_DEDUPE_DAYS)
+    )
+    existing = set(recent.filter(
+        post_id__in={post_id for post_id, _, _ in hits},
+        session_key__in={session_key for _, session_key, _ in hits if session_key},
+    ).values_list('post_id', 'session_key', 'ip_address'))
+    existing |= set(recent.filter(
+        post_id__in={post_id for post_id, session_key, _ in hits if not session_key},
+        session_key__isnull=True,
+    ).values_list('post_id', 'session_key', 'ip_address'))
+    new_hits = [hit for hit in hits if hit not in existing]
+    if not new_hits:
+        return 0
+
+    PostView.objects.bulk_create([
+        PostView(post_id=post_id, session_key=session_key, ip_address=ip_address)
+        for post_id, session_key, ip_address in new_hits
+    ], batch_size=500)
+
+    for post_id, count in Counter(post_id for post_id, _, _ in new_hits).items():
+        Post.objects.filter(pk=post_id).update(views_count=F('views_count') + count)
+
+    return len(new_hits)
+
+
+def write_view_counts(counts):
+    """Add {(post_id, hour): views} counted in the cache to views_count and the rollups."""
+    from .analytics import merge_rollups  # Import here to avoid circular import
+    from .models import Post, PostViewRollup
+
+    if not counts:
+        return
+    by_post = Counter()
+    by_period = {PostViewRollup.HOUR: Counter(), PostViewRollup.DAY: Counter()}
+    for (post_id, hour), views in counts.items():
+        start = datetime.fromtimestamp(hour * 3600, tz=dt_timezone.utc)
+        by_post[post_id] += views
+        by_period[PostViewRollup.HOUR][post_id, start] += views
+        by_period[PostViewRollup.DAY][post_id, start.replace(hour=0)] += views
+    with transaction.atomic():
+        for post_id, views in by_post.items():
+            Post.objects.filter(pk=post_id).update(views_count=F('views_count') + views)
+        for period, period_counts in by_period.items():
+            merge_rollups(period, period_counts)
+
+
+class ViewBuffer:
+    """
+    Collect post hits in process memory and write them to the database in
+    batches, at the end of the request that finds the buffer full or due.
+    """
+
+    def __init__(self, max_size=500, flush_interval=30):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._seen = set()
+        self._last_flush = time.monotonic()
+
+    def record(self, post_id, session_key, ip_address):
+        """Buffer a hit, ignoring (post, session, ip) triples seen since the last reset."""
+        hit = (post_id, session_key or None, ip_address)
+        with self._lock:
+            if hit in self._seen:
+                return
+            self._seen.add(hit)
+            self._pending.add(hit)
+
+    def should_flush(self):
+        return (
+            len(self) >= self.max_size
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        )
+
+    def drain(self):
+        """Return and clear the pending hits."""
+        with self._lock:
+            hits, self._pending = self._pending, set()
+            # Bound the dedupe window so long-lived processes don't grow forever
+            if len(self._seen) > self.max_size * 10:
+                self._seen = set()
+            self._last_flush = time.monotonic()
+        return hits
+
+    def flush(self):
+        """Write pending hits to the database and return the number of new views."""
+        hits = self.drain()
+        if not hits:
+            return 0
+        try:
+            return write_post_views(hits)
+        except Exception:
+            logger.exception("Failed to flush %d buffered post views", len(hits))
+            return 0
+
+    def __len__(self):
+        return len(self._pending)
+
+
+class CacheViewBuffer(ViewBuffer):
+    """
+    View buffer kept in the shared cache as one counter per post and hour.
+
+    Recording a hit is an atomic add() of its dedupe key and an incr() of
+    the counter, so processes never wait on each other. The counters are
+    written to the database by a separate job (`manage.py flush_post_views`),
+    not by requests. They go straight into views_count and the rollups;
+    no raw PostView rows are kept for these hits.
+    """
+
+    # Counters outlive their hour by this long, so runs of the flush job
+    # can be this far apart without losing views
+    counter_hours = 48
+    flush_lock_timeout = 60 * 5
+
+    def record(self, post_id, session_key, ip_address):
+        hit = (post_id, session_key or None, ip_address)
+        with self._lock:
+            if hit in self._seen:
+                return
+            self._seen.add(hit)
+            if len(self._seen) > self.max_size * 10:
+                self._seen = set()
+        visitor = hashlib.md5(f'{session_key or ""}:{ip_address or ""}'.encode('utf-8')).hexdigest()
+        if not shared_cache().add(SEEN_VIEW_KEY.format(post_id, visitor), 1, settings.POST_VIEW_DEDUPE_DAYS * 86400):
+            return
+        incr_counter(VIEW_COUNTER_KEY.format(post_id, current_hour()), timeout=self.counter_hours * 3600)
+
+    def should_flush(self):
+        return False
+
+    def flush(self):
+        """Move the counters into the database and return the number of views written."""
+        from .models import Post  # Import here to avoid circular import
+
+        if not shared_cache().add(FLUSH_LOCK_KEY, 1, self.flush_lock_timeout):
+            return 0
+        try:
+            current = current_hour()
+            oldest = max(shared_cache().get(OPEN_HOURS_KEY, 0), current - self.counter_hours)
+            hours = range(oldest, current + 1)
+            post_ids = Post.objects.filter(status=Post.ACTIVE).values_list('pk', flat=True).order_by('pk')
+
+            counts = {}
+            for chunk in _chunks(post_ids.iterator(chunk_size=1000), 1000):
+                keys = {VIEW_COUNTER_KEY.format(post_id, hour): (post_id, hour) for post_id in chunk for hour in hours}
+                for key, views in shared_cache().get_many(keys).items():
+                    if views:
+                        # Hits counted since the read stay in the counter
+                        shared_cache().decr(key, views)
+                        counts[keys[key]] = views
+            try:
+                write_view_counts(counts)
+            except Exception:
+                logger.exception("Failed to flush %d buffered post views", sum(counts.values()))
+                for (post_id, hour), views in counts.items():
+                    shared_cache().incr(VIEW_COUNTER_KEY.format(post_id, hour), views)
+                return 0
+            # Keep the previous hour open for hits that were in flight as it ended
+            shared_cache().set(OPEN_HOURS_KEY, current - 1, None)
+            return sum(counts.values())
+        finally:
+            shared_cache().delete(FLUSH_LOCK_KEY)
+
+    def __len__(self):
+        return 0
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_view_buffer():
+    """Return the process-wide view buffer configured in settings."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                buffer_class = CacheViewBuffer if settings.POST_VIEW_BUFFER == 'cache' else ViewBuffer
+                _buffer = buffer_class(
+                    max_size=settings.POST_VIEW_BUFFER_SIZE,
+                    flush_interval=settings.POST_VIEW_FLUSH_INTERVAL,
+                )
+                if buffer_class is ViewBuffer:
+                    # Hits in the cache buffer outlive the process
+                    request_finished.connect(flush_due_views, dispatch_uid='blog.tracking.flush_due_views')
+    return _buffer
+
+
+def flush_due_views(sender, **kwargs):
+    """
+    Flush the buffer once it's full or its interval has passed, at the end
+    of any request. The response has been built by then, and flushing before
+    the request returns means a serverless host can't freeze the process
+    with hits still in memory.
+    """
+    if _buffer is not None and _buffer.should_flush():
+        _buffer.flush()
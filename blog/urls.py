@@ -9,8 +9,16 @@ urlpatterns = [
     path('about/', views.about, name='about'),
     path('contact/', views.contact, name='contact'),
     path('search/', views.search, name='search'),
+    path('search/suggest/', views.search_suggest, name='search_suggest'),
+    path('state/', views.page_state, name='page_state'),
     path('privacy-policy/', views.privacy_policy, name='privacy_policy'),
     path('terms-and-conditions/', views.terms_conditions, name='terms_conditions'),
+    path('feed/', views.feed, name='feed'),
+    path('feed/<slug:format>/', views.feed, name='feed'),
     path('category/<slug:slug>/', views.category_detail, name='category_detail'),
+    path('category/<slug:category_slug>/feed/', views.feed, name='category_feed'),
+    path('category/<slug:category_slug>/feed/<slug:format>/', views.feed, name='category_feed'),
+    path('tag/<slug:tag_slug>/feed/', views.feed, name='tag_feed'),
+    path('tag/<slug:tag_slug>/feed/<slug:format>/', views.feed, name='tag_feed'),
     path('<slug:category_slug>/<slug:post_slug>/', views.post_detail, name='post_detail'),
 ]
@@ -1,5 +1,4 @@
-from textblob import TextBlob
-from django.db.models import Count, Q
+from django.conf import settings
 from django.utils.html import strip_tags
 
 def get_sentiment(text):
@@ -7,37 +6,44 @@ def get_sentiment(text):
     if not text:
         return 0.0
     
+    # textblob pulls in NLTK, import it only when text is actually scored
+    from textblob import TextBlob
+    
     text = strip_tags(text)
     blob = TextBlob(text)
     return blob.sentiment.polarity
 
-def recommend_posts(post, limit=3):
-    """Recommend posts based on tags and category."""
+def get_sentiments(texts):
+    """Score a batch of texts; runs in worker processes of `manage.py score_sentiment`."""
+    return [get_sentiment(text) for text in texts]
+
+def recommend_posts(post, limit=3, source=None):
+    """
+    Recommend posts ranked by ``source``: 'tags' for the related-posts index
+    or 'embeddings' for content similarity, defaulting to RECOMMENDATION_SOURCE.
+    Falls back to the latest posts when the index has nothing for the post.
+    """
     from .models import Post  # Import here to avoid circular import
     
-    # Get posts with similar tags
-    similar_posts = Post.objects.filter(status=Post.ACTIVE).exclude(id=post.id)
-    
-    # First try to find posts with matching tags
-    if post.tags.exists():
-        tag_ids = post.tags.values_list('id', flat=True)
-        similar_posts = similar_posts.filter(tags__in=tag_ids).distinct()
-        
-        # Order by number of matching tags and creation date
-        similar_posts = similar_posts.annotate(
-            same_tags=Count('tags', filter=Q(tags__in=tag_ids))
-        ).order_by('-same_tags', '-created_at')
-        
-        if similar_posts.exists():
-            return similar_posts[:limit]
-    
-    # If no posts with matching tags, try posts from same category
-    category_posts = similar_posts.filter(category=post.category).order_by('-created_at')
-    if category_posts.exists():
-        return category_posts[:limit]
+    source = source or settings.RECOMMENDATION_SOURCE
+    if source == 'embeddings':
+        from .embeddings import similar_posts  # Imports numpy, only load it when used
+        recommendations = similar_posts(post, limit)
+    else:
+        from .recommendations import related_posts
+        recommendations = related_posts(post, limit)
+    if recommendations:
+        return recommendations
     
-    # If still no matches, return latest posts
-    return similar_posts.order_by('-created_at')[:limit]
+    return list(Post.objects.filter(
+        status=Post.ACTIVE
+    ).exclude(
+        id=post.id
+    ).select_related(
+        'category'
+    ).defer(
+        'content', 'content_text'
+    ).order_by('-created_at')[:limit])
 
 def get_client_ip(request):
     """Get client IP address from request."""
@@ -49,16 +55,13 @@ def get_client_ip(request):
     return ip
 
 def track_post_view(request, post):
-    """Track post view with user/session info."""
-    from .models import PostView  # Import here to avoid circular import
-    
-    if not request.session.session_key:
-        request.session.save()
+    """Buffer a post view; it is written to the database in a later batch."""
+    from .tracking import get_view_buffer  # Import here to avoid circular import
     
-    # Create PostView if it doesn't exist for this session/user
-    PostView.objects.get_or_create(
-        post=post,
-        session_key=request.session.session_key,
-        user=request.user if request.user.is_authenticated else None,
-        ip_address=get_client_ip(request)
+    # Don't create a session just to count a view, anonymous visitors
+    # without one are deduplicated by IP address
+    get_view_buffer().record(
+        post.pk,
+        request.session.session_key,
+        get_client_ip(request)
     )
@@ -1,27 +1,73 @@
-from django.db.models import Q
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, JsonResponse
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.views.decorators.cache import cache_page
-from django.core.cache import cache
+from django.urls import reverse
+from django.views.decorators.cache import cache_page, cache_control, never_cache
+from django.middleware.csrf import get_token
 from django.db.models import Prefetch
 from django.contrib import messages
+from django.utils import timezone
 
-from .models import Post, Category, Comment, Newsletter, PostView, SavedPost
+from taggit.models import Tag
+
+from .models import Post, Category, Comment, Newsletter, SavedPost
 from .forms import CommentForm, NewsletterForm
-from .utils import get_sentiment, recommend_posts
-from django.db.models import Count
+from .pagination import CursorPaginator
+from .analytics import popular_posts
+from .cache import (
+    CATEGORY_LIST, POPULAR_POSTS, POST_LIST, add_cache_dependencies, cached_value,
+    category_dependency, get_or_compute, patch_edge_cache_control,
+    post_dependency,
+)
+from .conditional import conditional_page
+from .feeds import FEEDS, build_feed, latest_posts
+from .search import search_posts, suggest
+from .sitemaps import INDEX, read_section, sitemap_dependencies
+from .utils import recommend_posts, get_client_ip, track_post_view
+
+def _post_cache_key(category_slug, post_slug):
+    return f'post_{category_slug}_{post_slug}'
+
+def _has_messages(request):
+    """Whether a flash message is waiting to be shown, which makes the page one-off."""
+    # Messages are kept in the session; without its cookie there are none
+    # and loading an empty session would be a wasted query
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+        return False
+    return len(messages.get_messages(request)) > 0
+
+def _frontpage_dependencies(request):
+    if _has_messages(request):
+        return None
+    # Refreshes the ranking if it expired, so a change shows in the validators
+    popular_posts()
+    return [POST_LIST, CATEGORY_LIST, POPULAR_POSTS]
+
+def _post_detail_dependencies(request, category_slug, post_slug):
+    # Messages are loaded by page_state on this page, so they don't matter
+    post = cached_value(_post_cache_key(category_slug, post_slug))
+    if post is not None:
+        post_id, category_id = post.pk, post.category_id
+    else:
+        ids = Post.objects.filter(
+            category__slug=category_slug, slug=post_slug, status=Post.ACTIVE
+        ).values_list('pk', 'category_id').first()
+        if ids is None:
+            return None
+        post_id, category_id = ids
+    return [post_dependency(post_id), category_dependency(category_id)]
 
+def _category_detail_dependencies(request, slug):
+    if _has_messages(request):
+        return None
+    category_id = Category.objects.filter(slug=slug).values_list('pk', flat=True).first()
+    if category_id is None:
+        return None
+    return [category_dependency(category_id), CATEGORY_LIST]
+
+@conditional_page(_frontpage_dependencies)
 def frontpage(request):
     """View for the front page of the blog."""
-    # Get cached categories or fetch and cache them
-    categories = cache.get('all_categories')
-    if categories is None:
-        categories = Category.objects.annotate(
-            post_count=Count('posts', filter=Q(posts__status=Post.ACTIVE))
-        ).order_by('title')
-        cache.set('all_categories', categories, 60 * 60)  # Cache for 1 hour
-    
     featured_posts = Post.objects.filter(
         status=Post.ACTIVE, 
         featured=True
@@ -29,8 +75,8 @@ def frontpage(request):
         'category'
     ).prefetch_related(
         'tags'
-    ).annotate(
-        comment_count=Count('comments', filter=Q(comments__is_approved=True))
+    ).defer(
+        'content', 'content_text'
     ).order_by('-created_at')[:3]
     
     posts = Post.objects.filter(
@@ -39,24 +85,20 @@ def frontpage(request):
         'category'
     ).prefetch_related(
         'tags'
-    ).annotate(
-        comment_count=Count('comments', filter=Q(comments__is_approved=True))
+    ).defer(
+        'content', 'content_text'
     ).order_by('-created_at')
 
     # Pagination
-    paginator = Paginator(posts, 10)
-    page = request.GET.get('page')
-    try:
-        posts = paginator.page(page)
-    except PageNotAnInteger:
-        posts = paginator.page(1)
-    except EmptyPage:
-        posts = paginator.page(paginator.num_pages)
+    paginator = CursorPaginator(posts, 10, count_key='post_count', count_dependencies=[POST_LIST])
+    posts = paginator.get_page(request.GET.get('cursor'))
 
+    add_cache_dependencies(request, POST_LIST, CATEGORY_LIST, POPULAR_POSTS)
+    
     context = {
         'posts': posts,
         'featured_posts': featured_posts,
-        'categories': categories,
+        'popular_posts': popular_posts(),
     }
     
     return render(request, 'frontpage.html', context)
@@ -71,14 +113,12 @@ def contact(request):
     context = {}
     return render(request, 'contact.html', context)
 
+@conditional_page(_post_detail_dependencies)
 def post_detail(request, category_slug, post_slug):
     """Display a single post with its comments and recommendations."""
-    # Try to get post from cache
-    cache_key = f'post_{category_slug}_{post_slug}'
-    post = cache.get(cache_key)
-    
-    if post is None:
-        post = get_object_or_404(
+    # Get post from cache, refreshing it without a stampede when it expires
+    def get_post():
+        return get_object_or_404(
             Post.objects.select_related('category').prefetch_related(
                 Prefetch(
                     'comments',
@@ -86,57 +126,42 @@ def post_detail(request, category_slug, post_slug):
                     to_attr='approved_comments'
                 ),
                 'tags'
-            ).annotate(
-                comment_count=Count('comments', filter=Q(comments__is_approved=True))
             ),
             category__slug=category_slug,
             slug=post_slug,
             status=Post.ACTIVE
         )
-        cache.set(cache_key, post, 60 * 15)  # Cache for 15 minutes
-    
-    # Track post view
-    if not request.session.session_key:
-        request.session.save()
     
-    # Get IP address
-    ip_address = request.META.get('REMOTE_ADDR')
-    
-    # Create or get PostView
-    PostView.objects.get_or_create(
-        post=post,
-        session_key=request.session.session_key,
-        ip_address=ip_address
+    post = get_or_compute(
+        _post_cache_key(category_slug, post_slug),
+        get_post,
+        settings.CACHE_OBJECT_TIMEOUT,
+        lambda post: [post_dependency(post.pk)],
+        grace=settings.CACHE_OBJECT_GRACE,
     )
     
-    # Check if post is saved by current IP
-    is_saved = SavedPost.objects.filter(post=post, ip_address=ip_address).exists()
+    # Related posts and recommendations come from the precomputed index
+    neighbours = recommend_posts(post, limit=5)
+    related_posts, recommendations = neighbours[:3], neighbours[3:]
     
-    # Get related posts based on tags
-    post_tags_ids = post.tags.values_list('id', flat=True)
-    related_posts = Post.objects.filter(
-        status=Post.ACTIVE,
-        tags__in=post_tags_ids
-    ).exclude(
-        id=post.id
-    ).select_related(
-        'category'
-    ).prefetch_related(
-        'tags'
-    ).annotate(
-        same_tags=Count('tags')
-    ).order_by('-same_tags', '-created_at')[:3]
+    context = {
+        'post': post,
+        'related_posts': related_posts,
+        'recommendations': recommendations,
+    }
     
     # Handle form submissions
     if request.method == 'POST':
+        ip_address = get_client_ip(request)
         if 'save_post' in request.POST:
-            if is_saved:
-                SavedPost.objects.filter(post=post, ip_address=ip_address).delete()
+            saved = SavedPost.objects.filter(post=post, ip_address=ip_address)
+            if saved.exists():
+                saved.delete()
                 messages.success(request, 'Post removed from saved items.')
             else:
                 SavedPost.objects.create(post=post, ip_address=ip_address)
                 messages.success(request, 'Post saved successfully.')
-            return redirect('post_detail', category_slug=category_slug, post_slug=post_slug)
+            return redirect('blog:post_detail', category_slug=category_slug, post_slug=post_slug)
         
         form = CommentForm(request.POST)
         if form.is_valid():
@@ -144,19 +169,43 @@ def post_detail(request, category_slug, post_slug):
             comment.post = post
             comment.save()
             messages.success(request, 'Your comment has been submitted for approval.')
-            return redirect('post_detail', category_slug=category_slug, post_slug=post_slug)
-    else:
-        form = CommentForm()
+            return redirect('blog:post_detail', category_slug=category_slug, post_slug=post_slug)
+        
+        # Show the form errors to this visitor only
+        context.update(form=form, is_saved=SavedPost.objects.filter(post=post, ip_address=ip_address).exists())
+        return render(request, 'post_detail.html', context)
     
-    context = {
-        'post': post,
-        'form': form,
-        'is_saved': is_saved,
-        'related_posts': related_posts,
+    # The article is rendered without anything per visitor, so it can be
+    # cached by the CDN; the saved state, CSRF token, messages and view
+    # tracking are loaded from page_state once the page is shown
+    add_cache_dependencies(request, post_dependency(post.pk), category_dependency(post.category_id))
+    context.update(form=CommentForm(), edge_cacheable=True)
+    response = render(request, 'post_detail.html', context)
+    patch_edge_cache_control(response)
+    return response
+
+@never_cache
+def page_state(request):
+    """
+    Per-visitor state of a page rendered without it: the CSRF token for its
+    forms and pending messages, plus for ?post=<id> whether the visitor
+    saved the post. Also counts the post view.
+    """
+    state = {
+        'csrf_token': get_token(request),
+        'messages': [{'tags': message.tags, 'text': str(message)} for message in messages.get_messages(request)],
     }
-    
-    return render(request, 'post_detail.html', context)
+    post_id = request.GET.get('post', '')
+    if post_id.isdigit():
+        post = Post.objects.filter(pk=post_id, status=Post.ACTIVE).only('id').first()
+        if post:
+            track_post_view(request, post)
+            state['is_saved'] = SavedPost.objects.filter(
+                post=post, ip_address=get_client_ip(request)
+            ).exists()
+    return JsonResponse(state)
 
+@conditional_page(_category_detail_dependencies)
 def category_detail(request, slug):
     """Display posts for a specific category."""
     category = get_object_or_404(Category, slug=slug)
@@ -165,19 +214,19 @@ def category_detail(request, slug):
         status=Post.ACTIVE
     ).select_related(
         'category'
-    ).annotate(
-        comment_count=Count('comments', filter=Q(comments__is_approved=True))
+    ).defer(
+        'content', 'content_text'
     ).order_by('-created_at')
     
     # Pagination
-    paginator = Paginator(posts, 10)
-    page = request.GET.get('page')
-    try:
-        posts = paginator.page(page)
-    except PageNotAnInteger:
-        posts = paginator.page(1)
-    except EmptyPage:
-        posts = paginator.page(paginator.num_pages)
+    paginator = CursorPaginator(
+        posts, 10,
+        count_key=f'post_count:category:{category.pk}',
+        count_dependencies=[category_dependency(category.pk)],
+    )
+    posts = paginator.get_page(request.GET.get('cursor'))
+    
+    add_cache_dependencies(request, category_dependency(category.pk), CATEGORY_LIST)
     
     context = {
         'category': category,
@@ -188,25 +237,23 @@ def category_detail(request, slug):
 
 def search(request):
     """Search posts by query string."""
-    query = request.GET.get('query', '')
-    posts = Post.objects.filter(status=Post.ACTIVE).select_related('category')
+    query = request.GET.get('query', '').strip()
+    posts = search_posts(query, request.GET.get('page')) if query else None
     
-    if query:
-        posts = posts.filter(
-            Q(title__icontains=query) |
-            Q(intro__icontains=query) |
-            Q(content__icontains=query)
-        )
-    
-    # Get all categories for sidebar
-    categories = Category.objects.all().annotate(
-        post_count=Count('posts', filter=Q(posts__status=Post.ACTIVE))
-    )
+    add_cache_dependencies(request, POST_LIST, CATEGORY_LIST)
     
     return render(request, 'search.html', {
         'query': query, 
-        'posts': posts, 
-        'categories': categories
+        'posts': posts
+    })
+
+@cache_control(public=True, max_age=60 * 5)
+def search_suggest(request):
+    """Return autocomplete suggestions for a partial search query as JSON."""
+    query = request.GET.get('q', '')
+    return JsonResponse({
+        'query': query,
+        'results': suggest(query),
     })
 
 def newsletter_signup(request):
@@ -236,6 +283,57 @@ def terms_conditions(request):
     """Display the terms and conditions page."""
     return render(request, 'terms_conditions.html')
 
+def _feed_dependencies(request, format='rss', category_slug=None, tag_slug=None):
+    if format not in FEEDS:
+        return None
+    if category_slug is None:
+        # Tag changes invalidate the post list too
+        return [POST_LIST]
+    category_id = Category.objects.filter(slug=category_slug).values_list('pk', flat=True).first()
+    if category_id is None:
+        return None
+    return [category_dependency(category_id)]
+
+@conditional_page(_feed_dependencies)
+def feed(request, format='rss', category_slug=None, tag_slug=None):
+    """The latest posts as RSS, Atom or JSON Feed, site-wide or for a category or tag."""
+    if format not in FEEDS:
+        raise Http404("No such feed format")
+    feed_type = FEEDS[format]
+    title = 'PandaStories'
+    link = reverse('blog:frontpage')
+    description = 'A personal blog about technology, programming, and life.'
+    category = tag = None
+    if category_slug is not None:
+        category = get_object_or_404(Category, slug=category_slug)
+        title = f'{category.title} | {title}'
+        link = category.get_absolute_url()
+        description = category.meta_description or category.description or description
+    elif tag_slug is not None:
+        tag = get_object_or_404(Tag, slug=tag_slug)
+        title = f'{tag.name} | {title}'
+        description = f'Posts tagged {tag.name}.'
+
+    posts = latest_posts(category=category, tag=tag)
+    meta = {
+        'title': title,
+        'link': settings.SITE_URL + link,
+        'feed_url': settings.SITE_URL + request.path,
+        'description': description,
+        'updated': max((post.updated_at for post in posts), default=timezone.now()),
+    }
+    response = HttpResponse(build_feed(feed_type, meta, posts), content_type=feed_type.content_type)
+    patch_edge_cache_control(response)
+    return response
+
+@conditional_page(sitemap_dependencies)
+def sitemap(request, section=INDEX):
+    """Serve the sitemap index or one of its files, prebuilt by blog.sitemaps."""
+    content = read_section(section)
+    if content is None:
+        raise Http404("No such sitemap")
+    return HttpResponse(content, content_type='application/xml')
+
 def robots_txt(request):
     """Serve robots.txt file."""
     content = """
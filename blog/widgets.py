@@ -1,7 +1,6 @@
 from django import forms
 from django.utils.safestring import mark_safe
 from django.conf import settings
-from markdown import markdown
 
 
 class MarkdownEditorWidget(forms.Textarea):
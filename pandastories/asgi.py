@@ -9,8 +9,13 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pandastories.settings')
 
 application = get_asgi_application()
+
+if settings.WARMUP_ON_START:
+    from pandastories.warmup import warmup
+    warmup()
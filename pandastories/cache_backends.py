@@ -0,0 +1,145 @@
+import pickle
+import zlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.redis import RedisSerializer
+
+# zlib streams start with this byte, pickles (protocol 2+) with b'\x80'
+ZLIB_MARKER = b'x'
+
+
+class CompressedRedisSerializer(RedisSerializer):
+    """Pickle serializer that zlib-compresses values above CACHE_COMPRESS_THRESHOLD bytes."""
+
+    def __init__(self, protocol=None):
+        super().__init__(protocol)
+        self.threshold = settings.CACHE_COMPRESS_THRESHOLD
+
+    def dumps(self, obj):
+        data = super().dumps(obj)
+        if isinstance(data, bytes) and len(data) > self.threshold:
+            return zlib.compress(data)
+        return data
+
+    def loads(self, data):
+        if data[:1] == ZLIB_MARKER:
+            return pickle.loads(zlib.decompress(data))
+        return super().loads(data)
+
+
+class TieredCache(BaseCache):
+    """
+    Two-tier cache: a small per-process L1 in front of a shared L2.
+
+    Reads try L1 first and fill it from L2 on a miss. Writes and deletes go to
+    both. L1 entries live at most L1_TIMEOUT seconds, which bounds how long
+    another process can serve a value that was changed or deleted elsewhere,
+    and never longer than the L2 entry they were filled from when L2 is Redis.
+    Keys are prefixed and versioned by the underlying caches.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l1_alias = options.get('L1', 'local')
+        self._l2_alias = options.get('L2', 'shared')
+        self.l1_timeout = options.get('L1_TIMEOUT', 30)
+
+    @property
+    def l1(self):
+        return caches[self._l1_alias]
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    def _l1_timeout(self, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        if timeout is None:
+            return self.l1_timeout
+        return min(timeout, self.l1_timeout)
+
+    def _fill_timeouts(self, keys, version):
+        """
+        {key: L1 timeout} for entries read from L2: what they have left there,
+        up to L1_TIMEOUT. Costs one pipelined TTL query on Redis; other L2
+        backends don't expose it, and get L1_TIMEOUT.
+        """
+        client = getattr(self.l2, '_cache', None)
+        if not hasattr(client, 'get_client'):
+            return dict.fromkeys(keys, self.l1_timeout)
+        pipeline = client.get_client(write=False).pipeline(transaction=False)
+        for key in keys:
+            pipeline.ttl(self.l2.make_and_validate_key(key, version=version))
+        # -1 is an entry without expiry, -2 one that expired since the read
+        return {
+            key: self.l1_timeout if ttl == -1 else min(ttl, self.l1_timeout)
+            for key, ttl in zip(keys, pipeline.execute()) if ttl != -2
+        }
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.l2.add(key, value, timeout, version)
+        if added:
+            self.l1.set(key, value, self._l1_timeout(timeout), version)
+        return added
+
+    def get(self, key, default=None, version=None):
+        sentinel = object()
+        value = self.l1.get(key, sentinel, version)
+        if value is sentinel:
+            value = self.l2.get(key, sentinel, version)
+            if value is sentinel:
+                return default
+            timeout = self._fill_timeouts([key], version).get(key)
+            if timeout:
+                self.l1.set(key, value, timeout, version)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version)
+        self.l1.set(key, value, self._l1_timeout(timeout), version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l1.touch(key, self._l1_timeout(timeout), version)
+        return self.l2.touch(key, timeout, version)
+
+    def delete(self, key, version=None):
+        self.l1.delete(key, version)
+        return self.l2.delete(key, version)
+
+    def get_many(self, keys, version=None):
+        found = self.l1.get_many(keys, version)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            from_l2 = self.l2.get_many(missing, version)
+            if from_l2:
+                by_timeout = {}
+                for key, timeout in self._fill_timeouts(list(from_l2), version).items():
+                    by_timeout.setdefault(timeout, {})[key] = from_l2[key]
+                for timeout, data in by_timeout.items():
+                    if timeout:
+                        self.l1.set_many(data, timeout, version)
+            found.update(from_l2)
+        return found
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout, version)
+        self.l1.set_many(data, self._l1_timeout(timeout), version)
+        return failed
+
+    def delete_many(self, keys, version=None):
+        self.l1.delete_many(keys, version)
+        self.l2.delete_many(keys, version)
+
+    def has_key(self, key, version=None):
+        return self.l1.has_key(key, version) or self.l2.has_key(key, version)
+
+    def incr(self, key, delta=1, version=None):
+        self.l1.delete(key, version)
+        return self.l2.incr(key, delta, version)
+
+    def clear(self):
+        self.l1.clear()
+        self.l2.clear()
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 import os
 from pathlib import Path
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -66,25 +67,22 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'blog',
     'django_ckeditor_5',
     'taggit',
-    'crispy_forms',
-    'hitcount',
-    'compressor',
-    'markdown',
-    'markdown_deux',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'django.middleware.cache.UpdateCacheMiddleware',
+    'blog.middleware.DependencyUpdateCacheMiddleware',
     'django.middleware.cache.FetchFromCacheMiddleware',
 ]
 
@@ -116,6 +114,20 @@ TEMPLATES = [
     },
 ]
 
+# Production template mode: templates come from the bundle written by
+# `manage.py compile_templates` during the build, behind the cached loader.
+# With DEBUG off locally, rerun it (or delete the bundle) after editing templates
+TEMPLATE_BUNDLE = os.path.join(BASE_DIR, 'templates.bundle.json')
+if not DEBUG:
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'pandastories.template_loaders.BundleLoader',
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 WSGI_APPLICATION = 'pandastories.wsgi.application'
 
 
@@ -192,6 +204,11 @@ if os.environ.get('SUPABASE_URL'):
         "default": {
             "BACKEND": "pandastories.storage_backends.SupabaseStorage",
         },
+        # Generated files replaced in place, such as the sitemaps
+        "sitemaps": {
+            "BACKEND": "pandastories.storage_backends.SupabaseStorage",
+            "OPTIONS": {"overwrite": True},
+        },
         "staticfiles": {
             "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
         },
@@ -203,6 +220,9 @@ else:
         "default": {
             "BACKEND": "django.core.files.storage.FileSystemStorage",
         },
+        "sitemaps": {
+            "BACKEND": "pandastories.storage_backends.OverwritingFileSystemStorage",
+        },
         "staticfiles": {
             "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
         },
@@ -212,21 +232,85 @@ else:
 MEDIA_ROOT = BASE_DIR / 'media'
 
 # Cache settings
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-        'TIMEOUT': 60 * 15,  # 15 minutes
-        'OPTIONS': {
-            'MAX_ENTRIES': 1000
-        }
+# CACHE_MODE picks the cache profile:
+#   local  - per-process LocMemCache (default without REDIS_URL)
+#   redis  - shared Redis/Valkey cache
+#   tiered - per-process L1 in front of the shared Redis L2 (default with REDIS_URL)
+REDIS_URL = os.environ.get('REDIS_URL')
+CACHE_MODE = os.environ.get('CACHE_MODE', 'tiered' if REDIS_URL else 'local')
+if CACHE_MODE in ('redis', 'tiered') and not REDIS_URL:
+    raise ImproperlyConfigured(f"CACHE_MODE={CACHE_MODE} needs REDIS_URL to be set")
+CACHE_COMPRESS_THRESHOLD = 4096  # Compress pickled values larger than this (bytes)
+
+LOCAL_CACHE = {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'unique-snowflake',
+    'TIMEOUT': 60 * 15,  # 15 minutes
+    'OPTIONS': {
+        'MAX_ENTRIES': 1000
+    }
+}
+
+SHARED_CACHE = {
+    'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+    'LOCATION': REDIS_URL,
+    'TIMEOUT': 60 * 15,  # 15 minutes
+    'KEY_PREFIX': 'pandastories',
+    # Bump CACHE_VERSION to start from an empty cache after incompatible changes
+    'VERSION': int(os.environ.get('CACHE_VERSION', 1)),
+    'OPTIONS': {
+        'serializer': 'pandastories.cache_backends.CompressedRedisSerializer',
+        # Connection pool settings
+        'max_connections': int(os.environ.get('REDIS_MAX_CONNECTIONS', 20)),
+        'socket_connect_timeout': 1,
+        'socket_timeout': 1,
+        'health_check_interval': 30,
     }
 }
 
+if CACHE_MODE == 'redis':
+    CACHES = {
+        'default': SHARED_CACHE,
+        'local': LOCAL_CACHE,
+    }
+elif CACHE_MODE == 'tiered':
+    CACHES = {
+        'default': {
+            'BACKEND': 'pandastories.cache_backends.TieredCache',
+            'OPTIONS': {
+                'L1': 'local',
+                'L2': 'shared',
+                'L1_TIMEOUT': 30,  # Max staleness of another process's changes
+            }
+        },
+        'local': LOCAL_CACHE,
+        'shared': SHARED_CACHE,
+    }
+else:
+    CACHES = {
+        'default': LOCAL_CACHE,
+    }
+
+# Cache used for state that must be consistent across processes
+# (dependency registry, locks, the shared view buffer)
+SHARED_CACHE_ALIAS = 'shared' if CACHE_MODE == 'tiered' else 'default'
+
+# Purges only reach every process when the cache is shared; with per-process
+# caches, other processes keep what they cached until it expires
+CACHE_PURGES_SHARED = CACHE_MODE in ('redis', 'tiered')
+CACHE_OBJECT_TIMEOUT = 60 * 60 * 24 if CACHE_PURGES_SHARED else 60 * 15  # Posts, sidebar
+CACHE_OBJECT_GRACE = 60 * 5  # Longest an expired post or sidebar is served while it's recomputed
+
+# Registry of cached entries per dependency, see blog.cache.register_dependencies
+CACHE_DEPENDENCY_TIMEOUT = 60 * 60 * 24 * 30  # Longest an entry can be purged after it's cached
+CACHE_DEPENDENCY_MAX_ENTRIES = 10000  # Entries kept per dependency between changes
+
 # Cache middleware settings
 CACHE_MIDDLEWARE_ALIAS = 'default'
-CACHE_MIDDLEWARE_SECONDS = 60 * 15  # 15 minutes
-CACHE_MIDDLEWARE_KEY_PREFIX = ''
+# Pages are purged on change by blog.signals
+CACHE_MIDDLEWARE_SECONDS = 60 * 60 * 6 if CACHE_PURGES_SHARED else 60 * 15
+# Browsers can't be purged, so they revalidate cached pages after this long
+CACHE_MIDDLEWARE_BROWSER_MAX_AGE = 60
 
 # Don't cache pages with session data or POST requests
 CACHE_MIDDLEWARE_ANONYMOUS_ONLY = True
@@ -235,6 +319,87 @@ CACHE_MIDDLEWARE_ANONYMOUS_ONLY = True
 CACHE_CONTROL_MAX_AGE = 60 * 15  # 15 minutes for most pages
 CACHE_CONTROL_PRIVATE = True  # Prevents caching by intermediate proxies
 
+# Anonymous article pages are rendered without per-visitor state and can be
+# cached by the CDN; see blog.cache.patch_edge_cache_control
+EDGE_CACHE_MAX_AGE = 60  # Browsers and the page cache
+EDGE_CACHE_S_MAXAGE = 60 * 10  # Shared caches
+EDGE_CACHE_STALE_WHILE_REVALIDATE = 60 * 60 * 24
+
+# Part of every validator from blog.conditional, so a deploy changes them all
+RELEASE_VERSION = os.environ.get('VERCEL_GIT_COMMIT_SHA', '')
+# Entries of the last-modified index live no longer than the pages built from them
+LAST_MODIFIED_TIMEOUT = CACHE_MIDDLEWARE_SECONDS
+# A deploy starts from an empty page cache, as it may change the markup
+CACHE_MIDDLEWARE_KEY_PREFIX = RELEASE_VERSION
+
+# Absolute URLs in files built outside a request, such as the sitemap
+SITE_URL = os.environ.get('SITE_URL') or (
+    f"https://{os.environ['VERCEL_PROJECT_PRODUCTION_URL']}"
+    if os.environ.get('VERCEL_PROJECT_PRODUCTION_URL') else 'http://localhost:8000'
+)
+
+# Sitemap files, prebuilt into the default storage by blog.sitemaps
+SITEMAP_STORAGE_PATH = 'sitemaps'
+SITEMAP_SHARD_SIZE = 50000  # Post ids per file, the most URLs a sitemap may hold
+SITEMAP_FALLBACK_TIMEOUT = 60 * 10  # Sections built for requests while their file can't be read
+
+# Static HTML of the public pages, written by `manage.py prerender` and
+# served by the host before falling back to Django (see vercel.json)
+PRERENDER_ROOT = os.environ.get('PRERENDER_ROOT', os.path.join(BASE_DIR, 'prerendered'))
+
+# Rebuilds of sitemaps, feeds, related posts and pre-rendered pages, queued
+# when posts change (see blog.jobs) and run by `manage.py process_rebuild_jobs`.
+# Where no worker runs, REBUILD_JOBS_INLINE runs them at the end of the
+# request that queued them instead, on by default on Vercel which has none.
+REBUILD_JOBS_INLINE = os.environ.get('REBUILD_JOBS_INLINE', str('VERCEL' in os.environ)) == 'True'
+REBUILD_JOB_BATCH_SIZE = 100
+REBUILD_JOB_LEASE = 300  # Seconds a worker holds the jobs it claimed
+REBUILD_JOB_RETRY_DELAY = 30  # Seconds, doubled on each failed attempt
+REBUILD_JOB_MAX_ATTEMPTS = 5
+
+# RSS, Atom and JSON feeds, see blog.feeds
+FEED_MAX_ITEMS = 20
+
+# {% cache_fragment %} blocks; keys change with the object's updated_at
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# Post view tracking
+# Hits are buffered ('memory' per process, or 'cache' for counters in the
+# shared cache) and written in batches by blog.tracking. The cache buffer is
+# only written by `manage.py flush_post_views`, run it every few minutes
+POST_VIEW_BUFFER = os.environ.get('POST_VIEW_BUFFER', 'memory')
+POST_VIEW_BUFFER_SIZE = 500  # Flush after this many distinct hits
+POST_VIEW_FLUSH_INTERVAL = 30  # ...or after this many seconds
+POST_VIEW_DEDUPE_DAYS = 30  # A visitor counts once per post in this window
+POST_VIEW_ROLLUP_LAG = 60 * 5  # Seconds raw views wait before they're rolled up
+
+# Search
+SEARCH_CONFIG = 'english'  # PostgreSQL text search configuration
+SEARCH_MAX_RESULTS = 500  # Upper bound on ranked results paginated per query
+SEARCH_INDEX_TTL = 60 * 5  # Max age of the in-process index used without PostgreSQL
+AUTOCOMPLETE_LIMIT = 8  # Suggestions returned per keystroke
+
+# Related posts
+RELATED_POSTS_LIMIT = 6  # Neighbours stored per post
+RELATED_POSTS_CATEGORY_WEIGHT = 0.3  # Score added for sharing the category
+RELATED_POSTS_RECENCY_WEIGHT = 0.2  # Score of a brand-new post, halved every half-life
+RELATED_POSTS_HALF_LIFE_DAYS = 180
+
+# Content similarity ("more like this"), built by `manage.py build_embeddings`
+EMBEDDINGS_PATH = os.environ.get('EMBEDDINGS_PATH', os.path.join(BASE_DIR, 'embeddings'))
+EMBEDDINGS_DIMENSIONS = 512  # Hashed TF-IDF features per post
+# Ranking used by blog.utils.recommend_posts: 'tags' or 'embeddings'
+RECOMMENDATION_SOURCE = os.environ.get('RECOMMENDATION_SOURCE', 'tags')
+
+# Warm a fresh process before its first request (see pandastories/warmup.py),
+# on by default on Vercel where every cold lambda would otherwise pay for it
+WARMUP_ON_START = os.environ.get('WARMUP_ON_START', str('VERCEL' in os.environ)) == 'True'
+WARMUP_STEPS = ['urls', 'templates', 'database', 'storage', 'caches']
+
+# Cold start: `manage.py importtime` fails when importing the WSGI app and
+# URLconf takes longer than this
+IMPORT_TIME_BUDGET_MS = 1000
+
 # Email settings
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # For development
 DEFAULT_FROM_EMAIL = 'noreply@PandaStories.com'
@@ -286,9 +451,6 @@ ACCOUNT_RATE_LIMITS = {
 #     'reset_password': 'blog.forms.CustomPasswordResetForm',
 # }
 
-# Crispy Forms
-CRISPY_TEMPLATE_PACK = 'bootstrap4'
-
 # Django CKEditor 5 configuration
 CKEDITOR_5_CONFIGS = {
     'default': {
@@ -371,14 +533,6 @@ DEBUG_TOOLBAR_CONFIG = {
 STATICFILES_FINDERS = [
     'django.contrib.staticfiles.finders.FileSystemFinder',
     'django.contrib.staticfiles.finders.AppDirectoriesFinder',
-    'compressor.finders.CompressorFinder',
-]
-
-# Django Compressor
-COMPRESS_ENABLED = True
-COMPRESS_CSS_FILTERS = [
-    'compressor.filters.css_default.CssAbsoluteFilter',
-    'compressor.filters.cssmin.rCSSMinFilter',
 ]
 
 # Jazzmin Settings
@@ -1,8 +1,9 @@
 import os
-from django.core.files.storage import Storage
+import tempfile
+from functools import cached_property
+from django.core.files.storage import FileSystemStorage, Storage
 from django.utils.deconstruct import deconstructible
 from django.core.files.base import ContentFile
-from supabase import create_client, Client
 from io import BytesIO
 import logging
 
@@ -13,21 +14,35 @@ logger = logging.getLogger(__name__)
 class SupabaseStorage(Storage):
     """Custom storage backend for Supabase Storage"""
     
-    def __init__(self):
+    def __init__(self, overwrite=False):
         self.supabase_url = os.environ.get('SUPABASE_URL')
         self.supabase_key = os.environ.get('SUPABASE_KEY')
         self.bucket_name = os.environ.get('SUPABASE_BUCKET', 'media')
-        
-        if self.supabase_url and self.supabase_key:
-            try:
-                self.client: Client = create_client(self.supabase_url, self.supabase_key)
-                logger.info(f"Supabase storage initialized for bucket: {self.bucket_name}")
-            except Exception as e:
-                logger.error(f"Failed to initialize Supabase client: {e}")
-                self.client = None
-        else:
+        # Save over an existing file instead of picking a new name; the
+        # upload upserts, so readers get the old or the new file, never none
+        self.overwrite = overwrite
+    
+    def get_available_name(self, name, max_length=None):
+        if self.overwrite:
+            return name
+        return super().get_available_name(name, max_length)
+    
+    @cached_property
+    def client(self):
+        """Supabase client, created on first use so the SDK isn't imported on cold start"""
+        if not (self.supabase_url and self.supabase_key):
             logger.warning("Supabase credentials not found, storage will not work")
-            self.client = None
+            return None
+        
+        from supabase import create_client
+        
+        try:
+            client = create_client(self.supabase_url, self.supabase_key)
+            logger.info(f"Supabase storage initialized for bucket: {self.bucket_name}")
+            return client
+        except Exception as e:
+            logger.error(f"Failed to initialize Supabase client: {e}")
+            return None
     
     def _save(self, name, content):
         """Save file to Supabase Storage"""
@@ -61,9 +76,14 @@ class SupabaseStorage(Storage):
     def _open(self, name, mode='rb'):
         """Retrieve file from Supabase Storage"""
         if not self.client:
-            raise ValueError("Supabase client not configured")
+            # Unreadable storage, which callers handle like any unreadable file
+            raise OSError("Supabase client not configured")
         
-        response = self.client.storage.from_(self.bucket_name).download(name)
+        try:
+            response = self.client.storage.from_(self.bucket_name).download(name)
+        except Exception as e:
+            # Callers expect the OSError a missing or unreadable file raises
+            raise OSError(f"Could not download {name} from Supabase: {e}") from e
         return BytesIO(response)
     
     def delete(self, name):
@@ -118,5 +138,35 @@ class SupabaseStorage(Storage):
             'pdf': 'application/pdf',
             'mp4': 'video/mp4',
             'mp3': 'audio/mpeg',
+            'xml': 'application/xml',
         }
         return content_types.get(ext, 'application/octet-stream')
+
+
+@deconstructible
+class OverwritingFileSystemStorage(FileSystemStorage):
+    """
+    File system storage that saves over an existing file instead of picking
+    a new name. The content goes to a temporary file in the same directory,
+    renamed over the old one, so readers never see a missing or partial file.
+    """
+    
+    def get_available_name(self, name, max_length=None):
+        return name
+    
+    def _save(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp, self.file_permissions_mode)
+            os.replace(tmp, full_path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return name
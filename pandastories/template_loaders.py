@@ -0,0 +1,44 @@
+"""
+Template loader backed by a bundle built with `manage.py compile_templates`.
+
+The bundle is one JSON file holding the source of every template the
+filesystem and app loaders can find, checked to compile at build time. It's
+read once per process, so the cached loader in front of it never touches the
+template directories, and a template missing from the bundle falls through
+to the next loader.
+"""
+import json
+
+from django.conf import settings
+from django.template import Origin, TemplateDoesNotExist
+from django.template.loaders.base import Loader as BaseLoader
+
+
+def read_bundle(path):
+    """Return {template name: source} from a bundle, or {} if it's missing."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)['templates']
+    except FileNotFoundError:
+        return {}
+
+
+class BundleLoader(BaseLoader):
+    def __init__(self, engine, path=None):
+        super().__init__(engine)
+        self.path = path or settings.TEMPLATE_BUNDLE
+        self.templates = read_bundle(self.path)
+
+    def get_template_sources(self, template_name):
+        if template_name in self.templates:
+            yield Origin(
+                name=f'{self.path}:{template_name}',
+                template_name=template_name,
+                loader=self,
+            )
+
+    def get_contents(self, origin):
+        try:
+            return self.templates[origin.template_name]
+        except KeyError:
+            raise TemplateDoesNotExist(origin)
@@ -9,15 +9,8 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
-from blog.sitemaps import PostSitemap, CategorySitemap
-from django.contrib.sitemaps.views import sitemap
 from blog import views
 
-sitemaps = {
-    'posts': PostSitemap,
-    'categories': CategorySitemap
-}
-
 urlpatterns = [
     # Admin
     path('admin/', admin.site.urls),
@@ -30,7 +23,8 @@ urlpatterns = [
     
     # Robots and sitemap
     path('robots.txt', views.robots_txt, name='robots_txt'),
-    path('sitemap.xml', sitemap, {'sitemaps': sitemaps}, name='django.contrib.sitemaps.views.sitemap'),
+    path('sitemap.xml', views.sitemap, name='sitemap'),
+    path('sitemap-<slug:section>.xml', views.sitemap, name='sitemap_section'),
 ]
 
 # Serve static and media files (works on Vercel)
@@ -0,0 +1,95 @@
+"""
+Warmup run by the WSGI/ASGI entry points while a fresh process starts.
+
+Without it the first request pays for everything Django does lazily:
+populating the URL resolver, compiling templates, connecting to the database,
+creating the storage client and filling empty caches. Each step is timed and
+logged so the cost of a cold start is visible in the function logs.
+"""
+import logging
+import os
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def warm_urls():
+    from django.urls import get_resolver
+
+    resolver = get_resolver()
+    resolver.url_patterns
+    # Builds the reverse lookup tables used by {% url %} and reverse()
+    resolver.reverse_dict
+
+
+def warm_templates():
+    """Compile every template under the template dirs into the cached loader."""
+    from django.template import TemplateSyntaxError
+    from django.template.loader import get_template
+
+    for directory in settings.TEMPLATES[0]['DIRS']:
+        for root, _, files in os.walk(directory):
+            for filename in files:
+                if not filename.endswith(('.html', '.txt', '.xml')):
+                    continue
+                name = os.path.relpath(os.path.join(root, filename), directory)
+                try:
+                    get_template(name)
+                except TemplateSyntaxError:
+                    logger.exception("Warmup could not compile template %s", name)
+
+
+def warm_database():
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+
+
+def warm_storage():
+    from django.core.files.storage import default_storage
+
+    # Instantiates the backend, and the Supabase client when it has one
+    getattr(default_storage, 'client', None)
+
+
+def warm_caches():
+    from blog.analytics import popular_posts
+    from blog.context_processors import sidebar_categories
+
+    sidebar_categories()
+    popular_posts()
+
+
+STEPS = {
+    'urls': warm_urls,
+    'templates': warm_templates,
+    'database': warm_database,
+    'storage': warm_storage,
+    'caches': warm_caches,
+}
+
+
+def warmup(steps=None):
+    """
+    Run the warmup ``steps`` (default: WARMUP_STEPS) and return their
+    timings in milliseconds. A failing step is logged and skipped, it
+    must never stop the process from serving.
+    """
+    timings = {}
+    for name in steps or settings.WARMUP_STEPS:
+        started = time.perf_counter()
+        try:
+            STEPS[name]()
+        except Exception:
+            logger.exception("Warmup step %s failed", name)
+        timings[name] = (time.perf_counter() - started) * 1000
+    logger.info(
+        "Warmup took %.0fms (%s)",
+        sum(timings.values()),
+        ', '.join(f'{name} {ms:.0f}ms' for name, ms in timings.items()),
+    )
+    return timings
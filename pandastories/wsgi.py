@@ -9,11 +9,16 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pandastories.settings')
 
 application = get_wsgi_application()
 
+if settings.WARMUP_ON_START:
+    from pandastories.warmup import warmup
+    warmup()
+
 # Vercel expects 'app' variable
 app = application
@@ -31,6 +31,29 @@ def main():
         print("ERROR: collectstatic failed!")
         sys.exit(1)
     
+    # Compile templates into the bundle loaded at startup
+    print("\n3. Compiling templates...")
+    if run_command("python manage.py compile_templates") != 0:
+        print("ERROR: template compilation failed!")
+        sys.exit(1)
+    
+    # Fill the related-posts index that post pages read, including for posts
+    # that existed before it did
+    print("\n4. Indexing related posts...")
+    if run_command("python manage.py rebuild_related_posts") != 0:
+        print("WARNING: Related posts indexing failed, posts may list the latest posts instead")
+    
+    # Prebuild the sitemap files served from storage
+    print("\n5. Building sitemaps...")
+    if run_command("python manage.py build_sitemaps") != 0:
+        print("WARNING: Sitemap build failed, sitemaps will be built per request")
+    
+    # Pre-render the public pages, served before falling back to Django
+    if os.environ.get('PRERENDER') == 'True':
+        print("\n6. Pre-rendering pages...")
+        if run_command("python manage.py prerender") != 0:
+            print("WARNING: Pre-rendering failed, pages will be served by Django")
+    
     # Verify static files were collected
     static_root = os.path.join(os.path.dirname(__file__), 'staticfiles')
     if os.path.exists(static_root):